@@ -32,8 +32,15 @@ SPARK_MAX_WORKERS = int(os.getenv('SPARK_MAX_WORKERS', 1))
 JDBC_NUMPARTITIONS = int(os.getenv('JDBC_NUMPARTITIONS', 200))
 SPARK_REPARTITION = int(os.getenv('SPARK_REPARTITION', 200))
 TARGET_RECORDS_PER_PARTITION = int(os.getenv('TARGET_RECORDS_PER_PARTITION', 5000))
+SPARK_COMPILED_ARTIFACT_CACHE_SIZE = int(os.getenv('SPARK_COMPILED_ARTIFACT_CACHE_SIZE', 32))
+SPARK_FUSED_TRANSFORMATIONS = os.getenv('SPARK_FUSED_TRANSFORMATIONS', 'false').lower() in ('1', 'true', 'yes')
+SPARK_XSLT_GATEWAY_POOL_SIZE = int(os.getenv('SPARK_XSLT_GATEWAY_POOL_SIZE', 4))
+SPARK_XSLT_GATEWAY_BATCH_SIZE = int(os.getenv('SPARK_XSLT_GATEWAY_BATCH_SIZE', 100))
 MONGO_READ_PARTITION_SIZE_MB = int(os.getenv('MONGO_READ_PARTITION_SIZE_MB', 4))
 
+# XML2kvp walker for indexing, 'xmltodict' or 'lxml', where field mapper configurations do not set `walker`
+XML2KVP_WALKER = os.getenv('XML2KVP_WALKER', 'xmltodict')
+
 # Apache Livy settings
 '''
 Combine uses Livy to issue spark statements.
@@ -50,6 +57,7 @@ LIVY_DEFAULT_SESSION_CONFIG = {
         'file://%s/core/spark/es.py' % COMBINE_INSTALL_PATH.rstrip('/'),
         'file://%s/core/spark/jobs.py' % COMBINE_INSTALL_PATH.rstrip('/'),
         'file://%s/core/spark/record_validation.py' % COMBINE_INSTALL_PATH.rstrip('/'),
+        'file://%s/core/spark/schemas.py' % COMBINE_INSTALL_PATH.rstrip('/'),
         'file://%s/core/spark/utils.py' % COMBINE_INSTALL_PATH.rstrip('/'),
         'file://%s/core/spark/console.py' % COMBINE_INSTALL_PATH.rstrip('/'),
         'file://%s/core/xml2kvp.py' % COMBINE_INSTALL_PATH.rstrip('/'),
@@ -72,6 +80,14 @@ WRITE_AVRO = bool(os.getenv('WRITE_AVRO', False))
 ES_HOST = os.getenv('ES_HOST', '127.0.0.1')
 INDEX_TO_ES = bool(os.getenv('INDEX_TO_ES', True))
 
+# ElasticSearch indexing from Spark, 'python' bulk requests per partition, or 'hadoop' for es-hadoop EsOutputFormat
+ES_INDEX_BACKEND = os.getenv('ES_INDEX_BACKEND', 'hadoop')
+ES_BULK_THREADS = int(os.getenv('ES_BULK_THREADS', 4))
+ES_BULK_MAX_DOCS = int(os.getenv('ES_BULK_MAX_DOCS', 500))
+ES_BULK_MAX_BYTES = int(os.getenv('ES_BULK_MAX_BYTES', 10485760))
+ES_BULK_MAX_RETRIES = int(os.getenv('ES_BULK_MAX_RETRIES', 5))
+ES_BULK_INITIAL_BACKOFF = float(os.getenv('ES_BULK_INITIAL_BACKOFF', 2))
+
 # ElasticSearch analysis
 CARDINALITY_PRECISION_THRESHOLD = int(os.getenv('CARDINALITY_PRECISION_THRESHOLD', 100))
 ONE_PER_DOC_OFFSET = float(os.getenv('ONE_PER_DOC_OFFSET', 0.05))
@@ -81,6 +97,9 @@ SERVICE_HUB_PREFIX = os.getenv('SERVICE_HUB_PREFIX', 'funcake--')
 
 # OAI Server
 OAI_RESPONSE_SIZE = int(os.getenv('OAI_RESPONSE_SIZE', 500))
+OAI_STREAM_RESPONSE = os.getenv('OAI_STREAM_RESPONSE', 'true').lower() in ('1', 'true', 'yes')
+OAI_RESPONSE_CACHE = os.getenv('OAI_RESPONSE_CACHE', 'false').lower() in ('1', 'true', 'yes')
+OAI_RESPONSE_CACHE_DIR = os.getenv('OAI_RESPONSE_CACHE_DIR', '%s/oai_cache' % BINARY_STORAGE.rstrip('/').split('file://')[-1])
 COMBINE_OAI_IDENTIFIER = os.getenv('COMBINE_OAI_IDENTIFIER', 'oai:funnel_cake')
 METADATA_PREFIXES = {
     'mods':{
@@ -138,6 +157,9 @@ ANALYSIS_JOBS_HIERARCHY = {
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
 
+# Export tabular data from Celery task with XML2kvp.xml_to_kvp_many(), without Spark
+EXPORT_TABULAR_DATA_LOCAL = os.getenv('EXPORT_TABULAR_DATA_LOCAL', 'false').lower() in ('1', 'true', 'yes')
+
 # StateIO Configurations
 '''
 Configurations used for exporting/importing "states" in Combine, including
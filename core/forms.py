@@ -28,7 +28,7 @@ class TransformationForm(ModelForm):
 
     class Meta:
         model = Transformation
-        fields = ['name', 'payload', 'transformation_type', 'use_as_include']
+        fields = ['name', 'payload', 'transformation_type', 'use_as_include', 'xslt_engine']
 
 
 class RITSForm(ModelForm):
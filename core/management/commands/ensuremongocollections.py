@@ -27,5 +27,9 @@ class Command(BaseCommand):
         logger.debug('ensuring indices for index_mapping_failures collection')
         IndexMappingFailure.ensure_indexes()
 
+        # PublishedRecord model
+        logger.debug('ensuring indices for published_record collection')
+        PublishedRecord.ensure_indexes()
+
         # return
         self.stdout.write(self.style.SUCCESS('Mongo collections and indices verified and/or created'))
@@ -0,0 +1,97 @@
+# generic imports
+import json
+import logging
+import time
+
+# django
+from django.core.management.base import BaseCommand, CommandError
+
+# import core
+from core.models import FieldMapper, Job
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    '''
+    Manage command to map a Job's Records with XML2kvp across all cores, without Spark,
+    e.g. to try a new field mapper configuration against a sample of Records
+    '''
+
+    help = 'Map Records of a Job with XML2kvp, writing JSON lines of mapped fields'
+
+    def add_arguments(self, parser):
+        parser.add_argument('job_id', type=int)
+        parser.add_argument(
+            '--field_mapper',
+            dest='field_mapper',
+            help='id of saved Field Mapper to use',
+            type=int
+        )
+        parser.add_argument(
+            '--fm_config_json',
+            dest='fm_config_json',
+            help='JSON of XML2kvp field mapper configurations, if not using a saved Field Mapper',
+            type=str
+        )
+        parser.add_argument(
+            '--limit',
+            dest='limit',
+            help='number of Records to map',
+            type=int,
+            default=0
+        )
+        parser.add_argument(
+            '--workers',
+            dest='workers',
+            help='number of processes, defaults to CPU count',
+            type=int
+        )
+        parser.add_argument(
+            '--chunk_size',
+            dest='chunk_size',
+            help='number of Records sent to a process at once',
+            type=int,
+            default=100
+        )
+        parser.add_argument(
+            '--output',
+            dest='output',
+            help='filepath to write JSON lines to, defaults to stdout',
+            type=str
+        )
+
+    def handle(self, *args, **options):
+
+        # get field mapper configurations
+        if options['field_mapper']:
+            fm_config = FieldMapper.objects.get(pk=options['field_mapper']).config
+        elif options['fm_config_json']:
+            fm_config = json.loads(options['fm_config_json'])
+        else:
+            fm_config = {}
+
+        # get Job records, mapped in order alongside record ids
+        try:
+            job = Job.objects.get(pk=options['job_id'])
+        except Job.DoesNotExist:
+            raise CommandError('Job %s does not exist' % options['job_id'])
+        mapped_records = job.map_records(fm_config, fields=['record_id'], limit=options['limit'],
+                                         workers=options['workers'], chunk_size=options['chunk_size'])
+
+        # write JSON lines
+        stime = time.time()
+        count = 0
+        output = open(options['output'], 'w') if options['output'] else self.stdout
+        try:
+            for record, kvp_dict in mapped_records:
+                kvp_dict['record_id'] = record['record_id']
+                output.write(json.dumps(kvp_dict) + '\n')
+                count += 1
+        finally:
+            if options['output']:
+                output.close()
+
+        logger.debug('mapped %s records in %s seconds', count, time.time() - stime)
+        self.stderr.write(self.style.SUCCESS('Mapped %s Records in %.2fs' % (count, time.time() - stime)))
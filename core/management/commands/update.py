@@ -197,7 +197,8 @@ class VersionUpdateHelper():
             self.v0_4__set_job_baseline_combine_version,
             self.v0_4__update_transform_job_details,
             self.v0_4__set_job_current_combine_version,
-            self.v0_7_1__fix_redis_version_mismatches
+            self.v0_7_1__fix_redis_version_mismatches,
+            self.v0_11__materialize_published_records
         ]
 
     def run_update_snippets(self):
@@ -321,3 +322,16 @@ class VersionUpdateHelper():
             # fire action
             results = sp.restart_process('celery')
             logger.debug(results)
+
+    def v0_11__materialize_published_records(self):
+        '''
+        Method to populate published_record collection from already published Jobs
+        '''
+
+        if PublishedRecord.objects.count() == 0:
+            logger.debug('v0_11__materialize_published_records: materializing published records')
+
+            PublishedRecord.ensure_indexes()
+            for job in Job.objects.filter(published=True):
+                logger.debug('materializing published records for Job: %s' % job)
+                PublishedRecord.publish_job(job)
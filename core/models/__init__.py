@@ -12,7 +12,7 @@ from .datatables import DTElasticFieldSearch, DTElasticGenericSearch
 from .oai import OAITransaction, CombineOAIClient
 from .openrefine import OpenRefineActionsClient
 from .organization import Organization
-from .publishing import PublishedRecords
+from .publishing import PublishedRecords, PublishedRecord
 from .record_group import RecordGroup
 from .rits import RITSClient
 from .stateio import StateIO, StateIOClient
@@ -10,6 +10,7 @@ from lxml import etree, isoschematron
 import requests
 import textwrap
 from types import ModuleType
+from urllib.parse import urljoin
 
 # pyjxslt
 import pyjxslt
@@ -21,7 +22,7 @@ from django.db import models
 # import xml2kvp
 from core.xml2kvp import XML2kvp
 from core.es import es_handle
-from core.spark.utils import PythonUDFRecord
+from core.spark.utils import PythonUDFRecord, XSLIncludeCache, compile_xslt, select_xslt_engine
 
 from elasticsearch_dsl import Search
 
@@ -33,6 +34,9 @@ LOGGER = logging.getLogger(__name__)
 # Set logging levels for 3rd party modules
 logging.getLogger("requests").setLevel(logging.WARNING)
 
+# XSLT namespace
+XSL_NS = 'http://www.w3.org/1999/XSL/Transform'
+
 
 
 class OAIEndpoint(models.Model):
@@ -100,6 +104,16 @@ class Transformation(models.Model):
     )
     filepath = models.TextField(max_length=1024, null=True, default=None, blank=True) # HiddenInput
     use_as_include = models.BooleanField(default=False)
+    xslt_engine = models.CharField(
+        max_length=255,
+        choices=[
+            ('gateway', 'pyjxslt gateway (Saxon, XSLT 2.0)'),
+            ('auto', 'Auto (lxml for XSLT 1.0, otherwise gateway)'),
+            ('lxml', 'lxml (in-process, XSLT 1.0)')
+        ],
+        default='gateway',
+        blank=True
+    )
 
 
     def __str__(self):
@@ -108,6 +122,15 @@ class Transformation(models.Model):
     def as_dict(self):
         return self.__dict__
 
+    def get_xslt_engine(self):
+
+        '''
+        Method to return XSLT engine used for this transformation, 'lxml' or 'gateway',
+        resolving 'auto' from the stylesheet, see core.spark.utils.select_xslt_engine()
+        '''
+
+        return select_xslt_engine(self.payload, self.xslt_engine or 'gateway')
+
     def transform_record(self, row):
 
         '''
@@ -146,6 +169,11 @@ class Transformation(models.Model):
             except Exception as err:
                 return str(err)
 
+            # transform in-process with lxml
+            if self.get_xslt_engine() == 'lxml':
+                xslt = compile_xslt(self.payload)
+                return str(xslt(etree.fromstring(row.document.encode('utf-8'))))
+
             # transform with pyjxslt gateway
             gateway = pyjxslt.Gateway(6767)
             gateway.add_transform('xslt_transform', self.payload)
@@ -261,9 +289,10 @@ class Transformation(models.Model):
     def _rewrite_xsl_http_includes(self):
 
         '''
-        Method to check XSL payloads for external HTTP includes,
-        if found, download and rewrite
+        Method to check XSL payloads for external HTTP includes and imports,
+        if found, download to content-addressed XSLIncludeCache and rewrite hrefs to cached files
 
+            - includes of downloaded stylesheets are downloaded and rewritten in turn
             - do not save self (instance), firing during pre-save signal
         '''
 
@@ -271,54 +300,66 @@ class Transformation(models.Model):
 
             LOGGER.debug('XSLT transformation, checking for external HTTP includes')
 
-            # rewrite flag
-            rewrite = False
-
-            # output dir
-            transformations_dir = '%s/transformations' % settings.BINARY_STORAGE.rstrip('/').split('file://')[-1]
-
             # parse payload
             xsl = etree.fromstring(self.payload.encode('utf-8'))
 
-            # handle empty, global namespace
-            _nsmap = xsl.nsmap.copy()
-            try:
-                _nsmap.pop(None)
-                _nsmap['global_ns'] = ns0
-            except:
-                pass
+            # rewrite if need be
+            if self._cache_xsl_http_includes(xsl, XSLIncludeCache()):
+                LOGGER.debug('rewriting XSL payload')
+                self.payload = etree.tostring(xsl, encoding='utf-8', xml_declaration=True).decode('utf-8')
 
-            # xpath query for xsl:include
-            includes = xsl.xpath('//xsl:include', namespaces=_nsmap)
 
-            # loop through includes and check for HTTP hrefs
-            for i in includes:
+    @classmethod
+    def _cache_xsl_http_includes(cls, xsl, include_cache, base_url=None, fetching=None):
 
-                # get href
-                href = i.attrib.get('href', False)
+        '''
+        Method to download HTTP xsl:include and xsl:import hrefs of parsed stylesheet to include cache,
+        rewriting hrefs to cached filepaths
 
-                # check for http
-                if href:
-                    if href.lower().startswith('http'):
+        Args:
+            xsl (lxml.etree._Element): parsed stylesheet, rewritten in place
+            include_cache (core.spark.utils.XSLIncludeCache): cache to write to
+            base_url (str): URL of stylesheet, if downloaded, for relative hrefs
+            fetching (set): URLs being downloaded, guarding against circular includes
 
-                        LOGGER.debug('external HTTP href found for xsl:include: %s', href)
+        Returns:
+            (bool): if any hrefs were rewritten
+        '''
 
-                        # set flag for rewrite
-                        rewrite = True
+        fetching = fetching or set()
+        rewrite = False
 
-                        # download and save to transformations directory on filesystem
-                        req = requests.get(href)
-                        filepath = '%s/%s' % (transformations_dir, href.split('/')[-1])
-                        with open(filepath, 'wb') as out_file:
-                            out_file.write(req.content)
+        for include in xsl.xpath('//xsl:include|//xsl:import', namespaces={'xsl':XSL_NS}):
 
-                        # rewrite href and add note
-                        i.attrib['href'] = filepath
+            # get absolute URL for href
+            href = include.attrib.get('href', '')
+            if base_url is not None:
+                href = urljoin(base_url, href)
+            if not href.lower().startswith('http') or href in fetching:
+                continue
 
-            # rewrite if need be
-            if rewrite:
-                LOGGER.debug('rewriting XSL payload')
-                self.payload = etree.tostring(xsl, encoding='utf-8', xml_declaration=True).decode('utf-8')
+            LOGGER.debug('external HTTP href found for %s: %s', include.tag, href)
+
+            # download, falling back to previously cached stylesheet if unavailable
+            try:
+                req = requests.get(href)
+                req.raise_for_status()
+                include_xsl = etree.fromstring(req.content)
+                cls._cache_xsl_http_includes(
+                    include_xsl, include_cache, base_url=href, fetching=fetching | {href})
+                filepath = include_cache.add(
+                    href, etree.tostring(include_xsl, encoding='utf-8', xml_declaration=True))
+            except Exception as err:
+                filepath = include_cache.lookup(href)
+                if filepath is None:
+                    raise
+                LOGGER.warning('could not download %s, using cached include: %s', href, err)
+
+            # rewrite href to cached file
+            include.attrib['href'] = filepath
+            rewrite = True
+
+        return rewrite
 
 
 
@@ -10,6 +10,7 @@ import difflib
 import hashlib
 import inspect
 import io
+from itertools import tee
 import json
 import logging
 import os
@@ -21,6 +22,10 @@ import urllib.parse
 import uuid
 import zipfile
 
+# bson imports
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
 # django imports
 from django.conf import settings
 from django.contrib.auth.models import User
@@ -55,7 +60,8 @@ LOGGER = logging.getLogger(__name__)
 # Set logging levels for 3rd party modules
 logging.getLogger("requests").setLevel(logging.WARNING)
 
-JOB_DETAILS_CACHES = ['detailed_record_count', 'validation_results', 'failure_count']
+JOB_DETAILS_CACHES = ['detailed_record_count', 'validation_results', 'failure_count', 'incremental_reuse',
+                      'es_indexing', 'validation_timings']
 
 
 class Job(models.Model):
@@ -114,6 +120,10 @@ class Job(models.Model):
             return "cancelled"
         return self.status
 
+    @property
+    def incremental_collection(self):
+        return 'record_incremental_%s' % self.id
+
     @property
     def job_type_display_class(self):
         cls_str = self.job_type_family()
@@ -375,7 +385,7 @@ class Job(models.Model):
 
         return None
 
-    def get_records(self, success=True):
+    def get_records(self, success=True, fields=None):
 
         '''
         Retrieve records associated with this job from Mongo
@@ -383,6 +393,8 @@ class Job(models.Model):
         Args:
             success (boolean): filter records on success column by this arg
                 - passing None will return unfiltered (success and failures)
+            fields (list, tuple): optional Record fields to load, e.g. ('record_id', 'publish_set_id'),
+                other fields -- notably document -- are not retrieved from Mongo
 
         Returns:
             (django.db.models.query.QuerySet)
@@ -394,9 +406,55 @@ class Job(models.Model):
         else:
             records = Record.objects(job_id=self.id, success=success)
 
+        # limit fields retrieved
+        if fields:
+            records = records.only(*fields)
+
         # return
         return records
 
+    def get_records_raw(self, success=True, fields=None):
+
+        '''
+        Retrieve records associated with this job from Mongo as raw BSON documents, see Record.find_raw()
+
+        Args:
+            success (boolean): filter records on success column by this arg
+                - passing None will return unfiltered (success and failures)
+            fields (list, tuple): optional Record fields to retrieve
+
+        Returns:
+            (pymongo.cursor.Cursor): of bson.raw_bson.RawBSONDocument
+        '''
+
+        query = {'job_id':self.id}
+        if success != None:
+            query['success'] = success
+        return Record.find_raw(query, fields=fields)
+
+    def map_records(self, fm_config=None, fields=None, limit=0, workers=None, chunk_size=100):
+
+        '''
+        Map successful records of this job with XML2kvp across processes, without Spark,
+        see XML2kvp.xml_to_kvp_many()
+
+        Args:
+            fm_config (dict): XML2kvp field mapper configurations
+            fields (list, tuple): optional Record fields to retrieve, in addition to document
+            limit (int): number of records to map, 0 for all
+            workers (int): number of processes, defaults to CPU count
+            chunk_size (int): number of records sent to a process at once
+
+        Returns:
+            (generator): of tuples (bson.raw_bson.RawBSONDocument, kvp dictionary)
+        '''
+
+        records = self.get_records_raw(fields=list(fields or []) + ['document']).limit(limit)
+        records, documents = tee(records)
+        kvp_dicts = XML2kvp.xml_to_kvp_many((record['document'] for record in documents),
+                                            workers=workers, chunk_size=chunk_size, **(fm_config or {}))
+        return zip(records, kvp_dicts)
+
     def get_errors(self):
 
         '''
@@ -1037,6 +1095,11 @@ class Job(models.Model):
         self.published = True
         self.save()
 
+        # update materialized published records
+        from core.models.publishing import PublishedRecords, PublishedRecord
+        PublishedRecord.publish_job(self)
+        PublishedRecords.bump_generation()
+
         # add to job details
         self.update_job_details({
             'published':{
@@ -1048,6 +1111,22 @@ class Job(models.Model):
         # return
         return True
 
+    def sync_published_records(self):
+
+        '''
+        Method to resync published Job after its Records were rewritten, e.g. by re-run or incremental harvest
+            - re-publishes with current publish_set_id, updating materialized published records
+            and bumping publish generation
+
+        Returns:
+            (bool): True if Job was published and resynced
+        '''
+
+        self.refresh_from_db()
+        if not self.published:
+            return False
+        return self.publish(publish_set_id=self.publish_set_id)
+
     def unpublish(self):
 
         '''
@@ -1071,6 +1150,11 @@ class Job(models.Model):
         self.published = False
         self.save()
 
+        # flag materialized published records as deleted
+        from core.models.publishing import PublishedRecords, PublishedRecord
+        PublishedRecord.unpublish_job(self)
+        PublishedRecords.bump_generation()
+
         # add to job details
         self.update_job_details({
             'published':{
@@ -1093,6 +1177,63 @@ class Job(models.Model):
         LOGGER.debug('removed records from db')
         return True
 
+    def stage_incremental_records(self, incremental=True):
+
+        '''
+        Method to prepare Records from previous run for incremental rerun, before records are removed from DB
+            - Transform Jobs: copies outputs with input fingerprint to self.incremental_collection, see
+            core.spark.jobs.TransformSpark.get_incremental_records(), if transformation hash recorded
+            - OAI Harvest Jobs: Records are kept in place, for records changed since the last harvest to be
+            merged by record_id, see core.spark.jobs.HarvestOAISpark.harvest_incremental()
+
+        Args:
+            incremental (bool): if False, mark Job as not incremental without staging
+
+        Returns:
+            (bool): True if records staged
+        '''
+
+        staged = False
+        if incremental and self.job_type == 'TransformJob':
+            staged = 'transformation_hash' in self.job_details_dict
+            if staged:
+                LOGGER.debug('staging records for incremental rerun')
+                mc_handle.combine.record.aggregate([
+                    {'$match':{'job_id':self.id}},
+                    {'$project':{'combine_id':1, 'input_fingerprint':1, 'document':1, 'error':1, 'success':1}},
+                    {'$out':self.incremental_collection}
+                ])
+        elif incremental and self.job_type == 'HarvestOAIJob':
+            staged = 'oai_last_harvest' in self.job_details_dict
+        self.update_job_details({'incremental':staged})
+        return staged
+
+    def get_changed_records(self, change=None):
+
+        '''
+        Method to return Records added, updated, or deleted by the last incremental OAI harvest
+
+        Args:
+            change (str): optionally filter to one of 'new', 'updated', 'deleted'
+
+        Returns:
+            (pymongo.cursor.Cursor): documents with record_id, combine_id, change, and harvest_datestamp
+        '''
+
+        query = {'job_id':self.id}
+        if change:
+            query['change'] = change
+        return mc_handle.combine.record_change.find(query)
+
+    def remove_record_changes_from_db(self):
+
+        '''
+        Method to remove changed records set of incremental OAI harvests from DB, fired as pre_delete signal
+        '''
+
+        mc_handle.combine.record_change.delete_many({'job_id':self.id})
+        return True
+
     def remove_validations_from_db(self):
 
         '''
@@ -2305,10 +2446,14 @@ class CombineJob():
         return combine_task
 
 
-    def rerun(self, rerun_downstream=True, set_gui_status=True):
+    def rerun(self, rerun_downstream=True, set_gui_status=True, incremental=False):
 
         '''
         Method to re-run job, and if flagged, all downstream Jobs in lineage
+
+        Args:
+            incremental (bool): if True, Transform Jobs reuse previous outputs for unchanged input Records,
+            and OAI Harvest Jobs harvest only records changed since the last harvest
         '''
 
         # get lineage
@@ -2334,18 +2479,26 @@ class CombineJob():
                 re_job.deleted = True
                 re_job.save()
 
-            # drop records
-            re_job.remove_records_from_db()
+            # optionally, prepare records of previous run for incremental rerun
+            staged = re_job.stage_incremental_records(incremental=incremental)
+
+            # incremental OAI harvests merge changed records into Job, else drop records and derived data
+            keep_records = staged and re_job.job_type == 'HarvestOAIJob'
+            if not keep_records:
+
+                # drop records
+                re_job.remove_records_from_db()
+                re_job.remove_record_changes_from_db()
 
-            # drop es index
-            re_job.drop_es_index()
+                # drop es index
+                re_job.drop_es_index()
 
-            # remove previously run validations
-            re_job.remove_validation_jobs()
-            re_job.remove_validations_from_db()
+                # remove previously run validations
+                re_job.remove_validation_jobs()
+                re_job.remove_validations_from_db()
 
-            # remove mapping failures
-            re_job.remove_mapping_failures_from_db()
+                # remove mapping failures
+                re_job.remove_mapping_failures_from_db()
 
             # remove from published subsets precounts
             re_job.remove_from_published_precounts()
@@ -2365,8 +2518,9 @@ class CombineJob():
             # get combine job
             re_cjob = CombineJob.get_combine_job(re_job.id)
 
-            # write Validation links
-            re_cjob.write_validation_job_links(re_cjob.job.job_details_dict)
+            # write Validation links, unless kept with Records
+            if not keep_records:
+                re_cjob.write_validation_job_links(re_cjob.job.job_details_dict)
 
             # remove old JobTrack instance
             JobTrack.objects.filter(job=self.job).delete()
@@ -3422,6 +3576,7 @@ class Record(mongoengine.Document):
     document = mongoengine.StringField()
     error = mongoengine.StringField()
     fingerprint = mongoengine.IntField()
+    input_fingerprint = mongoengine.IntField()
     job_id = mongoengine.IntField()
     oai_set = mongoengine.StringField()
     publish_set_id = mongoengine.StringField()
@@ -3443,6 +3598,7 @@ class Record(mongoengine.Document):
         'index_drop_dups': False,
         'indexes': [
             {'fields': ['job_id']},
+            {'fields': ['job_id', 'id']},
             {'fields': ['record_id']},
             {'fields': ['combine_id']},
             {'fields': ['success']},
@@ -3467,6 +3623,34 @@ class Record(mongoengine.Document):
         return self.id
 
 
+    @staticmethod
+    def find_raw(query, fields=None, batch_size=None):
+
+        '''
+        Query record collection with pymongo, returning raw BSON documents
+            - skips mongoengine object construction, and decodes fields only when accessed,
+            for bulk readers that iterate over many records
+
+        Args:
+            query (dict): pymongo filter
+            fields (list, tuple): optional Record fields to retrieve, 'id' maps to '_id'
+            batch_size (int): optional cursor batch size
+
+        Returns:
+            (pymongo.cursor.Cursor): of bson.raw_bson.RawBSONDocument
+        '''
+
+        projection = None
+        if fields:
+            projection = {('_id' if field == 'id' else field):1 for field in fields}
+        collection = mc_handle.combine.get_collection(
+            'record', codec_options=CodecOptions(document_class=RawBSONDocument))
+        cursor = collection.find(query, projection=projection)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        return cursor
+
+
     # define job property
     @property
     def job(self):
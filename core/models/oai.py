@@ -22,7 +22,8 @@ class OAITransaction(models.Model):
     '''
     Model to manage transactions from OAI server, including all requests and resumption tokens when needed.
 
-    Improvement: expire resumption tokens after some time.
+    NOTE: No longer written by the OAI server, which now issues stateless resumption tokens
+    (see core.oai.OAIResumptionToken).  Retained for previously recorded transactions.
     '''
 
     verb = models.CharField(max_length=255)
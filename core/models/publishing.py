@@ -2,11 +2,14 @@
 from __future__ import unicode_literals
 
 # generic imports
+import datetime
 import logging
 
+from pymongo import ReturnDocument, UpdateOne
+
 from core.models.elasticsearch import ESIndex
 from core.models.job import Job, Record
-from core.mongo import mc_handle
+from core.mongo import mongoengine, mc_handle, ObjectId
 
 # Get an instance of a LOGGER
 LOGGER = logging.getLogger(__name__)
@@ -18,8 +21,19 @@ class PublishedRecords():
 
     '''
     Model to manage the aggregation and retrieval of published records.
+        - PublishedRecords.get() returns a cached, process-wide snapshot, rebuilt when the
+        publish generation -- bumped when Jobs are published, unpublished, or subsets change -- moves
     '''
 
+    # Mongo misc document id for publish generation counter
+    generation_id = 'published_generation'
+
+    # cached snapshots, keyed by subset, as (generation, PublishedRecords)
+    _snapshots = {}
+
+    # cache hit/miss counters for this process
+    cache_stats = {'hits':0, 'misses':0}
+
     def __init__(self, subset=None):
 
         '''
@@ -95,6 +109,89 @@ class PublishedRecords():
         self.esi = ESIndex(['j%s' % job.id for job in self.published_jobs])
 
 
+    @classmethod
+    def get(cls, subset=None):
+
+        '''
+        Return cached PublishedRecords snapshot for subset, rebuilding if publish generation has moved
+            - snapshot is shared across requests and should be treated as read-only
+
+        Args:
+            subset (str): published subset slug
+
+        Returns:
+            (PublishedRecords)
+        '''
+
+        generation = cls.get_generation()
+        cached = cls._snapshots.get(subset)
+        if cached is not None and cached[0] == generation:
+            cls.cache_stats['hits'] += 1
+            return cached[1]
+
+        # build snapshot, using generation read prior to build
+        cls.cache_stats['misses'] += 1
+        LOGGER.debug('building published records snapshot for subset %s, generation %s', subset, generation)
+        published = cls(subset=subset)
+        cls._snapshots[subset] = (generation, published)
+        return published
+
+
+    @classmethod
+    def get_generation(cls):
+
+        '''
+        Return current publish generation from Mongo, 0 if never bumped
+        '''
+
+        return cls.get_generation_doc()['generation']
+
+
+    @classmethod
+    def get_generation_doc(cls):
+
+        '''
+        Return current publish generation and when it was last bumped (naive UTC), if ever
+
+        Returns:
+            (dict): {'generation':int, 'updated':datetime.datetime or None}
+        '''
+
+        generation_doc = mc_handle.combine.misc.find_one({'_id':cls.generation_id})
+        if generation_doc is None:
+            return {'generation':0, 'updated':None}
+        return {'generation':generation_doc['generation'], 'updated':generation_doc.get('updated')}
+
+
+    @classmethod
+    def bump_generation(cls):
+
+        '''
+        Increment publish generation, invalidating cached snapshots across processes
+        '''
+
+        generation_doc = mc_handle.combine.misc.find_one_and_update(
+            {'_id':cls.generation_id},
+            {'$inc':{'generation':1}, '$set':{'updated':datetime.datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER)
+        LOGGER.debug('publish generation bumped to %s', generation_doc['generation'])
+        return generation_doc['generation']
+
+
+    @classmethod
+    def get_cache_stats(cls):
+
+        '''
+        Return snapshot cache hit/miss counters for this process, with current generation
+        '''
+
+        stats = dict(cls.cache_stats)
+        stats['generation'] = cls.get_generation()
+        stats['cached_subsets'] = [subset for subset, cached in cls._snapshots.items() if cached[0] == stats['generation']]
+        return stats
+
+
     @property
     def records(self):
 
@@ -102,7 +199,56 @@ class PublishedRecords():
         Property to return QuerySet of all published records
         '''
 
-        return Record.objects.filter(job_id__in=[job.id for job in self.published_jobs])
+        return self.get_records()
+
+
+    def get_records(self, fields=None):
+
+        '''
+        Return QuerySet of all published records, optionally limited to fields
+
+        Args:
+            fields (list, tuple): optional Record fields to load, e.g. ('record_id', 'publish_set_id')
+
+        Returns:
+            (mongoengine.queryset.QuerySet)
+        '''
+
+        records = Record.objects.filter(job_id__in=[job.id for job in self.published_jobs])
+        if fields:
+            records = records.only(*fields)
+        return records
+
+
+    def get_records_raw(self, fields=None):
+
+        '''
+        Return all published records as raw BSON documents, see Record.find_raw()
+
+        Args:
+            fields (list, tuple): optional Record fields to retrieve
+
+        Returns:
+            (pymongo.cursor.Cursor): of bson.raw_bson.RawBSONDocument
+        '''
+
+        return Record.find_raw({'job_id':{'$in':[job.id for job in self.published_jobs]}}, fields=fields)
+
+
+    @property
+    def published_records(self):
+
+        '''
+        Property to return QuerySet of materialized published records, see PublishedRecord
+            - includes records flagged as deleted
+        '''
+
+        # all published records
+        if self.subset is None:
+            return PublishedRecord.objects()
+
+        # limit to published jobs of subset
+        return PublishedRecord.objects(job_id__in=[job.id for job in self.published_jobs])
 
 
     def get_record(self, record_id):
@@ -127,6 +273,23 @@ class PublishedRecords():
         return False
 
 
+    @staticmethod
+    def get_documents(db_ids):
+
+        '''
+        Return documents for Records by Mongo _id
+
+        Args:
+            db_ids (list): list of ObjectIds
+
+        Returns:
+            (dict): documents keyed by ObjectId
+        '''
+
+        records = Record.find_raw({'_id':{'$in':db_ids}}, fields=('document',))
+        return {record['_id']:record['document'] for record in records}
+
+
     def count_indexed_fields(self, force_recount=False):
 
         '''
@@ -211,6 +374,9 @@ class PublishedRecords():
             {'$set':update_dict}, upsert=True)
         LOGGER.debug(result.raw_result)
 
+        # invalidate cached snapshots
+        self.bump_generation()
+
 
     def add_publish_set_id_to_subset(self, publish_set_id):
 
@@ -236,6 +402,9 @@ class PublishedRecords():
             {'$set':update_dict}, upsert=True)
         LOGGER.debug(result.raw_result)
 
+        # invalidate cached snapshots
+        self.bump_generation()
+
         # remove pre-counts
         self.remove_subset_precounts()
 
@@ -247,3 +416,146 @@ class PublishedRecords():
         '''
 
         mc_handle.combine.misc.delete_one({'_id':'published_field_counts_%s' % self.subset})
+
+
+
+class PublishedRecord(mongoengine.Document):
+
+    '''
+    Materialized view of published Records, one document per OAI identifier (publish_set_id, record_id)
+        - maintained incrementally by Job.publish() and Job.unpublish(), and resynced after re-runs
+        - datestamp is set when a record is first published, or its fingerprint changes on re-publish
+        - records no longer published are retained, flagged as deleted, with a new datestamp
+        - db_id references the current Record in the record collection
+    '''
+
+    # fields
+    record_id = mongoengine.StringField()
+    publish_set_id = mongoengine.StringField()
+    job_id = mongoengine.IntField()
+    db_id = mongoengine.ObjectIdField()
+    fingerprint = mongoengine.IntField()
+    datestamp = mongoengine.DateTimeField()
+    deleted = mongoengine.BooleanField(default=False)
+    sync_id = mongoengine.ObjectIdField()
+
+    # meta
+    meta = {
+        'index_options': {},
+        'index_background': True,
+        'auto_create_index': True,
+        'index_drop_dups': False,
+        'indexes': [
+            {'fields': ['publish_set_id', 'datestamp', 'id']},
+            {'fields': ['datestamp', 'id']},
+            {'fields': ['record_id', 'publish_set_id']},
+            {'fields': ['job_id']},
+            {'fields': ['db_id']}
+        ]
+    }
+
+    # records per bulk write when syncing
+    sync_batch_size = 1000
+
+
+    def __str__(self):
+        return 'PublishedRecord: %s, record_id: %s, publish_set_id: %s' % (self.id, self.record_id, self.publish_set_id)
+
+
+    @staticmethod
+    def publish_job(job):
+
+        '''
+        Upsert all Records from Job, keyed on publish_set_id and record_id
+            - unchanged records, by fingerprint, keep their datestamp
+            - records previously published from this Job, but not seen, are flagged as deleted
+
+        Args:
+            job (core.models.Job): Job being published
+
+        Returns:
+            (dict): counts of records upserted, changed (new datestamp), and deleted
+        '''
+
+        now = datetime.datetime.utcnow()
+        sync_id = ObjectId()
+        publish_set_id = job.publish_set_id or ''
+        results = {'upserted':0, 'changed':0, 'deleted':0}
+
+        # loop through Job's records in batches
+        batch = []
+        records = job.get_records_raw(success=None, fields=('record_id', 'fingerprint'))
+        for record in records:
+            batch.append(record)
+            if len(batch) == PublishedRecord.sync_batch_size:
+                PublishedRecord._sync_batch(job, publish_set_id, batch, sync_id, now, results)
+                batch = []
+        if len(batch) > 0:
+            PublishedRecord._sync_batch(job, publish_set_id, batch, sync_id, now, results)
+
+        # flag records no longer published from this Job as deleted
+        result = mc_handle.combine.published_record.update_many(
+            {'job_id':job.id, 'sync_id':{'$ne':sync_id}, 'deleted':False},
+            {'$set':{'deleted':True, 'datestamp':now}})
+        results['deleted'] = result.modified_count
+
+        LOGGER.debug('published records for job #%s: %s', job.id, results)
+        return results
+
+
+    @staticmethod
+    def _sync_batch(job, publish_set_id, batch, sync_id, now, results):
+
+        '''
+        Write batch of records to published_record collection, updating datestamp only where changed
+        '''
+
+        # retrieve previously published state for batch
+        prior_records = {prior['record_id']:prior for prior in mc_handle.combine.published_record.find(
+            {'record_id':{'$in':[record['record_id'] for record in batch]}, 'publish_set_id':publish_set_id},
+            projection={'record_id':1, 'fingerprint':1, 'db_id':1, 'deleted':1})}
+
+        ops = []
+        for record in batch:
+            update = {
+                'job_id':job.id,
+                'db_id':record['_id'],
+                'fingerprint':record.get('fingerprint'),
+                'deleted':False,
+                'sync_id':sync_id
+            }
+
+            # new, undeleted, or modified records receive datestamp
+            prior = prior_records.get(record['record_id'])
+            if prior is None or prior.get('deleted') or prior.get('fingerprint') != record.get('fingerprint') or \
+                    (record.get('fingerprint') is None and prior.get('db_id') != record['_id']):
+                update['datestamp'] = now
+                results['changed'] += 1
+
+            ops.append(UpdateOne(
+                {'publish_set_id':publish_set_id, 'record_id':record['record_id']},
+                {'$set':update},
+                upsert=True))
+
+        result = mc_handle.combine.published_record.bulk_write(ops, ordered=False)
+        results['upserted'] += result.upserted_count
+
+
+    @staticmethod
+    def unpublish_job(job):
+
+        '''
+        Flag all published records from Job as deleted
+
+        Args:
+            job (core.models.Job): Job being unpublished
+
+        Returns:
+            (int): count of records flagged as deleted
+        '''
+
+        result = mc_handle.combine.published_record.update_many(
+            {'job_id':job.id, 'deleted':False},
+            {'$set':{'deleted':True, 'datestamp':datetime.datetime.utcnow()}})
+        LOGGER.debug('flagged %s published records as deleted for job #%s', result.modified_count, job.id)
+        return result.modified_count
@@ -20,6 +20,7 @@ from core.models.configurations import Transformation, ValidationScenario, DPLAB
 from core.models.job import Job, JobValidation
 from core.models.livy_spark import LivySession
 from core.models.organization import Organization
+from core.models.publishing import PublishedRecords, PublishedRecord
 from core.models.record_group import RecordGroup
 from core.models.stateio import StateIO
 from core.models.tasks import CombineBackgroundTask
@@ -166,6 +167,9 @@ def delete_job_pre_delete(sender, instance, **kwargs):
     # remove Records from Mongo
     instance.remove_records_from_db()
 
+    # remove changed records set of incremental OAI harvests from Mongo
+    instance.remove_record_changes_from_db()
+
     # remove Validations from Mongo
     instance.remove_validations_from_db()
 
@@ -178,6 +182,10 @@ def delete_job_pre_delete(sender, instance, **kwargs):
     # if Job published, remove pre-counts where necessary
     instance.remove_from_published_precounts()
 
+    # if Job published, flag published records as deleted
+    if instance.published:
+        PublishedRecord.unpublish_job(instance)
+
     # remove any temporary files
     instance.remove_temporary_files()
 
@@ -197,6 +205,10 @@ def delete_job_post_delete(sender, instance, **kwargs):
 
     LOGGER.debug('job %s was deleted successfully', instance)
 
+    # if Job was published, invalidate cached published snapshots
+    if instance.published:
+        PublishedRecords.bump_generation()
+
 
 @receiver(models.signals.pre_save, sender=Transformation)
 def save_transformation_to_disk(sender, instance, **kwargs):
@@ -222,7 +234,7 @@ def save_transformation_to_disk(sender, instance, **kwargs):
         except:
             LOGGER.debug('could not remove transformation file: %s', instance.filepath)
 
-    # fire transformation method to rewrite external HTTP includes for XSLT
+    # download external HTTP includes for XSLT to include cache, rewriting hrefs
     if instance.transformation_type == 'xslt':
         instance._rewrite_xsl_http_includes()
 
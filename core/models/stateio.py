@@ -1483,6 +1483,7 @@ class StateIOClient():
 
                 # insert subset to Mongo
                 mc_handle.combine.misc.insert_one(subset)
+                PublishedRecords.bump_generation()
 
                 # remove pre-count
                 mc_handle.combine.misc.delete_one({'_id':'published_field_counts_%s' % subset['name']})
@@ -1504,6 +1505,7 @@ class StateIOClient():
 
                     # insert subset to Mongo
                     mc_handle.combine.misc.insert_one(subset)
+                    PublishedRecords.bump_generation()
 
                     # remove pre-count
                     mc_handle.combine.misc.delete_one({'_id':'published_field_counts_%s' % subset['name']})
@@ -197,12 +197,13 @@ class CombineBackgroundTask(models.Model):
         self.save()
 
     @classmethod
-    def to_rerun_jobs(cls, job_ids):
+    def to_rerun_jobs(cls, job_ids, incremental=False):
         task = cls(
             name="Rerun Jobs Prep",
             task_type='rerun_jobs_prep',
             task_params_json=json.dumps({
-                'ordered_job_rerun_set': job_ids
+                'ordered_job_rerun_set': job_ids,
+                'incremental': incremental
             })
         )
         task.save()
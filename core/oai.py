@@ -1,21 +1,44 @@
 # python modules
+import base64
+import binascii
 import datetime
+import hashlib
 import json
 import logging
 from lxml import etree
+import os
+import re
+import shutil
+import tempfile
 import time
-import uuid
+from xml.sax.saxutils import escape
 
 # django settings
 from django.conf import settings
 from django.urls import reverse
 
 # import models
-from core.models import PublishedRecords, OAITransaction
+from core.models import PublishedRecords, PublishedRecord
+from core.mongo import mongoengine, ObjectId
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
+# leading XML declaration of stored documents, stripped when spliced into responses
+xml_declaration_regex = re.compile(r'^\ufeff?\s*<\?xml.*?\?>\s*', re.DOTALL)
+
+# placeholder comment written to the verb node where streamed records are spliced in
+STREAM_RECORDS_MARKER = 'stream_records'
+
+# full precision datestamp of last record, carried in resumption tokens
+DATESTAMP_KEYSET_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+# number of documents retrieved per query when including metadata
+DOCUMENT_BATCH_SIZE = 100
+
+# responseDate of cached responses, refreshed when served
+response_date_regex = re.compile(rb'<responseDate>[^<]*</responseDate>')
+
 # attempt to load metadataPrefix map from localSettings, otherwise provide default
 if hasattr(settings, 'METADATA_PREFIXES'):
     metadataPrefix_hash = settings.METADATA_PREFIXES
@@ -36,6 +59,33 @@ else:
     }
 
 
+def parse_datestamp(datestamp, until=False):
+    """
+    Parse OAI-PMH from/until datestamp, at either day or seconds granularity
+
+    Args:
+            datestamp (str): datestamp from request, e.g. 2019-01-01 or 2019-01-01T12:00:00Z
+            until (bool): If True, return exclusive upper bound, i.e. end of day or second
+
+    Returns:
+            (datetime.datetime)
+
+    Raises:
+            ValueError: if datestamp is not a valid OAI-PMH datestamp
+    """
+
+    for datestamp_format, granularity in [('%Y-%m-%dT%H:%M:%SZ', datetime.timedelta(seconds=1)),
+                                          ('%Y-%m-%d', datetime.timedelta(days=1))]:
+        try:
+            parsed = datetime.datetime.strptime(datestamp, datestamp_format)
+        except ValueError:
+            continue
+        if until:
+            return parsed + granularity
+        return parsed
+    raise ValueError('invalid datestamp: %s' % datestamp)
+
+
 class OAIProvider():
     """
     Class for scaffolding and building responses to OAI queries
@@ -44,11 +94,17 @@ class OAIProvider():
     easier to keep the HTTP request args to work with as a dictionary, and maintain the original OAI-PMH vocab.
     """
 
-    def __init__(self, args, subset=None):
+    def __init__(self, args, subset=None, stream=False):
 
         # set subset
         self.subset = subset
 
+        # if streaming, records are serialized as text when response is iterated, see stream_response()
+        self.stream = stream
+        self.stream_records = None
+        self.stream_include_metadata = False
+        self.resumptionToken_node = None
+
         # read args, route verb to verb handler
         self.verb_routes = {
             'GetRecord': self._GetRecord,
@@ -65,16 +121,21 @@ class OAIProvider():
             '%Y-%m-%dT%H:%M:%SZ')
         self.record_nodes = []
 
-        # published dataframe slice parameters
+        # published records keyset pagination parameters
         self.start = 0
         self.chunk_size = settings.OAI_RESPONSE_SIZE
+        self.last_id = None
+        self.last_datestamp = None
+        self.complete_list_size = None
+        self.from_datestamp = self.args.get('from', None)
+        self.until_datestamp = self.args.get('until', None)
         if 'set' in self.args.keys() and self.args['set'] != '':
             self.publish_set_id = self.args['set']
         else:
             self.publish_set_id = None
 
         # get instance of Published model
-        self.published = PublishedRecords(subset=self.subset)
+        self.published = PublishedRecords.get(subset=self.subset)
 
         # begin scaffolding
         self.scaffold()
@@ -138,6 +199,11 @@ class OAIProvider():
         """
         Retrieve record(s) from DB for response
 
+            - pages through materialized published records (see core.models.PublishedRecord) with a keyset
+            on datestamp and Mongo _id, such that each page is an indexed range scan regardless of how deep
+            into the harvest the request is
+            - applies set and from/until filters
+
         Args:
                 include_metadata (bool): If False, return only identifiers, if True, include record document as well
 
@@ -150,7 +216,7 @@ class OAIProvider():
         logger.debug("retrieving records for verb %s", self.args['verb'])
 
         # get records
-        records = self.published.records
+        records = self.published.published_records
 
         # if set present, filter by this set
         if self.publish_set_id:
@@ -158,77 +224,132 @@ class OAIProvider():
                          self.publish_set_id)
             records = records.filter(publish_set_id=self.publish_set_id)
 
-        # loop through rows, limited by current OAI transaction start / chunk
-
-        # count records before slice
-        records_count = records.count()
+        # apply from/until filters
+        if self.from_datestamp:
+            records = records.filter(datestamp__gte=parse_datestamp(self.from_datestamp))
+        if self.until_datestamp:
+            records = records.filter(datestamp__lt=parse_datestamp(self.until_datestamp, until=True))
+
+        # count records once per harvest, carried in resumption token thereafter
+        if self.complete_list_size is None:
+            self.complete_list_size = records.count()
+
+        # resume after datestamp and _id of last record returned
+        if self.last_id:
+            last_datestamp = datetime.datetime.strptime(self.last_datestamp, DATESTAMP_KEYSET_FORMAT)
+            records = records.filter(
+                mongoengine.Q(datestamp__gt=last_datestamp) |
+                mongoengine.Q(datestamp=last_datestamp, id__gt=ObjectId(self.last_id)))
+
+        # get page for iteration, with one extra record to determine if more remain
+        records = self._page_records(
+            records.order_by('datestamp', 'id').limit(self.chunk_size + 1), include_metadata=include_metadata)
+
+        # if streaming, defer iteration to stream_response()
+        if self.stream:
+            self.stream_records = records
+            self.stream_include_metadata = include_metadata
+            self.verb_node.append(etree.Comment(STREAM_RECORDS_MARKER))
+            return
 
-        # get slice for iteration
-        records = records[self.start:(self.start+self.chunk_size)]
         for record in records:
 
-            record = OAIRecord(
-                args=self.args,
-                record_id=record.record_id,
-                publish_set_id=record.publish_set_id,
-                document=record.document,
-                timestamp=self.request_timestamp_string
-            )
-
             # include full metadata in record
             if include_metadata:
                 record.include_metadata()
 
-            # append to record_nodes
+            # append to record_nodes and verb node
             self.record_nodes.append(record.oai_record_node)
-
-        # add to verb node
-        for oai_record_node in self.record_nodes:
-            self.verb_node.append(oai_record_node)
-
-        # finally, set resumption token
-        self.set_resumption_token(records, completeListSize=records_count)
+            self.verb_node.append(record.oai_record_node)
 
         # report
         record_nodes_num = len(self.record_nodes)
         logger.debug("%s record(s) returned in %s", record_nodes_num, (float(time.time()) - float(stime)))
 
-    def set_resumption_token(self, records, completeListSize=None):
+    def _page_records(self, records, include_metadata=False):
+        """
+        Generator of OAIRecord instances for a page of records, setting resumption token when exhausted
+
+            - documents are retrieved from the record collection in batches, if including metadata
+
+        Args:
+                records (mongoengine.queryset.QuerySet): ordered PublishedRecords, limited to chunk_size + 1
+                include_metadata (bool): If True, retrieve record documents
+
+        Returns:
+                (generator): OAIRecord instances
+        """
+
+        # extra record indicates more remain
+        records = list(records)
+        has_more = len(records) > self.chunk_size
+        records = records[:self.chunk_size]
+
+        for i in range(0, len(records), DOCUMENT_BATCH_SIZE):
+            batch = records[i:i + DOCUMENT_BATCH_SIZE]
+
+            # retrieve documents for batch
+            documents = {}
+            if include_metadata:
+                documents = PublishedRecords.get_documents([record.db_id for record in batch if not record.deleted])
+
+            for record in batch:
+                if include_metadata and not record.deleted and record.db_id not in documents:
+                    logger.debug('document not found for published record %s, skipping', record.id)
+                    continue
+
+                yield OAIRecord(
+                    args=self.args,
+                    record_id=record.record_id,
+                    publish_set_id=record.publish_set_id,
+                    document=documents.get(record.db_id),
+                    timestamp=record.datestamp.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                    deleted=record.deleted,
+                    build_node=not self.stream
+                )
+
+        # set token, or empty token if resumed and list complete
+        if has_more:
+            self.set_resumption_token(last_record=records[-1])
+        elif self.start > 0:
+            self.set_resumption_token(last_record=None)
+
+    def set_resumption_token(self, last_record=None):
         """
-        Set resumption tokens in DB under OAITransaction model
+        Set resumption token node for the next page of results
+
+            - token is stateless, see OAIResumptionToken
+            - if last_record is None, the list is complete and an empty token is written per OAI-PMH spec
 
         Args:
-                completeListSize (int): total number of records based on passed parameters
+                last_record (core.models.PublishedRecord): last record in this page
 
         Returns:
                 None
                         - sets attributes related to resumption tokens
         """
 
-        # set resumption token
-        if self.start + self.chunk_size < completeListSize:
-            # set token and slice parameters to DB
-            token = str(uuid.uuid4())
-            logger.debug('setting resumption token: %s', token)
-            oai_trans = OAITransaction(
+        # set resumption token node and attributes
+        self.resumptionToken_node = etree.Element('resumptionToken')
+        self.resumptionToken_node.attrib['completeListSize'] = str(
+            self.complete_list_size)
+        self.resumptionToken_node.attrib['cursor'] = str(self.start)
+
+        if last_record is not None:
+            token = OAIResumptionToken(
                 verb=self.args['verb'],
-                start=self.start + self.chunk_size,
-                chunk_size=self.chunk_size,
                 publish_set_id=self.publish_set_id,
-                token=token,
-                args=json.dumps(self.args)
-            )
-            oai_trans.save()
-
-            # set resumption token node and attributes
-            self.resumptionToken_node = etree.Element('resumptionToken')
-            self.resumptionToken_node.attrib['expirationDate'] = (self.request_timestamp + datetime.timedelta(0, 3600))\
-                .strftime('%Y-%m-%dT%H:%M:%SZ')
-            self.resumptionToken_node.attrib['completeListSize'] = str(
-                completeListSize)
-            self.resumptionToken_node.attrib['cursor'] = str(self.start)
+                last_id=str(last_record.id),
+                last_datestamp=last_record.datestamp.strftime(DATESTAMP_KEYSET_FORMAT),
+                from_datestamp=self.from_datestamp,
+                until_datestamp=self.until_datestamp,
+                cursor=self.start + self.chunk_size,
+                complete_list_size=self.complete_list_size
+            ).encode()
+            logger.debug('setting resumption token: %s', token)
             self.resumptionToken_node.text = token
-            self.verb_node.append(self.resumptionToken_node)
+
+        self.verb_node.append(self.resumptionToken_node)
 
     # convenience function to run all internal methods
     def generate_response(self):
@@ -253,31 +374,82 @@ class OAIProvider():
         # check for resumption token
         if 'resumptionToken' in self.args.keys():
 
-            # retrieve token params and alter args and search_params
-            ot_query = OAITransaction.objects.filter(
-                token=self.args['resumptionToken'])
-            if ot_query.count() == 1:
-                ot = ot_query.first()
+            # decode token params and alter args and keyset params
+            try:
+                token = OAIResumptionToken.decode(self.args['resumptionToken'])
+            except ValueError:
+                return self.raise_error('badResumptionToken',
+                                        'The resumptionToken %s is not valid' % self.args['resumptionToken'])
 
-                # set args and start and chunk_size
-                self.start = ot.start
-                self.chunk_size = ot.chunk_size
-                self.publish_set_id = ot.publish_set_id
+            if token.verb != self.args['verb']:
+                return self.raise_error('badResumptionToken',
+                                        'The resumptionToken %s was not issued for verb %s' % (
+                                            self.args['resumptionToken'], self.args['verb']))
+
+            # set args and keyset params
+            self.start = token.cursor
+            self.last_id = token.last_id
+            self.last_datestamp = token.last_datestamp
+            self.complete_list_size = token.complete_list_size
+            self.publish_set_id = token.publish_set_id
+            self.from_datestamp = token.from_datestamp
+            self.until_datestamp = token.until_datestamp
+            if self.publish_set_id:
+                self.args['set'] = self.publish_set_id
 
-                logger.debug(
-                    'following resumption token, altering dataframe slice params:')
-                logger.debug(
-                    [self.start, self.chunk_size, self.publish_set_id])
+            logger.debug(
+                'following resumption token, altering keyset params:')
+            logger.debug(
+                [self.start, self.last_id, self.last_datestamp, self.publish_set_id])
 
-            # raise error
-            else:
-                return self.raise_error('badResumptionToken',
-                                        'The resumptionToken %s is not found' % self.args['resumptionToken'])
+        # check from/until
+        for arg, datestamp in [('from', self.from_datestamp), ('until', self.until_datestamp)]:
+            if datestamp:
+                try:
+                    parse_datestamp(datestamp)
+                except ValueError:
+                    return self.raise_error('badArgument',
+                                            'The %s argument %s is not a valid datestamp' % (arg, datestamp))
 
         # fire verb reponse building
         self.verb_routes[self.args['verb']]()
         return self.serialize()
 
+    def stream_response(self):
+        """
+        Returns OAI response as generator of XML chunks
+
+            - response scaffold is built and serialized with lxml, while records are serialized as text
+            around their stored document string as the generator is consumed, such that page size does
+            not drive memory or parsing
+
+        Args:
+                None
+
+        Returns:
+                (generator): XML response chunks as bytes
+        """
+
+        self.stream = True
+        response = self.generate_response()
+        marker = ('<!--%s-->' % STREAM_RECORDS_MARKER).encode('utf-8')
+
+        # verb did not stream records, return whole
+        if self.stream_records is None or marker not in response:
+            yield response
+            return
+
+        # split scaffold on marker, and stream records between
+        prefix, suffix = response.split(marker, 1)
+        yield prefix
+        for record in self.stream_records:
+            yield record.serialize(include_metadata=self.stream_include_metadata).encode('utf-8')
+
+        # resumption token is set once records are exhausted
+        if self.resumptionToken_node is not None:
+            yield etree.tostring(self.resumptionToken_node)
+        yield suffix
+
     def raise_error(self, error_code, error_msg):
         """
         Returns error as XML, OAI response
@@ -341,12 +513,19 @@ class OAIProvider():
         # if single record found
         if single_record:
 
+            # get datestamp from published record
+            published_record = PublishedRecord.objects(db_id=single_record.id).first()
+            if published_record:
+                timestamp = published_record.datestamp.strftime('%Y-%m-%dT%H:%M:%SZ')
+            else:
+                timestamp = self.request_timestamp_string
+
             # open as OAIRecord
             record = OAIRecord(
                 args=self.args,
                 record_id=single_record.record_id,
                 document=single_record.document,
-                timestamp=self.request_timestamp_string
+                timestamp=timestamp
             )
 
             # include metadata
@@ -521,22 +700,208 @@ class OAIProvider():
             self.verb_node.append(set_node)
 
 
+class OAIResumptionToken():
+    """
+    Stateless resumption token for paging through published records
+
+    Token carries everything needed to build the next page -- the verb, set and from/until filters,
+    datestamp and Mongo _id of the last record returned, cursor, and completeListSize from the first page --
+    encoded as urlsafe base64 JSON, such that no server side state is required between requests.
+    """
+
+    def __init__(self, verb=None, publish_set_id=None, last_id=None, last_datestamp=None, from_datestamp=None,
+                 until_datestamp=None, cursor=0, complete_list_size=None):
+
+        self.verb = verb
+        self.publish_set_id = publish_set_id
+        self.last_id = last_id
+        self.last_datestamp = last_datestamp
+        self.from_datestamp = from_datestamp
+        self.until_datestamp = until_datestamp
+        self.cursor = cursor
+        self.complete_list_size = complete_list_size
+
+    def encode(self):
+        """
+        Encode token as string for resumptionToken node
+
+        Returns:
+                (str): encoded token
+        """
+
+        token_json = json.dumps({
+            'verb': self.verb,
+            'set': self.publish_set_id,
+            'last_id': self.last_id,
+            'last_datestamp': self.last_datestamp,
+            'from': self.from_datestamp,
+            'until': self.until_datestamp,
+            'cursor': self.cursor,
+            'size': self.complete_list_size
+        }, separators=(',', ':'), sort_keys=True)
+        return base64.urlsafe_b64encode(token_json.encode('utf-8')).decode('utf-8').rstrip('=')
+
+    @staticmethod
+    def decode(token):
+        """
+        Decode token string as issued by OAIResumptionToken.encode()
+
+        Args:
+                token (str): encoded token
+
+        Returns:
+                (OAIResumptionToken)
+
+        Raises:
+                ValueError: if token cannot be decoded
+        """
+
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            token_dict = json.loads(base64.urlsafe_b64decode(padded.encode('utf-8')).decode('utf-8'))
+            if token_dict['last_id'] is not None and not ObjectId.is_valid(token_dict['last_id']):
+                raise ValueError('invalid last_id: %s' % token_dict['last_id'])
+            if token_dict['last_datestamp'] is not None:
+                datetime.datetime.strptime(token_dict['last_datestamp'], DATESTAMP_KEYSET_FORMAT)
+            return OAIResumptionToken(
+                verb=token_dict['verb'],
+                publish_set_id=token_dict['set'],
+                last_id=token_dict['last_id'],
+                last_datestamp=token_dict['last_datestamp'],
+                from_datestamp=token_dict['from'],
+                until_datestamp=token_dict['until'],
+                cursor=int(token_dict['cursor']),
+                complete_list_size=int(token_dict['size'])
+            )
+        except (binascii.Error, UnicodeDecodeError, KeyError, TypeError, ValueError) as err:
+            raise ValueError('could not decode resumption token: %s' % str(err))
+
+
+def oai_etag(args, subset=None, generation=0):
+    """
+    Return weak ETag for OAI request, derived from publish generation and request arguments
+
+    Args:
+            args (django.http.QueryDict): request GET parameters
+            subset (str): published subset slug
+            generation (int): publish generation, see PublishedRecords.get_generation()
+
+    Returns:
+            (str): weak ETag
+    """
+
+    return 'W/"%s"' % oai_request_key(args, subset=subset, generation=generation)
+
+
+def oai_request_key(args, subset=None, generation=0):
+    """
+    Return hash of OAI request arguments, subset, publish generation, and settings that shape the response
+    """
+
+    key = json.dumps([
+        generation,
+        subset,
+        sorted((k, sorted(v)) for k, v in args.lists()),
+        settings.COMBINE_OAI_IDENTIFIER,
+        settings.OAI_RESPONSE_SIZE
+    ], separators=(',', ':'))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class OAIResponseCache():
+    """
+    On-disk cache of rendered OAI responses, limited to first pages
+        - requests with resumptionToken, from, until, or for GetRecord are not cached
+        - responses are written under a directory per publish generation, and directories
+        for previous generations are removed when the first response of a new generation is written
+    """
+
+    cacheable_verbs = ['Identify', 'ListMetadataFormats', 'ListSets', 'ListIdentifiers', 'ListRecords']
+
+    def __init__(self, args, subset=None, generation=0, cache_dir=None):
+
+        self.args = args
+        self.generation = generation
+        self.cache_dir = cache_dir or settings.OAI_RESPONSE_CACHE_DIR
+        self.generation_dir = os.path.join(self.cache_dir, str(generation))
+        self.path = os.path.join(self.generation_dir, '%s.xml' % oai_request_key(
+            args, subset=subset, generation=generation))
+
+    @property
+    def cacheable(self):
+        """
+        Boolean if request is a first page that may be cached
+        """
+
+        return self.args.get('verb') in self.cacheable_verbs and \
+            not any(arg in self.args for arg in ['resumptionToken', 'from', 'until'])
+
+    def get(self):
+        """
+        Return cached response with current responseDate, or None if not cached
+
+        Returns:
+                (bytes)
+        """
+
+        try:
+            with open(self.path, 'rb') as cached:
+                content = cached.read()
+        except (IOError, OSError):
+            return None
+        response_date = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%SZ')
+        return response_date_regex.sub(
+            ('<responseDate>%s</responseDate>' % response_date).encode('utf-8'), content, count=1)
+
+    def set(self, content):
+        """
+        Write response to cache, removing cached responses from previous generations
+
+        Args:
+                content (bytes): rendered response
+        """
+
+        try:
+            if not os.path.isdir(self.generation_dir):
+                os.makedirs(self.generation_dir, exist_ok=True)
+                self.remove_stale()
+            handle, temp_path = tempfile.mkstemp(dir=self.generation_dir, suffix='.tmp')
+            with os.fdopen(handle, 'wb') as temp_file:
+                temp_file.write(content)
+            os.replace(temp_path, self.path)
+        except (IOError, OSError) as err:
+            logger.warning('could not write OAI response cache %s: %s', self.path, str(err))
+
+    def remove_stale(self):
+        """
+        Remove cached responses from other publish generations
+        """
+
+        for name in os.listdir(self.cache_dir):
+            if name != str(self.generation):
+                logger.debug('removing stale OAI response cache for generation %s', name)
+                shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+
+
 class OAIRecord():
     """
     Initialize OAIRecord with pid and args
     """
 
-    def __init__(self, args=None, record_id=None, publish_set_id=None, document=None, timestamp=None):
+    def __init__(self, args=None, record_id=None, publish_set_id=None, document=None, timestamp=None, deleted=False,
+                 build_node=True):
 
         self.args = args
         self.record_id = record_id
         self.publish_set_id = publish_set_id
         self.document = document
         self.timestamp = timestamp
+        self.deleted = deleted
         self.oai_record_node = None
 
-        # build record node
-        self.init_record_node()
+        # build record node, skipped if only serializing as text
+        if build_node:
+            self.init_record_node()
 
     def _construct_oai_identifier(self):
         """
@@ -567,6 +932,8 @@ class OAIRecord():
 
         # header node
         header_node = etree.Element('header')
+        if self.deleted:
+            header_node.attrib['status'] = 'deleted'
 
         # identifier
         identifier_node = etree.Element('identifier')
@@ -597,7 +964,40 @@ class OAIRecord():
                         sets self.oai_record_node
         """
 
+        # deleted records have no metadata
+        if self.deleted:
+            return
+
         # metadate node
         metadata_node = etree.Element('metadata')
         metadata_node.append(etree.fromstring(self.document.encode('utf-8')))
         self.oai_record_node.append(metadata_node)
+
+    def serialize(self, include_metadata=False):
+        """
+        Method to serialize record as string, without parsing record.document
+
+            - header is written as text, equivalent to init_record_node()
+            - XML declaration is stripped from record.document, which is then included as text
+            - falls back to parsing with lxml if anything other than the root element would remain
+
+        Args:
+                include_metadata (bool): If True, include record document in metadata node
+
+        Returns:
+                (str): serialized record node
+        """
+
+        header = '<header%s><identifier>%s</identifier><datestamp>%s</datestamp>' % (
+            ' status="deleted"' if self.deleted else '', escape(self._construct_oai_identifier()),
+            escape(self.timestamp))
+        if 'set' in self.args.keys():
+            header += '<setSpec>%s</setSpec>' % escape(self.args['set'])
+        header += '</header>'
+        if not include_metadata or self.deleted:
+            return '<record>%s</record>' % header
+
+        document = xml_declaration_regex.sub('', self.document, count=1)
+        if not document.startswith('<') or document.startswith(('<!', '<?')):
+            document = etree.tostring(etree.fromstring(self.document.encode('utf-8')), encoding='unicode')
+        return '<record>%s<metadata>%s</metadata></record>' % (header, document.rstrip())
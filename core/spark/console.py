@@ -22,7 +22,7 @@ if not hasattr(django, 'apps'):
 from django.conf import settings
 
 # import from core
-from core.models import CombineBackgroundTask
+from core.models import CombineBackgroundTask, Job
 
 # import XML2kvp from uploaded instance
 try:
@@ -112,8 +112,9 @@ def export_records_as_xml(spark, ct_id):
         rdd_to_write = rdd_to_write.repartition(
             math.ceil(rdd_to_write.count() / settings.TARGET_RECORDS_PER_PARTITION))
 
-        # convert to DataFrame and write to s3 as parquet
-        rdd_to_write.toDF().write.mode('overwrite').parquet(
+        # convert to DataFrame, with schema of selected columns, and write to s3 as parquet
+        spark.createDataFrame(rdd_to_write, schema=n_dfs[0].select(col_set).schema)\
+            .write.mode('overwrite').parquet(
         's3a://%s/%s' % (ct.task_params['s3_bucket'], ct.task_params['s3_key']))
 
     # write to disk
@@ -339,36 +340,38 @@ def _convert_xml_to_kvp(batch_rdd, fm_config):
         kvp_batch_rdd (RDD): RDD of JSONlines
     """
 
-    def kvp_writer_udf(row, fm_config):
+    def kvp_writer_partition(rows, fm_config):
 
         """
-        Converts XML to kvpjson
+        Converts XML to kvpjson, reusing one handler per partition
         """
 
         # get handler, that includes defaults
         xml2kvp_defaults = XML2kvp(**fm_config)
 
-        # convert XML to kvp
-        xml2kvp_handler = XML2kvp.xml_to_kvp(
-            row.document, return_handler=True, handler=xml2kvp_defaults)
+        for row in rows:
 
-        # loop through and convert lists/tuples to multivalue_delim
-        for k, v in xml2kvp_handler.kvp_dict.items():
-            if type(v) in [list, tuple]:
-                xml2kvp_handler.kvp_dict[k] = xml2kvp_handler.multivalue_delim.join(
-                    v)
+            # convert XML to kvp
+            xml2kvp_handler = XML2kvp.xml_to_kvp(
+                row.document, return_handler=True, handler=xml2kvp_defaults)
 
-        # mixin other row attributes to kvp_dict
-        xml2kvp_handler.kvp_dict.update({
-                'record_id': row.record_id,
-                'combine_id': row.combine_id
-        })
+            # loop through and convert lists/tuples to multivalue_delim
+            for k, v in xml2kvp_handler.kvp_dict.items():
+                if type(v) in [list, tuple]:
+                    xml2kvp_handler.kvp_dict[k] = xml2kvp_handler.multivalue_delim.join(
+                        v)
+
+            # mixin other row attributes to kvp_dict
+            xml2kvp_handler.kvp_dict.update({
+                    'record_id': row.record_id,
+                    'combine_id': row.combine_id
+            })
 
-        # return JSON line
-        return json.dumps(xml2kvp_handler.kvp_dict)
+            # yield JSON line
+            yield json.dumps(xml2kvp_handler.kvp_dict)
 
-    # run UDF
-    return batch_rdd.map(lambda row: kvp_writer_udf(row, fm_config))
+    # run per partition
+    return batch_rdd.mapPartitions(lambda rows: kvp_writer_partition(rows, fm_config))
 
 
 def _write_tabular_json(spark, kvp_batch_rdd, base_path, folder_name, fm_config):
@@ -442,6 +445,32 @@ def get_job_as_df(spark, job_id, remove_id=False):
     return mdf
 
 
+def get_job_mapped_fields(job_id, fm_config=None, limit=0, workers=None):
+
+    """
+    Convenience method to map records of Job with XML2kvp across cores of the driver, without a Spark job,
+    e.g. to try field mapper configurations against a sample of records, see Job.map_records()
+
+    Args:
+        job_id (int): Job id
+        fm_config (dict): XML2kvp field mapper configurations
+        limit (int): number of records to map, 0 for all
+        workers (int): number of processes, defaults to CPU count
+
+    Returns:
+        (generator): kvp dictionaries, with record_id and combine_id
+    """
+
+    job = Job.objects.get(pk=int(job_id))
+    for record, kvp_dict in job.map_records(fm_config, fields=['record_id', 'combine_id'], limit=limit,
+                                            workers=workers):
+        kvp_dict.update({
+            'record_id': record.get('record_id'),
+            'combine_id': record.get('combine_id')
+        })
+        yield kvp_dict
+
+
 def get_job_es(spark,
                job_id=None,
                indices=None,
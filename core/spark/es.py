@@ -1,14 +1,16 @@
 # imports
 import django
 from elasticsearch import Elasticsearch
+from elasticsearch import helpers as es_helpers
+from itertools import islice
 import json
 import os
 import re
 import sys
+import time
 
-# import Row from pyspark
+# import from pyspark
 try:
-    from pyspark.sql import Row
     from pyspark.sql.types import StringType, IntegerType
     from pyspark.sql.functions import udf, lit
 except:
@@ -30,6 +32,12 @@ try:
 except:
     from xml2kvp import XML2kvp
 
+# import schemas
+try:
+    from core.spark.schemas import mapping_failure_schema
+except:
+    from schemas import mapping_failure_schema
+
 
 class ESIndex():
 
@@ -90,11 +98,11 @@ class ESIndex():
         if not failures_rdd.isEmpty():
             logger.info('###ES 3 -- writing indexing failures')
 
-            failures_df = failures_rdd.map(lambda row: Row(
-                db_id=row[1]['db_id'],
-                record_id=row[1]['record_id'],
-                mapping_error=row[1]['mapping_error']
-            )).toDF()
+            failures_df = spark.createDataFrame(failures_rdd.map(lambda row: (
+                row[1]['db_id'],
+                row[1]['record_id'],
+                row[1]['mapping_error']
+            )), schema=mapping_failure_schema)
 
             # add job_id as column
             failures_df = failures_df.withColumn('job_id', lit(job.id))
@@ -154,8 +162,37 @@ class ESIndex():
             # create index
             es_handle_temp.indices.create(index_name)
 
-        # index to ES
-        logger.info('###ES 5 -- writing to ES')
+        # index to ES with bulk requests from python
+        if getattr(settings, 'ES_INDEX_BACKEND', 'hadoop') == 'python':
+            logger.info('###ES 5 -- writing to ES with bulk requests')
+            es_indexing = ESIndex.bulk_index_rdd(to_index_rdd, index_name)
+            logger.info('###ES 5 -- %s' % json.dumps(es_indexing))
+            job.update_job_details({'es_indexing': es_indexing})
+
+        # index to ES with es-hadoop
+        else:
+            logger.info('###ES 5 -- writing to ES')
+            ESIndex.hadoop_index_rdd(to_index_rdd, index_name)
+
+        # refresh index
+        es_handle_temp.indices.refresh(index_name)
+
+        # return
+        return to_index_rdd
+
+    @staticmethod
+    def hadoop_index_rdd(to_index_rdd, index_name):
+        """
+        Method to index mapped records with es-hadoop EsOutputFormat
+
+        Args:
+                to_index_rdd (RDD): ('success', kvp dictionary) tuples from XML2kvpMapper
+                index_name (str): ES index
+
+        Returns:
+                None
+        """
+
         to_index_rdd.saveAsNewAPIHadoopFile(
             path='-',
             outputFormatClass="org.elasticsearch.hadoop.mr.EsOutputFormat",
@@ -170,11 +207,127 @@ class ESIndex():
             }
         )
 
-        # refresh index
-        es_handle_temp.indices.refresh(index_name)
+    @staticmethod
+    def bulk_index_rdd(to_index_rdd, index_name):
+        """
+        Method to index mapped records with elasticsearch.helpers.parallel_bulk, per partition
 
-        # return
-        return to_index_rdd
+        Args:
+                to_index_rdd (RDD): ('success', kvp dictionary) tuples from XML2kvpMapper
+                index_name (str): ES index
+
+        Returns:
+                (dict): indexing metrics, summed across partitions, with range of partition throughput
+        """
+
+        # read bulk configurations on driver
+        es_host = settings.ES_HOST
+        bulk_config = {
+            'thread_count': getattr(settings, 'ES_BULK_THREADS', 4),
+            'chunk_size': getattr(settings, 'ES_BULK_MAX_DOCS', 500),
+            'max_chunk_bytes': getattr(settings, 'ES_BULK_MAX_BYTES', 10485760),
+            'max_retries': getattr(settings, 'ES_BULK_MAX_RETRIES', 5),
+            'initial_backoff': getattr(settings, 'ES_BULK_INITIAL_BACKOFF', 2)
+        }
+
+        def es_bulk_pt_udf(pt):
+
+            # init client once per partition
+            es_handle = Elasticsearch(hosts=[es_host], timeout=60)
+            yield ESIndex.bulk_index_partition(es_handle, pt, index_name, **bulk_config)
+
+        partition_metrics = to_index_rdd.mapPartitions(es_bulk_pt_udf).collect()
+
+        # sum partitions
+        es_indexing = {'backend': 'python', 'partitions': len(partition_metrics)}
+        for k in ['docs', 'bytes', 'retries', 'failed']:
+            es_indexing[k] = sum([metrics[k] for metrics in partition_metrics])
+        es_indexing['errors'] = [error for metrics in partition_metrics for error in metrics['errors']][:10]
+
+        # range of partition throughput
+        docs_per_second = sorted([metrics['docs_per_second'] for metrics in partition_metrics if metrics['docs'] > 0])
+        if docs_per_second:
+            es_indexing['partition_docs_per_second'] = {
+                'min': docs_per_second[0],
+                'median': docs_per_second[len(docs_per_second) // 2],
+                'max': docs_per_second[-1]
+            }
+
+        return es_indexing
+
+    @staticmethod
+    def bulk_index_partition(es_handle, rows, index_name, thread_count=4, chunk_size=500, max_chunk_bytes=10485760,
+                             max_retries=5, initial_backoff=2):
+        """
+        Method to index mapped records from one partition with elasticsearch.helpers.parallel_bulk
+            - documents read in batches of thread_count * chunk_size, sent as bulk requests of up to chunk_size
+            documents or max_chunk_bytes, thread_count requests at a time
+            - documents, or whole requests, rejected with 429 are retried with exponential backoff
+            - temp_id is used as document id and, with __class__, excluded from documents, as with es-hadoop
+
+        Args:
+                es_handle (elasticsearch.Elasticsearch): client
+                rows (iterable): ('success', kvp dictionary) tuples from XML2kvpMapper
+                index_name (str): ES index
+                thread_count (int): concurrent bulk requests
+                chunk_size (int): maximum documents per bulk request
+                max_chunk_bytes (int): maximum bytes per bulk request
+                max_retries (int): times to retry documents rejected with 429
+                initial_backoff (int, float): seconds to wait before first retry, doubled for each after
+
+        Returns:
+                (dict): indexing metrics
+        """
+
+        metrics = {'docs': 0, 'bytes': 0, 'retries': 0, 'failed': 0, 'errors': []}
+        stime = time.time()
+
+        rows = iter(rows)
+        while True:
+
+            # prepare batch of actions, serializing documents once
+            actions = []
+            for row in islice(rows, thread_count * chunk_size):
+                source = json.dumps({k: v for k, v in row[1].items() if k not in ['temp_id', '__class__']})
+                metrics['bytes'] += len(source)
+                actions.append({
+                    '_index': index_name,
+                    '_type': '_doc',
+                    '_id': row[1]['temp_id'],
+                    '_source': source
+                })
+            if not actions:
+                break
+
+            # send, retrying actions rejected with 429
+            attempt = 0
+            while actions:
+                retry = []
+                results = es_helpers.parallel_bulk(es_handle, actions, thread_count=thread_count,
+                                                   chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes,
+                                                   raise_on_error=False, raise_on_exception=False)
+                for (ok, info), action in zip(results, actions):
+                    if ok:
+                        metrics['docs'] += 1
+                        continue
+                    info = list(info.values())[0]
+                    if info.get('status') == 429 and attempt < max_retries:
+                        retry.append(action)
+                    else:
+                        metrics['failed'] += 1
+                        if len(metrics['errors']) < 10:
+                            metrics['errors'].append({'_id': action['_id'], 'status': info.get('status'),
+                                                      'error': str(info.get('error'))[:500]})
+                if retry:
+                    time.sleep(initial_backoff * 2 ** attempt)
+                    attempt += 1
+                    metrics['retries'] += len(retry)
+                actions = retry
+
+        seconds = time.time() - stime
+        metrics['seconds'] = round(seconds, 3)
+        metrics['docs_per_second'] = round(metrics['docs'] / seconds, 1) if seconds > 0 else 0.0
+        return metrics
 
     @staticmethod
     def copy_es_index(
@@ -286,6 +439,16 @@ class XML2kvpMapper(BaseMapper):
 
         self.field_mapper_config = field_mapper_config
 
+        # compile mapping plan once, handler reused for each record mapped
+        self.handler = None
+        self.plan_error = None
+        try:
+            plan_config = dict(field_mapper_config or {})
+            plan_config.setdefault('walker', getattr(settings, 'XML2KVP_WALKER', 'xmltodict'))
+            self.handler = XML2kvp.compile_plan(**plan_config)
+        except Exception as e:
+            self.plan_error = e
+
     def map_record(self,
                    record_string=None,
                    db_id=None,
@@ -313,12 +476,12 @@ class XML2kvpMapper(BaseMapper):
 
         try:
 
-            # prepare literals
-            if 'add_literals' not in self.field_mapper_config.keys():
-                self.field_mapper_config['add_literals'] = {}
+            # invalid configurations fail each record
+            if self.plan_error is not None:
+                raise self.plan_error
 
-            # add literals
-            self.field_mapper_config['add_literals'].update({
+            # map with XML2kvp, mixing in per record literals
+            kvp_dict = XML2kvp.xml_to_kvp(record_string, handler=self.handler, literals={
 
                 # add temporary id field
                 'temp_id': db_id,
@@ -340,10 +503,6 @@ class XML2kvpMapper(BaseMapper):
 
             })
 
-            # map with XML2kvp
-            kvp_dict = XML2kvp.xml_to_kvp(
-                record_string, **self.field_mapper_config)
-
             return (
                 'success',
                 kvp_dict
@@ -1,8 +1,10 @@
 # imports
 import ast
+from collections import OrderedDict
 import datetime
 import django
 from elasticsearch import Elasticsearch
+from elasticsearch import helpers as es_helpers
 import hashlib
 from itertools import groupby
 import json
@@ -13,23 +15,40 @@ import polling
 import re
 import sys
 import textwrap
+import time
 from types import ModuleType
 import uuid
+import zlib
 
 # pyjxslt
 import pyjxslt
 
+# bson
+from bson import ObjectId
+
+# pymongo
+from pymongo import DeleteOne, InsertOne, UpdateOne
+
 # import from core.spark
 try:
     from es import ESIndex
-    from utils import PythonUDFRecord, refresh_django_db_connection, df_union_all
+    from utils import PythonUDFRecord, refresh_django_db_connection, df_union_all, compiled_artifacts, \
+        load_python_module, write_field_updates, compile_xslt, XSLTGatewayPool, LatencyHistogram, \
+        LatencyHistogramParam, iter_batches, harvest_oai_deltas
     from record_validation import ValidationScenarioSpark
+    from schemas import combine_record_schema, harvested_record_schema, transformed_record_schema, \
+        es_id_schema, id_json_schema, dpla_isshownat_schema
     from console import get_job_as_df, get_job_es
     from xml2kvp import XML2kvp
 except:
     from core.spark.es import ESIndex
-    from core.spark.utils import PythonUDFRecord, refresh_django_db_connection, df_union_all
+    from core.spark.utils import PythonUDFRecord, refresh_django_db_connection, df_union_all, \
+        compiled_artifacts, load_python_module, write_field_updates, compile_xslt, XSLTGatewayPool, \
+        LatencyHistogram, LatencyHistogramParam, iter_batches, harvest_oai_deltas, canonical_document, \
+        xsl_include_hashes
     from core.spark.record_validation import ValidationScenarioSpark
+    from core.spark.schemas import combine_record_schema, harvested_record_schema, transformed_record_schema, \
+        es_id_schema, id_json_schema, dpla_isshownat_schema
     from core.spark.console import get_job_as_df, get_job_es
     from core.xml2kvp import XML2kvp
 
@@ -39,6 +58,7 @@ from pyspark.sql.types import StringType, StructField, StructType, BooleanType,
 import pyspark.sql.functions as pyspark_sql_functions
 from pyspark.sql.functions import udf, lit, crc32
 from pyspark.sql.window import Window
+from pyspark import StorageLevel
 
 # pylint: disable=wrong-import-position
 # check for registered apps signifying readiness, if not, run django.setup() to run as standalone
@@ -54,6 +74,7 @@ from django.db import connection, transaction
 # import select models from Core
 from core.models import CombineJob, Job, JobInput, JobTrack, Transformation, PublishedRecords, \
     RecordIdentifierTransformation, RecordValidation, DPLABulkDataDownload
+from core.mongo import mc_handle
 
 # pylint: disable=no-else-return
 # TODO: pylint disable
@@ -77,22 +98,8 @@ class CombineRecordSchema():
     """
 
     def __init__(self):
-        # schema for Combine records
-        self.schema = StructType([
-            StructField('combine_id', StringType(), True),
-            StructField('record_id', StringType(), True),
-            StructField('document', StringType(), True),
-            StructField('error', StringType(), True),
-            StructField('unique', BooleanType(), True),
-            StructField('job_id', IntegerType(), False),
-            StructField('oai_set', StringType(), True),
-            StructField('success', BooleanType(), False),
-            StructField('fingerprint', IntegerType(), False),
-            StructField('transformed', BooleanType(), False),
-            StructField('valid', BooleanType(), False),
-            StructField('dbdm', BooleanType(), False)
-        ]
-        )
+        # schema for Combine records, see schemas.combine_record_schema
+        self.schema = combine_record_schema
 
         # fields
         self.field_names = [
@@ -157,6 +164,10 @@ class CombineSparkJob():
                 self.logger.info('job params flagged for unpublishing')
                 self.job.unpublish()
 
+        # else, resync published records of published Job, e.g. after re-run or incremental harvest
+        elif self.job.sync_published_records():
+            self.logger.info('resynced published records')
+
         # finally, update finish_timestamp of job_track instance
         self.job_track.finish_timestamp = datetime.datetime.now()
         self.job_track.save()
@@ -347,7 +358,8 @@ class CombineSparkJob():
                      records_df=None,
                      write_avro=settings.WRITE_AVRO,
                      index_records=settings.INDEX_TO_ES,
-                     assign_combine_id=False):
+                     assign_combine_id=False,
+                     extra_columns=None):
         """
         Method to index records to DB and trigger indexing to ElasticSearch (ES)
 
@@ -356,6 +368,7 @@ class CombineSparkJob():
                 write_avro (bool): boolean to write avro files to disk after DB indexing
                 index_records (bool): boolean to index to ES
                 assign_combine_id (bool): if True, establish `combine_id` column and populate with UUID
+                extra_columns (list): columns written to DB in addition to CombineRecordSchema, not to avro
 
         Returns:
                 None
@@ -364,12 +377,10 @@ class CombineSparkJob():
                         - writes to DB, writes to avro files
         """
 
-        # assign combine ID
+        # assign combine ID, as UUID generated natively by Spark
         if assign_combine_id:
-            combine_id_udf = udf(lambda record_id: str(
-                uuid.uuid4()), StringType())
             records_df = records_df.withColumn(
-                'combine_id', combine_id_udf(records_df.record_id))
+                'combine_id', pyspark_sql_functions.expr('uuid()'))
 
         # run record identifier transformation scenario if provided
         records_df = self.run_rits(records_df)
@@ -388,13 +399,15 @@ class CombineSparkJob():
         records_df = records_df.withColumn(
             'dbdm', pyspark_sql_functions.lit(False))
 
-        # ensure columns to avro and DB
-        records_df_combine_cols = records_df.select(
-            CombineRecordSchema().field_names)
+        # ensure columns to avro and DB, minting Mongo ObjectIds, and persist for post-write stages
+        extra_columns = extra_columns or []
+        records_df_combine_cols = self.mint_db_ids(records_df.select(
+            CombineRecordSchema().field_names + extra_columns))
+        records_df_combine_cols.persist(StorageLevel.MEMORY_AND_DISK)
 
         # write avro, coalescing for output
         if write_avro:
-            records_df_combine_cols.coalesce(settings.SPARK_REPARTITION)\
+            records_df_combine_cols.drop('_id', *extra_columns).coalesce(settings.SPARK_REPARTITION)\
                 .write.format("com.databricks.spark.avro").save(self.job.job_output)
 
         # write records to MongoDB
@@ -405,43 +418,14 @@ class CombineSparkJob():
             .option("database", "combine")\
             .option("collection", "record").save()
 
-        # check if anything written to DB to continue, else abort
-        if self.job.get_records().count() > 0:
-
-            # read rows from Mongo with minted ID for future stages
-            pipeline = json.dumps(
-                {'$match': {'job_id': self.job.id, 'success': True}})
-            db_records = self.spark.read.format("com.mongodb.spark.sql.DefaultSource")\
-                .option("uri", "mongodb://%s" % settings.MONGO_HOST)\
-                .option("database", "combine")\
-                .option("collection", "record")\
-                .option("partitioner", "MongoSamplePartitioner")\
-                .option("spark.mongodb.input.partitionerOptions.partitionSizeMB", settings.MONGO_READ_PARTITION_SIZE_MB)\
-                .option("pipeline", pipeline).load()
-
-            # index to ElasticSearch
-            self.update_jobGroup('Indexing to ElasticSearch')
-            if index_records and settings.INDEX_TO_ES:
-                es_rdd = ESIndex.index_job_to_es_spark(
-                    self.spark,
-                    job=self.job,
-                    records_df=db_records,
-                    field_mapper_config=self.job_details['field_mapper_config']
-                )
+        # successful records, with minted ID, for future stages
+        db_records = records_df_combine_cols.filter(records_df_combine_cols.success == True)
 
-            # run Validation Scenarios
-            if 'validation_scenarios' in self.job_details.keys():
-                self.update_jobGroup('Running Validation Scenarios')
-                vs = ValidationScenarioSpark(
-                    spark=self.spark,
-                    job=self.job,
-                    records_df=db_records,
-                    validation_scenarios=self.job_details['validation_scenarios']
-                )
-                vs.run_record_validation_scenarios()
+        # check if anything written to DB to continue, else abort
+        if len(db_records.head(1)) > 0:
 
-            # handle DPLA Bulk Data matching, rewriting/updating records where match is found
-            self.dpla_bulk_data_compare(db_records, es_rdd)
+            # index, validate, and match records
+            self.process_saved_records(db_records, index_records=index_records)
 
             # return
             return db_records
@@ -449,6 +433,73 @@ class CombineSparkJob():
         else:
             raise Exception("No successful records written to disk for Job: %s" % self.job.name)
 
+    def process_saved_records(self, db_records, index_records=settings.INDEX_TO_ES):
+        """
+        Method to index to ElasticSearch, run Validation Scenarios, and DPLA Bulk Data match records written to DB
+
+        Args:
+                db_records (pyspark.sql.DataFrame): successful records with `_id` column, see mint_db_ids()
+                index_records (bool): boolean to index to ES
+        """
+
+        # index to ElasticSearch
+        self.update_jobGroup('Indexing to ElasticSearch')
+        es_rdd = None
+        if index_records and settings.INDEX_TO_ES:
+            es_rdd = ESIndex.index_job_to_es_spark(
+                self.spark,
+                job=self.job,
+                records_df=db_records,
+                field_mapper_config=self.job_details['field_mapper_config']
+            )
+
+        # run Validation Scenarios
+        if 'validation_scenarios' in self.job_details.keys():
+            self.update_jobGroup('Running Validation Scenarios')
+            vs = ValidationScenarioSpark(
+                spark=self.spark,
+                job=self.job,
+                records_df=db_records,
+                validation_scenarios=self.job_details['validation_scenarios']
+            )
+            vs.run_record_validation_scenarios()
+
+        # handle DPLA Bulk Data matching, rewriting/updating records where match is found
+        self.dpla_bulk_data_compare(db_records, es_rdd)
+
+    def mint_db_ids(self, records_df):
+        """
+        Method to add `_id` column of client generated Mongo ObjectIds
+                - written by the Mongo Spark connector as the record's ObjectId, such that
+                post-write stages may use the DataFrame rather than reading records back from DB
+                - ObjectIds are the time records are saved, followed by 8 bytes of an md5 hash of Job id,
+                the record's values, and its ordinal among records with identical values, e.g. from Merge
+                inputs derived from the same Job, such that each record has its own id, and partitions
+                recomputed after the write mint the ids written to DB
+                - records with identical values are interchangeable, so ordinals need no stable order
+
+        Args:
+                records_df (pyspark.sql.DataFrame): records without `_id` column
+
+        Returns:
+                (pyspark.sql.DataFrame): records with `_id` column, as struct with `oid`
+        """
+
+        columns = records_df.columns
+
+        # hash record values, numbering identical records
+        records_df = records_df.withColumn('_row_hash', pyspark_sql_functions.md5(
+            pyspark_sql_functions.to_json(pyspark_sql_functions.struct(*columns))))
+        records_df = records_df.withColumn('_row_ordinal', pyspark_sql_functions.row_number().over(
+            Window.partitionBy('record_id', '_row_hash').orderBy('_row_hash')))
+
+        # timestamp, as hex, and hash of Job id, record values and ordinal
+        oid = pyspark_sql_functions.concat(
+            lit('%08x' % int(time.time())),
+            pyspark_sql_functions.substring(pyspark_sql_functions.md5(pyspark_sql_functions.concat_ws(
+                ':', lit(str(self.job.id)), records_df._row_hash, records_df._row_ordinal.cast('string'))), 1, 16))
+        return records_df.select(pyspark_sql_functions.struct(oid.alias('oid')).alias('_id'), *columns)
+
     def record_input_filters(self, filtered_df, input_filters=None):
         """
         Method to apply filters to input Records
@@ -572,7 +623,7 @@ class CombineSparkJob():
                 "es.nodes.wan.only": "true",
                 "es.query": input_es_query_valve,
                 "es.read.field.exclude": "*"})
-        es_df = es_rdd.map(lambda row: (row[0], )).toDF()
+        es_df = self.spark.createDataFrame(es_rdd.map(lambda row: (row[0], )), schema=es_id_schema)
 
         # perform join on ES documents
         filtered_df = filtered_df.join(
@@ -590,8 +641,7 @@ class CombineSparkJob():
                 2) 'python' - Python Code Snippets
                 3) 'xpath' - XPath expression
 
-        Each are handled differently, but all strive to return a dataframe (records_df),
-        with the `record_id` column modified.
+        Each are handled by RITSEngine, returning a dataframe (records_df), with the `record_id` column modified.
 
         Args:
                 records_df (pyspark.sql.DataFrame): records as pyspark DataFrame
@@ -611,153 +661,8 @@ class CombineSparkJob():
             rits = RecordIdentifierTransformation.objects.get(
                 pk=int(rits_id))
 
-            # handle regex
-            if rits.transformation_type == 'regex':
-
-                # define udf function for python transformation
-                def regex_record_id_trans_udf(row, match, replace, trans_target):
-
-                    try:
-
-                        # use python's re module to perform regex
-                        if trans_target == 'record_id':
-                            trans_result = re.sub(
-                                match, replace, row.record_id)
-                        if trans_target == 'document':
-                            trans_result = re.sub(match, replace, row.document)
-
-                        # run transformation
-                        success = True
-                        error = row.error
-
-                    except Exception as e:
-                        trans_result = str(e)
-                        error = 'record_id transformation failure'
-                        success = False
-
-                    # return Row
-                    return Row(
-                        combine_id=row.combine_id,
-                        record_id=trans_result,
-                        document=row.document,
-                        error=error,
-                        job_id=row.job_id,
-                        oai_set=row.oai_set,
-                        success=success,
-                        fingerprint=row.fingerprint,
-                        transformed=row.transformed
-                    )
-
-                # transform via rdd.map and return
-                match = rits.regex_match_payload
-                replace = rits.regex_replace_payload
-                trans_target = rits.transformation_target
-                records_rdd = records_df.rdd.map(
-                    lambda row: regex_record_id_trans_udf(row, match, replace, trans_target))
-                records_df = records_rdd.toDF()
-
-            # handle python
-            if rits.transformation_type == 'python':
-
-                # define udf function for python transformation
-                def python_record_id_trans_udf(row, python_code, trans_target):
-
-                    try:
-                        # get python function from Transformation Scenario
-                        temp_mod = ModuleType('temp_mod')
-                        exec(python_code, temp_mod.__dict__)
-
-                        # establish python udf record
-                        if trans_target == 'record_id':
-                            pyudfr = PythonUDFRecord(
-                                None, non_row_input=True, record_id=row.record_id)
-                        if trans_target == 'document':
-                            pyudfr = PythonUDFRecord(
-                                None, non_row_input=True, document=row.document)
-
-                        # run transformation
-                        trans_result = temp_mod.transform_identifier(pyudfr)
-                        success = True
-                        error = row.error
-
-                    except Exception as e:
-                        trans_result = str(e)
-                        error = 'record_id transformation failure'
-                        success = False
-
-                    # return Row
-                    return Row(
-                        combine_id=row.combine_id,
-                        record_id=trans_result,
-                        document=row.document,
-                        error=error,
-                        job_id=row.job_id,
-                        oai_set=row.oai_set,
-                        success=success,
-                        fingerprint=row.fingerprint,
-                        transformed=row.transformed
-                    )
-
-                # transform via rdd.map and return
-                python_code = rits.python_payload
-                trans_target = rits.transformation_target
-                records_rdd = records_df.rdd.map(
-                    lambda row: python_record_id_trans_udf(row, python_code, trans_target))
-                records_df = records_rdd.toDF()
-
-            # handle xpath
-            if rits.transformation_type == 'xpath':
-
-                '''
-                Currently XPath RITS are handled via python and etree,
-                but might be worth investigating if this could be performed
-                via pyjxslt to support XPath 2.0
-                '''
-
-                # define udf function for xpath expression
-                def xpath_record_id_trans_udf(row, xpath):
-
-                    # establish python udf record, forcing 'document' type trans for XPath
-                    pyudfr = PythonUDFRecord(
-                        None, non_row_input=True, document=row.document)
-
-                    # run xpath and retrieve value
-                    xpath_query = pyudfr.xml.xpath(
-                        xpath, namespaces=pyudfr.nsmap)
-                    if len(xpath_query) == 1:
-                        trans_result = xpath_query[0].text
-                        success = True
-                        error = row.error
-                    elif len(xpath_query) == 0:
-                        trans_result = 'xpath expression found nothing'
-                        success = False
-                        error = 'record_id transformation failure'
-                    else:
-                        trans_result = 'more than one node found for XPath query'
-                        success = False
-                        error = 'record_id transformation failure'
-
-                    # return Row
-                    return Row(
-                        combine_id=row.combine_id,
-                        record_id=trans_result,
-                        document=row.document,
-                        error=error,
-                        job_id=row.job_id,
-                        oai_set=row.oai_set,
-                        success=success,
-                        fingerprint=row.fingerprint,
-                        transformed=row.transformed
-                    )
-
-                # transform via rdd.map and return
-                xpath = rits.xpath_payload
-                records_rdd = records_df.rdd.map(
-                    lambda row: xpath_record_id_trans_udf(row, xpath))
-                records_df = records_rdd.toDF()
-
-            # return
-            return records_df
+            # transform record_id, see RITSEngine
+            return RITSEngine(rits).transform(self.spark, records_df)
 
         # else return dataframe untouched
         else:
@@ -798,27 +703,23 @@ class CombineSparkJob():
             dpla_df = get_job_es(self.spark, indices=[
                                  dbdd.es_index], doc_type='item')
 
-            # get job mapped fields from es_rdd
-            es_df = es_rdd.toDF()
+            # get job mapped db_id and isShownAt from es_rdd
+            es_df = self.spark.createDataFrame(es_rdd.map(lambda row: (
+                row[1].get('db_id'),
+                row[1].get('dpla_isShownAt') if isinstance(row[1].get('dpla_isShownAt'), str) else None
+            )), schema=dpla_isshownat_schema)
 
             # join on isShownAt
             matches_df = es_df.join(
-                dpla_df, es_df['_2']['dpla_isShownAt'] == dpla_df['isShownAt'], 'leftsemi')
+                dpla_df, es_df['dpla_isShownAt'] == dpla_df['isShownAt'], 'leftsemi')
 
-            # select records from records_df for updating (writing)
-            update_dbdm_df = records_df.join(matches_df, records_df['_id']['oid'] == matches_df['_2']['db_id'],
+            # select records from records_df for updating
+            update_dbdm_df = records_df.join(matches_df, records_df['_id']['oid'] == matches_df['db_id'],
                                              'leftsemi')
 
-            # set dbdm column to True
-            update_dbdm_df = update_dbdm_df.withColumn(
-                'dbdm', pyspark_sql_functions.lit(True))
-
-            # write to DB
-            update_dbdm_df.write.format("com.mongodb.spark.sql.DefaultSource")\
-                .mode("append")\
-                .option("uri", "mongodb://%s" % settings.MONGO_HOST)\
-                .option("database", "combine")\
-                .option("collection", "record").save()
+            # set dbdm to True in DB
+            write_field_updates(self.spark, update_dbdm_df.select('_id').rdd.map(
+                lambda row: (row._id, 'dbdm', True)))
 
         # else, return with dbdm column all False
         else:
@@ -866,6 +767,15 @@ class HarvestOAISpark(CombineSparkJob):
         self.init_job()
         self.update_jobGroup('Running Harvest OAI Job')
 
+        # note harvest start as UTC datestamp, for subsequent incremental harvests
+        harvest_datestamp = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        # if incremental, merge records changed since last harvest into Job
+        if self.job_details.get('incremental', False) and 'oai_last_harvest' in self.job_details:
+            self.harvest_incremental(harvest_datestamp)
+            self.close_job()
+            return
+
         # prepare to harvest OAI records via Ingestion3
         df = self.spark.read.format("dpla.ingestion3.harvesters.oai")\
             .option("endpoint", self.job_details['oai_params']['endpoint'])\
@@ -920,16 +830,13 @@ class HarvestOAISpark(CombineSparkJob):
         records = records.withColumn('record_id', records.id)
 
         # add job_id as column
-        job_id = self.job.id
-        job_id_udf = udf(lambda id: job_id, IntegerType())
-        records = records.withColumn('job_id', job_id_udf(records.id))
+        records = records.withColumn('job_id', lit(self.job.id).cast(IntegerType()))
 
         # add oai_set, accomodating multiple sets
         records = records.withColumn('oai_set', records.setIds)
 
         # add blank error column
-        error = udf(lambda id: '', StringType())
-        records = records.withColumn('error', error(records.id))
+        records = records.withColumn('error', lit(''))
 
         # fingerprint records and set transformed
         records = self.fingerprint_records(records)
@@ -942,9 +849,132 @@ class HarvestOAISpark(CombineSparkJob):
             assign_combine_id=True
         )
 
+        # record harvest datestamp
+        self.job.update_job_details({'oai_last_harvest': harvest_datestamp})
+
         # close job
         self.close_job()
 
+    def harvest_incremental(self, harvest_datestamp):
+        """
+        Method to merge records added, changed, or deleted at OAI endpoint since last harvest into Job
+                - requests deltas with OAI-PMH `from`, see core.spark.utils.harvest_oai_deltas()
+                - upserts by record_id, keeping DB id and combine_id of existing records such that ES documents
+                are replaced in place, and removes deleted records
+                - writes changed records to `record_change` collection for downstream Jobs,
+                see core.models.Job.get_changed_records()
+                - published Jobs are resynced by close_job(), see core.models.Job.sync_published_records()
+
+        Args:
+                harvest_datestamp (str): UTC datestamp of harvest start, recorded for next harvest
+        """
+
+        oai_params = self.job_details['oai_params']
+        from_date = self.job_details['oai_last_harvest']
+        self.logger.info('Incremental OAI harvest, from %s' % from_date)
+
+        # harvest deltas, last occurrence of record_id winning
+        deltas = OrderedDict()
+        for record_id, document, oai_set, deleted in harvest_oai_deltas(oai_params, from_date):
+            deltas[record_id] = (document, oai_set, deleted)
+
+        # retrieve existing records for deltas
+        existing = {}
+        for batch in iter_batches(deltas.keys(), 1000):
+            for record in mc_handle.combine.record.find(
+                    {'job_id': self.job.id, 'record_id': {'$in': batch}},
+                    {'record_id': 1, 'combine_id': 1, 'fingerprint': 1, 'document': 1}):
+                existing[record['record_id']] = record
+
+        # prepare upserts and deletions
+        writes = []
+        changes = []
+        saved_rows = []
+        removed_ids = []
+        deleted_ids = []
+        for record_id, (document, oai_set, deleted) in deltas.items():
+            record = existing.get(record_id)
+
+            # deleted at endpoint, or without metadata as filtered by full harvest
+            if deleted or document is None:
+                if record is not None:
+                    writes.append(DeleteOne({'_id': record['_id']}))
+                    removed_ids.append(record['_id'])
+                    deleted_ids.append(str(record['_id']))
+                    changes.append((record_id, record['combine_id'], 'deleted'))
+                continue
+
+            # skip records re-reported by endpoint without change, comparing canonical XML where fingerprints
+            # differ, as full harvests store documents as serialized by Ingestion3, not lxml
+            # fingerprint as fingerprint_records(), crc32 of UTF-8 encoded document
+            fingerprint = zlib.crc32(document.encode('utf-8'))
+            if record is not None and (record.get('fingerprint') == fingerprint or
+                                       canonical_document(record.get('document') or '') ==
+                                       canonical_document(document)):
+                continue
+
+            fields = {
+                'document': document,
+                'error': '',
+                'oai_set': oai_set,
+                'success': True,
+                'fingerprint': fingerprint,
+                'transformed': True,
+                'valid': True,
+                'dbdm': False
+            }
+            if record is not None:
+                writes.append(UpdateOne({'_id': record['_id']}, {'$set': fields}))
+                removed_ids.append(record['_id'])
+                db_id, combine_id, change = record['_id'], record['combine_id'], 'updated'
+            else:
+                db_id, combine_id, change = ObjectId(), str(uuid.uuid4()), 'new'
+                writes.append(InsertOne(dict(fields, _id=db_id, combine_id=combine_id, record_id=record_id,
+                                             job_id=self.job.id, unique=True)))
+            changes.append((record_id, combine_id, change))
+            saved_rows.append((Row(oid=str(db_id)), combine_id, record_id, document, '', True, self.job.id,
+                               oai_set, True, fingerprint, True, True, False))
+
+        # write to DB, removing validations and mapping failures of changed and deleted records
+        self.update_jobGroup('Merging Changed Records to DB')
+        for batch in iter_batches(writes, 1000):
+            mc_handle.combine.record.bulk_write(batch, ordered=False)
+        for batch in iter_batches(removed_ids, 1000):
+            mc_handle.combine.record_validation.delete_many({'record_id': {'$in': batch}})
+            mc_handle.combine.index_mapping_failure.delete_many(
+                {'db_id': {'$in': [str(db_id) for db_id in batch]}})
+
+        # remove deleted records from ElasticSearch
+        if settings.INDEX_TO_ES and len(deleted_ids) > 0:
+            es_handle = Elasticsearch(hosts=[settings.ES_HOST])
+            es_helpers.bulk(es_handle, [{'_op_type': 'delete', '_index': 'j%s' % self.job.id, '_type': '_doc',
+                                         '_id': db_id} for db_id in deleted_ids], raise_on_error=False)
+
+        # index, validate, and match new and updated records
+        if len(saved_rows) > 0:
+            db_records = self.spark.createDataFrame(saved_rows, schema=StructType(
+                [StructField('_id', StructType([StructField('oid', StringType(), False)]), False)] +
+                combine_record_schema.fields))
+            self.process_saved_records(db_records)
+            for job_validation in self.job.jobvalidation_set.all():
+                job_validation.validation_failure_count(force_recount=True)
+
+        # write changed records set, and record counts and datestamp
+        mc_handle.combine.record_change.delete_many({'job_id': self.job.id})
+        for batch in iter_batches(changes, 1000):
+            mc_handle.combine.record_change.insert_many([{
+                'job_id': self.job.id,
+                'record_id': record_id,
+                'combine_id': combine_id,
+                'change': change,
+                'harvest_datestamp': harvest_datestamp
+            } for record_id, combine_id, change in batch])
+        oai_incremental = {'from': from_date, 'harvested': len(deltas)}
+        for change in ['new', 'updated', 'deleted']:
+            oai_incremental[change] = len([c for c in changes if c[2] == change])
+        self.logger.info('Incremental OAI harvest: %s' % oai_incremental)
+        self.job.update_job_details({'oai_last_harvest': harvest_datestamp, 'oai_incremental': oai_incremental})
+
 
 class HarvestStaticXMLSpark(CombineSparkJob):
     """
@@ -1051,14 +1081,14 @@ class HarvestStaticXMLSpark(CombineSparkJob):
                     record_id = hashlib.md5(
                         doc_string.encode('utf-8')).hexdigest()
 
-                # return success Row
-                return Row(
-                    record_id=record_id,
-                    document=etree.tostring(xml_root).decode('utf-8'),
-                    error='',
-                    job_id=int(job_id),
-                    oai_set='',
-                    success=True
+                # return success row, ordered per schemas.harvested_record_schema
+                return (
+                    record_id,
+                    etree.tostring(xml_root).decode('utf-8'),
+                    '',
+                    int(job_id),
+                    '',
+                    True
                 )
 
             # catch missing or ambiguous identifiers
@@ -1067,14 +1097,14 @@ class HarvestStaticXMLSpark(CombineSparkJob):
                 # hash record string to produce a unique id
                 record_id = hashlib.md5(doc_string.encode('utf-8')).hexdigest()
 
-                # return error Row
-                return Row(
-                    record_id=record_id,
-                    document=etree.tostring(xml_root).decode('utf-8'),
-                    error="AmbiguousIdentifier: %s" % str(e),
-                    job_id=int(job_id),
-                    oai_set='',
-                    success=True
+                # return error row
+                return (
+                    record_id,
+                    etree.tostring(xml_root).decode('utf-8'),
+                    "AmbiguousIdentifier: %s" % str(e),
+                    int(job_id),
+                    '',
+                    True
                 )
 
             # handle all other exceptions
@@ -1083,14 +1113,14 @@ class HarvestStaticXMLSpark(CombineSparkJob):
                 # hash record string to produce a unique id
                 record_id = hashlib.md5(doc_string.encode('utf-8')).hexdigest()
 
-                # return error Row
-                return Row(
-                    record_id=record_id,
-                    document=doc_string,
-                    error=str(e),
-                    job_id=int(job_id),
-                    oai_set='',
-                    success=False
+                # return error row
+                return (
+                    record_id,
+                    doc_string,
+                    str(e),
+                    int(job_id),
+                    '',
+                    False
                 )
 
         # map with parse_records_udf
@@ -1102,7 +1132,7 @@ class HarvestStaticXMLSpark(CombineSparkJob):
             lambda row: parse_records_udf(job_id, row, job_details))
 
         # convert back to DF
-        records = records.toDF()
+        records = self.spark.createDataFrame(records, schema=harvested_record_schema)
 
         # fingerprint records and set transformed
         records = self.fingerprint_records(records)
@@ -1166,6 +1196,9 @@ class HarvestTabularDataSpark(CombineSparkJob):
         # partition udf
         def kvp_to_xml_pt_udf(pt):
 
+            # init handler once per partition, reusing parsed columns across rows
+            xml2kvp_handler = XML2kvp(**xml2kvp_config.__dict__)
+
             for row in pt:
 
                 # get as dict
@@ -1181,29 +1214,29 @@ class HarvestTabularDataSpark(CombineSparkJob):
 
                     # convert dictionary to XML with XML2kvp
                     xml_record_str = XML2kvp.kvp_to_xml(
-                        row_dict, serialize_xml=True, **xml2kvp_config.__dict__)
-
-                    # return success Row
-                    yield Row(
-                        record_id=combine_vals_dict.get('record_id'),
-                        document=xml_record_str,
-                        error='',
-                        job_id=int(job_id),
-                        oai_set='',
-                        success=True
+                        row_dict, serialize_xml=True, handler=xml2kvp_handler)
+
+                    # return success row, ordered per schemas.harvested_record_schema
+                    yield (
+                        combine_vals_dict.get('record_id'),
+                        xml_record_str,
+                        '',
+                        int(job_id),
+                        '',
+                        True
                     )
 
                 # handle all other exceptions
                 except Exception as e:
 
-                    # return error Row
-                    yield Row(
-                        record_id=combine_vals_dict.get('record_id'),
-                        document='',
-                        error=str(e),
-                        job_id=int(job_id),
-                        oai_set='',
-                        success=False
+                    # return error row
+                    yield (
+                        combine_vals_dict.get('record_id'),
+                        '',
+                        str(e),
+                        int(job_id),
+                        '',
+                        False
                     )
 
         # mixin passed configurations with defaults
@@ -1216,7 +1249,7 @@ class HarvestTabularDataSpark(CombineSparkJob):
         records = dc_df.rdd.mapPartitions(kvp_to_xml_pt_udf)
 
         # convert back to DF
-        records = records.toDF()
+        records = self.spark.createDataFrame(records, schema=harvested_record_schema)
 
         # fingerprint records and set transformed
         records = self.fingerprint_records(records)
@@ -1233,11 +1266,459 @@ class HarvestTabularDataSpark(CombineSparkJob):
         self.close_job()
 
 
+class RITSEngine():
+    """
+    Run Record Identifier Transformation Scenario (RITS) against records DataFrame
+        - regex RITS with patterns and replacements that behave the same in Java run as native regexp_replace
+        - otherwise, RITS are compiled once per partition -- regex pattern, python module, etree.XPath per
+        namespace map -- and rows emitted against the schema of the input DataFrame, such that no schema
+        inference runs
+
+    XPath RITS are not run as Spark's xpath_string(), which is not namespace aware, and returns the first
+    match rather than failing when more than one node is found
+    """
+
+    failure_error = 'record_id transformation failure'
+
+    def __init__(self, rits):
+        """
+        Args:
+                rits (core.models.RecordIdentifierTransformation): RITS to run
+        """
+
+        self.transformation_type = rits.transformation_type
+        self.transformation_target = rits.transformation_target
+        self.regex_match = rits.regex_match_payload
+        self.regex_replace = rits.regex_replace_payload
+        self.python_code = rits.python_payload
+        self.xpath = rits.xpath_payload
+
+    def is_native(self):
+        """
+        Return True if RITS may run as native Spark expression
+            - Java and python differ in replacement group references, e.g. $1 vs. \\1, and named group syntax
+        """
+
+        if self.transformation_type != 'regex' or self.regex_match is None or self.regex_replace is None:
+            return False
+        try:
+            re.compile(self.regex_match)
+        except re.error:
+            return False
+        return '\\' not in self.regex_replace and '$' not in self.regex_replace and '(?P' not in self.regex_match
+
+    def transform(self, spark, records_df):
+        """
+        Return records_df with RITS applied to record_id
+        """
+
+        if self.is_native():
+            return records_df.withColumn('record_id', pyspark_sql_functions.regexp_replace(
+                records_df[self.transformation_target], self.regex_match, self.regex_replace))
+
+        columns = records_df.columns
+        records_rdd = records_df.rdd.mapPartitions(lambda pt: self.transform_partition(pt, columns))
+        return spark.createDataFrame(records_rdd, schema=records_df.schema)
+
+    def compile(self):
+        """
+        Return function of Row returning transformed record_id, raising exception on failure
+        """
+
+        target = self.transformation_target
+
+        if self.transformation_type == 'regex':
+            pattern = re.compile(self.regex_match)
+            replace = self.regex_replace
+            return lambda row: pattern.sub(replace, getattr(row, target))
+
+        if self.transformation_type == 'python':
+            module = compiled_artifacts.get(
+                'rits_python', compiled_artifacts.content_hash(self.python_code),
+                lambda: load_python_module('temp_mod', self.python_code))
+
+            def python_rits(row):
+                if target == 'record_id':
+                    pyudfr = PythonUDFRecord(None, non_row_input=True, record_id=row.record_id)
+                if target == 'document':
+                    pyudfr = PythonUDFRecord(None, non_row_input=True, document=row.document)
+                trans_result = module.transform_identifier(pyudfr)
+                if trans_result is not None and not isinstance(trans_result, str):
+                    trans_result = str(trans_result)
+                return trans_result
+
+            return python_rits
+
+        if self.transformation_type == 'xpath':
+            xpaths = {}
+
+            def xpath_rits(row):
+                xml = etree.fromstring(row.document.encode('utf-8'))
+                nsmap = {k: v for k, v in xml.nsmap.items() if k is not None}
+                nsmap_key = tuple(sorted(nsmap.items()))
+                if nsmap_key not in xpaths:
+                    xpaths[nsmap_key] = etree.XPath(self.xpath, namespaces=nsmap)
+                xpath_query = xpaths[nsmap_key](xml)
+                if len(xpath_query) == 1:
+                    return xpath_query[0].text
+                elif len(xpath_query) == 0:
+                    raise Exception('xpath expression found nothing')
+                else:
+                    raise Exception('more than one node found for XPath query')
+
+            return xpath_rits
+
+        raise Exception('unknown RITS transformation type: %s' % self.transformation_type)
+
+    def transform_partition(self, pt, columns):
+        """
+        Apply RITS to rows of partition, yielding tuples in order of columns
+            - on failure, exception is written to record_id, and record marked as failed
+        """
+
+        try:
+            rits_func = self.compile()
+        except Exception as e:
+            compile_error = e
+
+            def rits_func(row):
+                raise compile_error
+
+        record_id_index = columns.index('record_id')
+        error_index = columns.index('error')
+        success_index = columns.index('success')
+
+        for row in pt:
+            values = list(row)
+            try:
+                values[record_id_index] = rits_func(row)
+                values[success_index] = True
+            except Exception as e:
+                values[record_id_index] = str(e)
+                values[error_index] = self.failure_error
+                values[success_index] = False
+            yield tuple(values)
+
+
+def register_gateway_pool(xslt_hash, xslt_string, pool_size):
+    """
+    Register XSLT with a pool of pyjxslt gateway connections, under name derived from content hash
+        - name is suffixed with a UUID, as the gateway is shared by python workers, each of which
+        may drop its registration when evicted from compiled_artifacts
+
+    Returns:
+            (core.spark.utils.XSLTGatewayPool)
+    """
+
+    return XSLTGatewayPool('xslt_%s_%s' % (xslt_hash, uuid.uuid4().hex), xslt_string, size=pool_size,
+                           gateway_factory=lambda: pyjxslt.Gateway(6767))
+
+
+def drop_gateway_pool(gateway_pool):
+    """
+    Drop XSLT registered with register_gateway_pool() from pyjxslt gateway, closing pool
+    """
+
+    gateway_pool.close()
+
+
+class FusedDocument():
+    """
+    Document passed between fused transformation steps, held as string, parsed tree, or both
+        - each representation is derived from the other only when a step asks for it
+    """
+
+    def __init__(self, string=None, tree=None):
+        self._string = string
+        self._tree = tree
+
+    @property
+    def string(self):
+        if self._string is None and self._tree is not None:
+            self._string = etree.tostring(self._tree).decode('utf-8')
+        return self._string
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = etree.fromstring(self._string.encode('utf-8'))
+        return self._tree
+
+
+def compile_openrefine_actions(or_actions_json, input_job_fm_config):
+    """
+    Parse OpenRefine actions JSON, deriving XPaths and jython functions once
+
+    Returns:
+            (list): of tuples (op, xpath, edits or function)
+    """
+
+    compiled_actions = []
+    for event in json.loads(or_actions_json):
+
+        # handle mass edits
+        if event['op'] == 'core/mass-edit':
+            xpath = XML2kvp.k_to_xpath(event['columnName'], **input_job_fm_config)
+            compiled_actions.append((event['op'], xpath, event['edits']))
+
+        # handle jython
+        if event['op'] == 'core/text-transform' and event['expression'].startswith('jython:'):
+            code = event['expression'].split('jython:')[1]
+            code = 'def temp_func(value):\n%s' % textwrap.indent(code, prefix='    ')
+            temp_pyts = load_python_module('temp_pyts', code)
+            xpath = XML2kvp.k_to_xpath(event['columnName'], **input_job_fm_config)
+            compiled_actions.append((event['op'], xpath, temp_pyts.temp_func))
+
+    return compiled_actions
+
+
+class FusedTransformationPipeline():
+    """
+    Run ordered Transformation scenarios as a single mapPartitions function
+        - documents pass between steps as lxml trees where possible, serialized only when a step needs a string
+        - steps are shipped as a broadcast variable, and compiled once per executor, see utils.CompiledArtifactCache
+        - records are run through each step in batches, such that pyjxslt gateway steps transform batches
+        concurrently over a pool of connections, see utils.XSLTGatewayPool
+        - time spent per step, and gateway latency, are collected with accumulators
+    """
+
+    def __init__(self, spark, transformations, job_id, input_job_fm_config=None):
+        """
+        Args:
+                spark (pyspark.sql.session.SparkSession): spark instance
+                transformations (list): ordered Transformation instances
+                job_id (int): Job ID written to transformed records
+                input_job_fm_config (dict): field mapper config of input Job, for OpenRefine transformations
+        """
+
+        steps = [{
+            'index': index,
+            'name': transformation.name,
+            'transformation_type': transformation.transformation_type,
+            'runner': self.get_runner_type(transformation),
+            'payload': transformation.payload,
+            'payload_hash': compiled_artifacts.content_hash(transformation.payload)
+        } for index, transformation in enumerate(transformations)]
+        self.steps_bc = spark.sparkContext.broadcast(steps)
+        self.step_names = [step['name'] for step in steps]
+        self.seconds_accs = [spark.sparkContext.accumulator(0.0) for step in steps]
+        self.gateway_latency_acc = spark.sparkContext.accumulator(LatencyHistogram(), LatencyHistogramParam())
+        self.gateway_pool_size = getattr(settings, 'SPARK_XSLT_GATEWAY_POOL_SIZE', 4)
+        self.batch_size = getattr(settings, 'SPARK_XSLT_GATEWAY_BATCH_SIZE', 100)
+        self.job_id = job_id
+        self.input_job_fm_config = input_job_fm_config or {}
+
+    @staticmethod
+    def get_runner_type(transformation):
+        """
+        Return runner for Transformation, XSLT split by engine, see Transformation.get_xslt_engine()
+        """
+
+        if transformation.transformation_type == 'xslt':
+            return 'xslt_%s' % transformation.get_xslt_engine()
+        return transformation.transformation_type
+
+    def compile_step(self, step):
+        """
+        Return compiled step from executor cache
+        """
+
+        if step['runner'] == 'xslt_lxml':
+            return compiled_artifacts.get(
+                'xslt_lxml', step['payload_hash'], lambda: compile_xslt(step['payload']))
+
+        if step['runner'] == 'xslt_gateway':
+            return compiled_artifacts.get(
+                'xslt_gateway', step['payload_hash'],
+                lambda: register_gateway_pool(step['payload_hash'], step['payload'], self.gateway_pool_size),
+                evict_func=drop_gateway_pool)
+
+        if step['runner'] == 'python':
+            return compiled_artifacts.get(
+                'python_transformation', step['payload_hash'],
+                lambda: load_python_module('temp_pyts', step['payload']))
+
+        if step['runner'] == 'openrefine':
+            fm_config = self.input_job_fm_config
+            return compiled_artifacts.get(
+                'openrefine', compiled_artifacts.content_hash('%s%s' % (step['payload'], json.dumps(fm_config))),
+                lambda: compile_openrefine_actions(step['payload'], fm_config))
+
+        return None
+
+    @staticmethod
+    def run_xslt_lxml(compiled, row, doc, error):
+
+        try:
+            result = compiled(doc.tree)
+            tree = result.getroot()
+            if tree is None:
+                raise Exception('XSLT transformation did not return an XML document')
+            # serialize per xsl:output, passing tree to next step
+            return FusedDocument(str(result), tree), '', True
+        except Exception as e:
+            return doc, str(e), False
+
+    @staticmethod
+    def run_xslt_gateway(compiled, rows, states, histogram):
+        """
+        Transform batch of documents over pool of gateway connections
+        """
+
+        # serialize documents, failing those that cannot be
+        documents = []
+        for doc, error, success in states:
+            try:
+                documents.append(doc.string)
+            except Exception:
+                documents.append(None)
+
+        results = compiled.transform_many(
+            [document for document in documents if document is not None], histogram=histogram)
+        results.reverse()
+
+        transformed = []
+        for (doc, error, success), document in zip(states, documents):
+            try:
+                if document is None:
+                    raise Exception('document could not be serialized for XSLT transformation')
+                result, err = results.pop()
+                if err is not None:
+                    raise err
+                # parse to confirm well-formedness, passing tree to next step
+                tree = etree.fromstring(result.encode('utf-8'))
+                transformed.append((FusedDocument(result, tree), '', True))
+            except Exception as e:
+                transformed.append((doc, str(e), False))
+        return transformed
+
+    @staticmethod
+    def run_python(compiled, row, doc, error):
+
+        # prepare row as parsed document with PythonUDFRecord class, reusing tree if parsed
+        try:
+            tree = doc.tree
+        except Exception:
+            tree = None
+        prtb = PythonUDFRecord(Row(**dict(row.asDict(), document=doc.string, error=error)), xml=tree)
+
+        # run transformation
+        trans_result = compiled.python_record_transformation(prtb)
+
+        # convert any possible byte responses to string
+        document, error, success = trans_result[0], trans_result[1], trans_result[2]
+        if isinstance(document, bytes):
+            document = document.decode('utf-8')
+        if isinstance(error, bytes):
+            error = error.decode('utf-8')
+        return FusedDocument(document), error, success
+
+    @staticmethod
+    def run_openrefine(compiled, row, doc, error):
+
+        try:
+            tree = doc.tree
+            nsmap = {k: v for k, v in tree.nsmap.items() if k is not None}
+
+            for op, xpath, action in compiled:
+
+                # find elements for potential edits
+                eles = tree.xpath(xpath, namespaces=nsmap)
+
+                # handle mass edits
+                if op == 'core/mass-edit':
+                    for ele in eles:
+                        for edit in action:
+                            if ele.text in edit['from']:
+                                ele.text = edit['to']
+
+                # handle jython
+                elif op == 'core/text-transform':
+                    for ele in eles:
+                        ele.text = action(ele.text)
+
+            # pass edited tree, serializing only if needed
+            return FusedDocument(tree=tree), '', True
+
+        except Exception as e:
+            return doc, str(e), False
+
+    def transform_partition(self, pt):
+        """
+        Run all steps against batches of records in partition,
+        yielding tuples per TransformSpark.transform_schema
+        """
+
+        step_runners = {
+            'xslt_lxml': self.run_xslt_lxml,
+            'python': self.run_python,
+            'openrefine': self.run_openrefine
+        }
+
+        # compile steps for partition
+        steps = [(step, self.compile_step(step), step_runners.get(step['runner']))
+                 for step in self.steps_bc.value]
+        seconds = [0.0 for step in steps]
+        histogram = LatencyHistogram()
+
+        for rows in iter_batches(pt, self.batch_size):
+
+            states = [(FusedDocument(row.document), row.error, row.success) for row in rows]
+
+            for step, compiled, runner in steps:
+                stime = time.time()
+                if step['runner'] == 'xslt_gateway':
+                    states = self.run_xslt_gateway(compiled, rows, states, histogram)
+                elif runner is not None:
+                    states = [runner(compiled, row, doc, error)
+                              for row, (doc, error, success) in zip(rows, states)]
+                seconds[step['index']] += time.time() - stime
+
+            for row, (doc, error, success) in zip(rows, states):
+                yield (
+                    row.combine_id,
+                    row.record_id,
+                    doc.string,
+                    error,
+                    int(self.job_id),
+                    row.oai_set,
+                    success,
+                    row.fingerprint,
+                    row.transformed
+                )
+
+        # update accumulators
+        for index, step_seconds in enumerate(seconds):
+            self.seconds_accs[index].add(step_seconds)
+        self.gateway_latency_acc.add(histogram)
+
+    def get_timings(self):
+        """
+        Return seconds spent per step, once transformation has run
+
+        Returns:
+                (list): of dictionaries with step name and seconds
+        """
+
+        return [{'name': name, 'seconds': acc.value} for name, acc in zip(self.step_names, self.seconds_accs)]
+
+    def get_gateway_latency(self):
+        """
+        Return pyjxslt gateway latency percentiles in milliseconds, once transformation has run,
+        see utils.LatencyHistogram.percentiles()
+        """
+
+        return self.gateway_latency_acc.value.percentiles()
+
+
 class TransformSpark(CombineSparkJob):
     """
     Spark code for Transform jobs
     """
 
+    # schema of transformed records, see FusedTransformationPipeline.transform_partition()
+    transform_schema = transformed_record_schema
+
     def spark_function(self):
         """
         Transform records based on Transformation Scenario.
@@ -1265,14 +1746,22 @@ class TransformSpark(CombineSparkJob):
         # get input records
         records = self.get_input_records(filter_input_records=True)
 
-        # fork as input_records
-        input_records = records
-
         # get transformation json
         sel_trans = json.loads(
             self.job_details['transformation']['scenarios_json'])
 
-        # loop through oredered transformations
+        # if incremental, reuse previous outputs for unchanged input records and transform the remainder
+        transformation_hash = self.get_transformation_hash(sel_trans)
+        records, reused_records = self.get_incremental_records(records, transformation_hash)
+
+        # run ordered transformations as single, fused step
+        fused_pipeline = None
+        self.gateway_latency_acc = self.spark.sparkContext.accumulator(LatencyHistogram(), LatencyHistogramParam())
+        if getattr(settings, 'SPARK_FUSED_TRANSFORMATIONS', False):
+            fused_pipeline, records = self.transform_fused(sel_trans, records)
+            sel_trans = []
+
+        # else, loop through ordered transformations
         for trans in sel_trans:
 
             # load transformation
@@ -1300,34 +1789,174 @@ class TransformSpark(CombineSparkJob):
                     transformation, records, input_job_fm_config)
 
             # convert back to DataFrame
-            records = records.toDF()
+            records = self.spark.createDataFrame(records, schema=self.transform_schema)
 
-        # fingerprint Record document
-        records = self.fingerprint_records(records)
-
-        # assign to records_trans
-        records_trans = records
+        # union reused outputs, with input fingerprint, as transformed
+        if reused_records is not None:
+            records = records.select(*reused_records.columns).union(reused_records)
 
-        # write `transformed` column based on new fingerprint
-        records_trans = records_trans.alias("records_trans").join(input_records.alias("input_records"),
-                                                                  input_records.combine_id == records_trans.combine_id,
-                                                                  'left').select(
-            *['records_trans.%s' % c for c in records_trans.columns if c not in ['transformed']],
-            pyspark_sql_functions.when(records_trans.fingerprint != input_records.fingerprint,
+        # transformations carry input fingerprint through, compare to new fingerprint as projection
+        records = records.withColumnRenamed('fingerprint', 'input_fingerprint')
+        records = self.fingerprint_records(records)
+        records_trans = records.withColumn(
+            'transformed',
+            pyspark_sql_functions.when(records.fingerprint != records.input_fingerprint,
                                        pyspark_sql_functions.lit(True)).otherwise(
-                pyspark_sql_functions.lit(False)).alias('transformed'))
+                pyspark_sql_functions.lit(False)))
 
-        # index records to DB and index to ElasticSearch
+        # index records to DB and index to ElasticSearch, keeping input fingerprint for incremental reruns
         self.save_records(
-            records_df=records_trans
+            records_df=records_trans,
+            extra_columns=['input_fingerprint']
         )
 
+        # record transformation hash, and drop previous outputs staged for reuse
+        self.job.update_job_details({'transformation_hash': transformation_hash})
+        if self.job_details.get('incremental', False):
+            mc_handle.combine[self.job.incremental_collection].drop()
+
+        # record time spent per transformation, and pyjxslt gateway latency
+        if fused_pipeline:
+            self.job.update_job_details({'transformation_timings': fused_pipeline.get_timings()})
+            gateway_latency = fused_pipeline.get_gateway_latency()
+        else:
+            gateway_latency = self.gateway_latency_acc.value.percentiles()
+        if gateway_latency['count'] > 0:
+            self.logger.info('pyjxslt gateway latency (ms): %s' % gateway_latency)
+            self.job.update_job_details({'xslt_gateway_latency': gateway_latency})
+
         # close job
         self.close_job()
 
+    def get_transformation_hash(self, sel_trans):
+        """
+        Method to hash ordered transformation types, payloads, and for XSLT, engine and contents of included
+        stylesheets, such that outputs of a previous run are reused only when transformations are unchanged
+
+        Args:
+                sel_trans (list): ordered transformations from job details
+
+        Return:
+                (str): sha1 hexdigest
+        """
+
+        scenarios = []
+        for trans in sel_trans:
+            transformation = Transformation.objects.get(pk=int(trans['trans_id']))
+            scenario = [transformation.transformation_type, transformation.payload]
+            if transformation.transformation_type == 'xslt':
+                scenario.extend([transformation.get_xslt_engine(), xsl_include_hashes(transformation.payload)])
+            scenarios.append(scenario)
+        return compiled_artifacts.content_hash(json.dumps(scenarios))
+
+    def get_incremental_records(self, records, transformation_hash):
+        """
+        Method to split input records for incremental rerun, see Job.stage_incremental_records()
+                - outputs staged from previous run are reused where combine_id and input fingerprint match,
+                and the transformation hash is unchanged
+                - reuse ratio written to job details as `incremental_reuse`
+
+        Args:
+                records (pyspark.sql.DataFrame): DataFrame of records pre-transformation
+                transformation_hash (str): hash of current transformations, see get_transformation_hash()
+
+        Return:
+                (tuple): records to transform, reused records per transform_schema or None if not incremental
+        """
+
+        # not incremental, or transformations changed since previous run
+        if not self.job_details.get('incremental', False) or \
+                self.job_details.get('transformation_hash') != transformation_hash:
+            return records, None
+
+        # retrieve previous outputs from staging collection
+        pipeline = json.dumps([
+            {
+                '$project': {field_name: 1 for field_name in
+                             ['combine_id', 'input_fingerprint', 'document', 'error', 'success']}
+            }
+        ])
+        previous = self.spark.read.format("com.mongodb.spark.sql.DefaultSource")\
+            .option("uri", "mongodb://%s" % settings.MONGO_HOST)\
+            .option("database", "combine")\
+            .option("collection", self.job.incremental_collection)\
+            .option("pipeline", pipeline).load()
+
+        # previous run did not record input fingerprints
+        if 'input_fingerprint' not in previous.columns:
+            return records, None
+        previous = previous.select(
+            previous.combine_id.alias('previous_combine_id'),
+            previous.input_fingerprint.alias('previous_input_fingerprint'),
+            previous.document.alias('previous_document'),
+            previous.error.alias('previous_error'),
+            previous.success.alias('previous_success'))
+
+        # split on combine_id and input fingerprint
+        records.persist(StorageLevel.MEMORY_AND_DISK)
+        unchanged = (records.combine_id == previous.previous_combine_id) & \
+                    (records.fingerprint == previous.previous_input_fingerprint)
+        reused_records = records.join(previous, unchanged, 'inner').select(
+            records.combine_id,
+            records.record_id,
+            previous.previous_document.alias('document'),
+            previous.previous_error.alias('error'),
+            pyspark_sql_functions.lit(self.job.id).cast(IntegerType()).alias('job_id'),
+            records.oai_set,
+            previous.previous_success.cast(BooleanType()).alias('success'),
+            records.fingerprint,
+            pyspark_sql_functions.lit(False).alias('transformed'))
+        reused_records.persist(StorageLevel.MEMORY_AND_DISK)
+        changed_records = records.join(previous, unchanged, 'left_anti')
+
+        # report reuse ratio
+        total_count = records.count()
+        reused_count = reused_records.count()
+        incremental_reuse = {
+            'input_count': total_count,
+            'reused_count': reused_count,
+            'reuse_ratio': round(reused_count / total_count, 4) if total_count else 0.0
+        }
+        self.logger.info('Incremental transform, reusing previous outputs: %s' % incremental_reuse)
+        self.job.update_job_details({'incremental_reuse': incremental_reuse})
+
+        return changed_records, reused_records
+
+    def transform_fused(self, sel_trans, records):
+        """
+        Method to run ordered transformations in a single mapPartitions, see FusedTransformationPipeline
+
+        Args:
+                sel_trans (list): ordered transformations from job details
+                records (pyspark.sql.DataFrame): DataFrame of records pre-transformation
+
+        Return:
+                (tuple): FusedTransformationPipeline, transformed records as DataFrame
+        """
+
+        # load transformations in order
+        transformations = []
+        for trans in sel_trans:
+            transformation = Transformation.objects.get(pk=int(trans['trans_id']))
+            self.logger.info('Applying transformation #%s: %s' % (trans['index'], transformation.name))
+            transformations.append(transformation)
+
+        # get XML2kvp settings from input Job for OpenRefine transformations
+        input_job_fm_config = None
+        if 'openrefine' in [transformation.transformation_type for transformation in transformations]:
+            input_job = Job.objects.get(pk=int(self.job_details['input_job_ids'][0]))
+            input_job_fm_config = input_job.job_details_dict['field_mapper_config']
+
+        # transform and convert to DataFrame with explicit schema
+        fused_pipeline = FusedTransformationPipeline(
+            self.spark, transformations, self.job.id, input_job_fm_config=input_job_fm_config)
+        records_trans = records.rdd.mapPartitions(fused_pipeline.transform_partition)
+        return fused_pipeline, self.spark.createDataFrame(records_trans, schema=self.transform_schema)
+
     def transform_xslt(self, transformation, records):
         """
-        Method to transform records with XSLT, using pyjxslt server
+        Method to transform records with XSLT, using lxml or pyjxslt server,
+        per Transformation.get_xslt_engine()
 
         Args:
                 job: job from parent job
@@ -1340,45 +1969,69 @@ class TransformSpark(CombineSparkJob):
 
         def transform_xslt_pt_udf(pt):
 
-            # transform with pyjxslt gateway
-            gw = pyjxslt.Gateway(6767)
-            gw.add_transform('xslt_transform', xslt_string)
-
-            # loop through rows in partition
-            for row in pt:
+            # compile stylesheet with lxml, or register with pool of gateway connections, once per executor
+            if xslt_engine == 'lxml':
+                xslt = compiled_artifacts.get(
+                    'xslt_lxml', xslt_hash, lambda: compile_xslt(xslt_bc.value))
+            else:
+                gateway_pool = compiled_artifacts.get(
+                    'xslt_gateway', xslt_hash,
+                    lambda: register_gateway_pool(xslt_hash, xslt_bc.value, pool_size),
+                    evict_func=drop_gateway_pool)
+            histogram = LatencyHistogram()
 
-                try:
-                    result = gw.transform('xslt_transform', row.document)
-                    # attempt XML parse to confirm well-formedness
-                    # error will bubble up in try/except
-                    valid_xml = etree.fromstring(result.encode('utf-8'))
+            # loop through batches of rows in partition
+            for rows in iter_batches(pt, batch_size):
 
-                    # set trans_result tuple
-                    trans_result = (result, '', True)
+                # transform batch concurrently with gateway
+                if xslt_engine != 'lxml':
+                    results = gateway_pool.transform_many(
+                        [row.document for row in rows], histogram=histogram)
 
-                # catch transformation exception and save exception to 'error'
-                except Exception as e:
-                    # set trans_result tuple
-                    trans_result = (row.document, str(e), False)
+                for index, row in enumerate(rows):
 
-                # yield each Row in mapPartition
-                yield Row(
-                    combine_id=row.combine_id,
-                    record_id=row.record_id,
-                    document=trans_result[0],
-                    error=trans_result[1],
-                    job_id=int(job_id),
-                    oai_set=row.oai_set,
-                    success=trans_result[2],
-                    fingerprint=row.fingerprint,
-                    transformed=row.transformed
-                )
+                    try:
+                        if xslt_engine == 'lxml':
+                            result = str(xslt(etree.fromstring(row.document.encode('utf-8'))))
+                        else:
+                            result, err = results[index]
+                            if err is not None:
+                                raise err
+                        # attempt XML parse to confirm well-formedness
+                        # error will bubble up in try/except
+                        valid_xml = etree.fromstring(result.encode('utf-8'))
+
+                        # set trans_result tuple
+                        trans_result = (result, '', True)
+
+                    # catch transformation exception and save exception to 'error'
+                    except Exception as e:
+                        # set trans_result tuple
+                        trans_result = (row.document, str(e), False)
+
+                    # yield each row in mapPartition, ordered per transform_schema
+                    yield (
+                        row.combine_id,
+                        row.record_id,
+                        trans_result[0],
+                        trans_result[1],
+                        int(job_id),
+                        row.oai_set,
+                        trans_result[2],
+                        row.fingerprint,
+                        row.transformed
+                    )
 
-            # drop transform
-            gw.drop_transform('xslt_transform')
+            gateway_latency_acc.add(histogram)
 
-        # get XSLT transformation as string
-        xslt_string = transformation.payload
+        # broadcast XSLT transformation string, selecting engine on driver
+        xslt_engine = transformation.get_xslt_engine()
+        self.logger.info('Transforming with XSLT engine: %s' % xslt_engine)
+        xslt_hash = compiled_artifacts.content_hash(transformation.payload)
+        xslt_bc = self.spark.sparkContext.broadcast(transformation.payload)
+        pool_size = getattr(settings, 'SPARK_XSLT_GATEWAY_POOL_SIZE', 4)
+        batch_size = getattr(settings, 'SPARK_XSLT_GATEWAY_BATCH_SIZE', 100)
+        gateway_latency_acc = self.gateway_latency_acc
 
         # transform via rdd.map and return
         job_id = self.job.id
@@ -1406,9 +2059,9 @@ class TransformSpark(CombineSparkJob):
         # define udf function for python transformation
         def transform_python_pt_udf(pt):
 
-            # get python function from Transformation Scenario
-            temp_pyts = ModuleType('temp_pyts')
-            exec(python_code, temp_pyts.__dict__)
+            # get python function from Transformation Scenario, loaded once per executor
+            temp_pyts = compiled_artifacts.get(
+                'python_transformation', python_hash, lambda: load_python_module('temp_pyts', python_bc.value))
 
             for row in pt:
 
@@ -1430,22 +2083,23 @@ class TransformSpark(CombineSparkJob):
                 # 	# set trans_result tuple
                 # 	trans_result = (row.document, str(e), False)
 
-                # return Row
-                yield Row(
-                    combine_id=row.combine_id,
-                    record_id=row.record_id,
-                    document=trans_result[0],
-                    error=trans_result[1],
-                    job_id=int(job_id),
-                    oai_set=row.oai_set,
-                    success=trans_result[2],
-                    fingerprint=row.fingerprint,
-                    transformed=row.transformed
+                # return row, ordered per transform_schema
+                yield (
+                    row.combine_id,
+                    row.record_id,
+                    trans_result[0],
+                    trans_result[1],
+                    int(job_id),
+                    row.oai_set,
+                    trans_result[2],
+                    row.fingerprint,
+                    row.transformed
                 )
 
         # transform via rdd.mapPartitions and return
         job_id = self.job.id
-        python_code = transformation.payload
+        python_hash = compiled_artifacts.content_hash(transformation.payload)
+        python_bc = self.spark.sparkContext.broadcast(transformation.payload)
         records_trans = records.rdd.mapPartitions(transform_python_pt_udf)
         return records_trans
 
@@ -1526,23 +2180,23 @@ class TransformSpark(CombineSparkJob):
 
                     # re-serialize as trans_result
                     trans_result = (etree.tostring(
-                        prtb.xml).decode('utf-8'), '', 1)
+                        prtb.xml).decode('utf-8'), '', True)
 
                 except Exception as e:
                     # set trans_result tuple
                     trans_result = (row.document, str(e), False)
 
-                # return Row
-                yield Row(
-                    combine_id=row.combine_id,
-                    record_id=row.record_id,
-                    document=trans_result[0],
-                    error=trans_result[1],
-                    job_id=int(job_id),
-                    oai_set=row.oai_set,
-                    success=trans_result[2],
-                    fingerprint=row.fingerprint,
-                    transformed=row.transformed
+                # return row, ordered per transform_schema
+                yield (
+                    row.combine_id,
+                    row.record_id,
+                    trans_result[0],
+                    trans_result[1],
+                    int(job_id),
+                    row.oai_set,
+                    trans_result[2],
+                    row.fingerprint,
+                    row.transformed
                 )
 
         # transform via rdd.mapPartitions and return
@@ -1585,9 +2239,7 @@ class MergeSpark(CombineSparkJob):
         records = self.get_input_records(filter_input_records=True)
 
         # update job column, overwriting job_id from input jobs in merge
-        job_id = self.job.id
-        job_id_udf = udf(lambda record_id: job_id, IntegerType())
-        records = records.withColumn('job_id', job_id_udf(records.record_id))
+        records = records.withColumn('job_id', lit(self.job.id).cast(IntegerType()))
 
         # set transformed column to False
         records = records.withColumn(
@@ -1780,20 +2432,13 @@ class RunDBDM(CombineSparkPatch):
         matches_df = es_df.join(
             dpla_df, es_df['dpla_isShownAt'] == dpla_df['isShownAt'], 'leftsemi')
 
-        # select records_df for writing
+        # select records_df for updating
         update_dbdm_df = records_df.join(
             matches_df, records_df['_id']['oid'] == matches_df['db_id'], 'leftsemi')
 
-        # set dbdm column to match
-        update_dbdm_df = update_dbdm_df.withColumn(
-            'dbdm', pyspark_sql_functions.lit(True))
-
-        # write to DB
-        update_dbdm_df.write.format("com.mongodb.spark.sql.DefaultSource")\
-            .mode("append")\
-            .option("uri", "mongodb://%s" % settings.MONGO_HOST)\
-            .option("database", "combine")\
-            .option("collection", "record").save()
+        # set dbdm to True in DB
+        write_field_updates(self.spark, update_dbdm_df.select('_id').rdd.map(
+            lambda row: (row._id, 'dbdm', True)))
 
 
 ####################################################################
@@ -2031,7 +2676,7 @@ class CombineStateIOImport(CombineStateIO):
                 orig_id_rdd = json_lines_rdd.map(lambda row: parser_udf(row))
 
                 # to dataframe for join
-                orig_id_df = orig_id_rdd.toDF()
+                orig_id_df = self.spark.createDataFrame(orig_id_rdd, schema=id_json_schema)
 
                 # retrieve newly written records for this Job
                 pipeline = json.dumps(
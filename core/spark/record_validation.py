@@ -6,17 +6,20 @@ import json
 from lxml import etree, isoschematron
 import os
 import sys
-from types import ModuleType
+import time
 
-# import Row from pyspark
-from pyspark.sql import Row
+# import from pyspark
 import pyspark.sql.functions as pyspark_sql_functions
 
 # import from core.spark
 try:
-    from utils import PythonUDFRecord, refresh_django_db_connection
+    from utils import PythonUDFRecord, refresh_django_db_connection, compiled_artifacts, load_python_module, \
+        write_field_updates
+    from schemas import validation_failure_schema, es_id_schema
 except:
-    from core.spark.utils import PythonUDFRecord, refresh_django_db_connection
+    from core.spark.utils import PythonUDFRecord, refresh_django_db_connection, compiled_artifacts, \
+        load_python_module, write_field_updates
+    from core.spark.schemas import validation_failure_schema, es_id_schema
 
 # pylint: disable=wrong-import-position
 # init django settings file to retrieve settings
@@ -53,6 +56,265 @@ class ErrorValidator():
         return tree
 
 
+def validation_failure_row(row, job_id, vs_id, vs_name, results_payload, fail_count):
+    """
+    Return tuple of validation failure, ordered per validation_failure_schema
+    """
+
+    return (
+        int(fail_count),
+        int(job_id),
+        row._id,
+        row.record_id,
+        results_payload,
+        False,
+        int(vs_id),
+        vs_name
+    )
+
+
+class SchematronRecordValidator():
+    """
+    Validate parsed records against Schematron scenario
+    """
+
+    exception_message = 'Schematron validation exception: %s'
+
+    def __init__(self, scenario, err=None):
+
+        # report error compiling schematron as failure of every record
+        if err is not None:
+            self.validator = ErrorValidator(err)
+            return
+
+        # parse schematron
+        sct_doc = etree.parse(scenario['filepath'])
+        self.validator = isoschematron.Schematron(sct_doc, store_report=True)
+
+    def validate(self, record_xml, prvb):
+
+        # validate
+        if self.validator.validate(record_xml):
+            return None
+
+        # get failed
+        report_root = self.validator.validation_report.getroot()
+        fails = report_root.findall('svrl:failed-assert', namespaces=report_root.nsmap)
+        return {
+            'fail_count': len(fails),
+            'failed': [fail.find('svrl:text', namespaces=fail.nsmap).text for fail in fails]
+        }
+
+
+class XSDRecordValidator():
+    """
+    Validate parsed records against XML Schema scenario
+    """
+
+    exception_message = 'XSD validation exception: %s'
+
+    def __init__(self, scenario):
+
+        # parse xsd
+        xmlschema_doc = etree.parse(scenario['filepath'])
+        self.xmlschema = etree.XMLSchema(xmlschema_doc)
+
+    def validate(self, record_xml, prvb):
+
+        try:
+            self.xmlschema.assertValid(record_xml)
+        except etree.DocumentInvalid as e:
+            return {
+                'fail_count': 1,
+                'failed': [str(e)]
+            }
+        return None
+
+
+class PythonRecordValidator():
+    """
+    Validate records with test functions from python scenario payload
+    """
+
+    exception_message = 'Python validation exception: %s'
+
+    def __init__(self, scenario):
+
+        # parse user defined functions from validation scenario payload
+        temp_pyvs = load_python_module('temp_pyvs', scenario['payload'])
+
+        # get defined functions, with test messages
+        self.pyvs_funcs = []
+        test_labeled_attrs = [attr for attr in dir(temp_pyvs) if attr.lower().startswith('test')]
+        for attr in test_labeled_attrs:
+            attr = getattr(temp_pyvs, attr)
+            if isfunction(attr):
+                t_msg = signature(attr).parameters['test_message'].default
+                self.pyvs_funcs.append((attr, t_msg))
+
+    def validate(self, record_xml, prvb):
+
+        # prepare results_dict
+        results_dict = {
+            'fail_count': 0,
+            'failed': []
+        }
+
+        # loop through functions
+        for func, t_msg in self.pyvs_funcs:
+
+            # attempt to run user-defined validation function
+            try:
+
+                # run test, if fail, append test message
+                if not func(prvb):
+                    results_dict['fail_count'] += 1
+                    results_dict['failed'].append(t_msg)
+
+            # if problem, report as failure with Exception string
+            except Exception as e:
+                results_dict['fail_count'] += 1
+                results_dict['failed'].append("test '%s' had exception: %s" % (func.__name__, str(e)))
+
+        # if failed, return results
+        if results_dict['fail_count'] > 0:
+            return results_dict
+        return None
+
+
+class RecordValidationEngine():
+    """
+    Run Schematron, XSD, and python validation scenarios against records in a single pass
+        - each document is parsed once, and the parsed tree shared by all scenarios
+        - python scenarios run last, as test functions receive the shared tree
+        - scenarios are shipped to executors as a broadcast variable, and validators compiled
+        once per executor per scenario version, see utils.CompiledArtifactCache
+        - time spent and failures per scenario are collected with accumulators
+    """
+
+    validators = {
+        'sch': SchematronRecordValidator,
+        'xsd': XSDRecordValidator,
+        'python': PythonRecordValidator
+    }
+    validation_types = list(validators.keys())
+
+    def __init__(self, spark, validation_scenarios):
+        """
+        Args:
+                spark (pyspark.sql.session.SparkSession): spark instance
+                validation_scenarios (list): ValidationScenario instances of type sch, xsd, or python
+        """
+
+        # serializable scenario details, ordered so python scenarios run last
+        scenarios = [{
+            'id': vs.id,
+            'name': vs.name,
+            'validation_type': vs.validation_type,
+            'filepath': vs.filepath,
+            'payload': vs.payload,
+            'payload_hash': compiled_artifacts.content_hash('%s%s' % (vs.filepath, vs.payload))
+        } for vs in sorted(validation_scenarios, key=lambda vs: vs.validation_type == 'python')]
+        self.scenarios_bc = spark.sparkContext.broadcast(scenarios)
+
+        # scenario ids and names, for driver side reporting
+        self.scenarios = [{'id': scenario['id'], 'name': scenario['name']} for scenario in scenarios]
+
+        # per scenario accumulators
+        self.seconds_accs = {scenario['id']: spark.sparkContext.accumulator(0.0) for scenario in self.scenarios}
+        self.failures_accs = {scenario['id']: spark.sparkContext.accumulator(0) for scenario in self.scenarios}
+
+    @property
+    def scenario_names(self):
+        return [scenario['name'] for scenario in self.scenarios]
+
+    def validate_partition(self, pt):
+        """
+        Validate partition of records against all scenarios, yielding validation failure tuples
+        """
+
+        # retrieve compiled validators from executor cache
+        validators = []
+        for scenario in self.scenarios_bc.value:
+            validator_class = self.validators[scenario['validation_type']]
+            try:
+                validator = compiled_artifacts.get(
+                    scenario['validation_type'],
+                    scenario['payload_hash'],
+                    lambda: validator_class(scenario))
+
+            # compile errors are not cached, such that later partitions and Jobs compile again
+            except Exception as err:
+                if validator_class is not SchematronRecordValidator:
+                    raise
+                validator = SchematronRecordValidator(scenario, err=err)
+            validators.append((scenario, validator))
+
+        # local timers and failure counts, added to accumulators when partition complete
+        seconds = {scenario['id']: 0.0 for scenario in self.scenarios}
+        failures = {scenario['id']: 0 for scenario in self.scenarios}
+
+        for row in pt:
+
+            # parse document once
+            try:
+                record_xml = etree.fromstring(row.document.encode('utf-8'))
+                parse_err = None
+            except Exception as err:
+                record_xml = None
+                parse_err = err
+            prvb = None
+
+            for scenario, validator in validators:
+
+                stime = time.time()
+                try:
+
+                    # python scenarios receive PythonUDFRecord of shared tree
+                    if scenario['validation_type'] == 'python':
+                        if prvb is None:
+                            prvb = PythonUDFRecord(row, xml=record_xml)
+                        results_dict = validator.validate(record_xml, prvb)
+
+                    # report unparsable documents as exceptions
+                    elif parse_err is not None:
+                        raise parse_err
+
+                    else:
+                        results_dict = validator.validate(record_xml, prvb)
+
+                except Exception as e:
+                    results_dict = {
+                        'fail_count': 1,
+                        'failed': [validator.exception_message % str(e)]
+                    }
+                seconds[scenario['id']] += time.time() - stime
+
+                # if failed, yield failure
+                if results_dict is not None:
+                    failures[scenario['id']] += 1
+                    yield validation_failure_row(row, row.job_id, scenario['id'], scenario['name'],
+                                                 json.dumps(results_dict), results_dict['fail_count'])
+
+        # update accumulators
+        for scenario in self.scenarios:
+            self.seconds_accs[scenario['id']].add(seconds[scenario['id']])
+            self.failures_accs[scenario['id']].add(failures[scenario['id']])
+
+    def get_timings(self):
+        """
+        Return seconds spent, and failures found, per scenario, once validation has run
+
+        Returns:
+                (dict): keyed by scenario name
+        """
+
+        return {scenario['name']: {
+            'seconds': self.seconds_accs[scenario['id']].value,
+            'failures': self.failures_accs[scenario['id']].value
+        } for scenario in self.scenarios}
+
+
 class ValidationScenarioSpark():
     """
     Class to organize methods and attributes used for running validation scenarios
@@ -75,6 +337,7 @@ class ValidationScenarioSpark():
         self.job = job
         self.records_df = records_df
         self.validation_scenarios = validation_scenarios
+        self.scenario_timings = {}
 
         # init logging support
         spark.sparkContext.setLogLevel('INFO')
@@ -88,7 +351,12 @@ class ValidationScenarioSpark():
 
         Validation tests may be of type:
                 - 'sch': Schematron based validation, performed with lxml etree
+                - 'xsd': XML Schema based validation, performed with lxml etree
                 - 'python': custom python code snippets
+                - 'es_query': ElasticSearch DSL queries
+
+        Schematron, XSD, and python scenarios are run together in a single pass over records, parsing
+        each document once, see RecordValidationEngine.  ElasticSearch query scenarios are run separately.
 
         Args:
                 None
@@ -101,45 +369,44 @@ class ValidationScenarioSpark():
         # refresh Django DB Connection
         refresh_django_db_connection()
 
-        # loop through validation scenarios and fire validation type specific method
-        failure_rdds = []
+        # sort validation scenarios by those run against documents, and es_query
+        record_scenarios = []
+        es_query_scenarios = []
         for vs_id in self.validation_scenarios:
-
-            # get validation scenario
             vs = ValidationScenario.objects.get(pk=int(vs_id))
-            vs_id = vs.id
-            vs_name = vs.name
-            vs_filepath = vs.filepath
-
-            # schematron based validation scenario
-            if vs.validation_type == 'sch':
-                validation_fails_rdd = self._sch_validation(
-                    vs, vs_id, vs_name, vs_filepath)
-
-            # python based validation scenario
-            elif vs.validation_type == 'python':
-                validation_fails_rdd = self._python_validation(
-                    vs, vs_id, vs_name, vs_filepath)
-
-            # ElasticSearch DSL query based validation scenario
-            elif vs.validation_type == 'es_query':
-                validation_fails_rdd = self._es_query_validation(
-                    vs, vs_id, vs_name, vs_filepath)
-
-            # XML Schema (XSD) based validation scenario
-            elif vs.validation_type == 'xsd':
-                validation_fails_rdd = self._xsd_validation(
-                    vs, vs_id, vs_name, vs_filepath)
-
-            # if results, append
-            if validation_fails_rdd and not validation_fails_rdd.isEmpty():
+            if vs.validation_type == 'es_query':
+                es_query_scenarios.append(vs)
+            elif vs.validation_type in RecordValidationEngine.validation_types:
+                record_scenarios.append(vs)
+
+        # collect failure rdds
+        failure_rdds = []
+
+        # single pass for document based scenarios
+        engine = None
+        if len(record_scenarios) > 0:
+            engine = RecordValidationEngine(self.spark, record_scenarios)
+            self.logger.info('running validation scenarios in single pass: %s' % engine.scenario_names)
+            failure_rdds.append(self.records_df.rdd.mapPartitions(engine.validate_partition))
+
+        # ElasticSearch DSL query based validation scenarios
+        for vs in es_query_scenarios:
+            validation_fails_rdd = self._es_query_validation(vs, vs.id, vs.name, vs.filepath)
+            if validation_fails_rdd:
                 failure_rdds.append(validation_fails_rdd)
 
         # if rdds, union and write
         if len(failure_rdds) > 0:
-            # merge rdds
-            failures_union_rdd = self.spark.sparkContext.union(failure_rdds)
-            failures_df = failures_union_rdd.toDF()
+
+            # merge rdds, counting failures as written
+            fail_count_acc = self.spark.sparkContext.accumulator(0)
+
+            def count_failure(row):
+                fail_count_acc.add(1)
+                return row
+
+            failures_union_rdd = self.spark.sparkContext.union(failure_rdds).map(count_failure)
+            failures_df = self.spark.createDataFrame(failures_union_rdd, schema=validation_failure_schema)
 
             # write failures
             failures_df.write.format("com.mongodb.spark.sql.DefaultSource")\
@@ -148,186 +415,17 @@ class ValidationScenarioSpark():
                 .option("database", "combine")\
                 .option("collection", "record_validation").save()
 
-            # update validity for Job
-            self.update_job_record_validity()
+            # report per scenario timings, and save to job details
+            if engine:
+                self.scenario_timings = engine.get_timings()
+                for vs_name, timing in self.scenario_timings.items():
+                    self.logger.info('validation scenario %s: %.3fs, %s failures' %
+                                     (vs_name, timing['seconds'], timing['failures']))
+                self.job.update_job_details({'validation_timings': self.scenario_timings})
 
-    def _sch_validation(self, vs, vs_id, vs_name, vs_filepath):
-
-        self.logger.info('running schematron validation: %s' % vs.name)
-
-        def validate_schematron_pt_udf(pt):
-
-            try:
-                # parse schematron
-                sct_doc = etree.parse(vs_filepath)
-                validator = isoschematron.Schematron(sct_doc, store_report=True)
-            except Exception as err:
-                validator = ErrorValidator(err)
-
-            for row in pt:
-
-                try:
-
-                    # get document xml
-                    record_xml = etree.fromstring(row.document.encode('utf-8'))
-
-                    # validate
-                    is_valid = validator.validate(record_xml)
-
-                    # if not valid, prepare Row
-                    if not is_valid:
-
-                        # prepare results_dict
-                        results_dict = {
-                            'fail_count': 0,
-                            'failed': []
-                        }
-
-                        # get failed
-                        report_root = validator.validation_report.getroot()
-                        fails = report_root.findall(
-                            'svrl:failed-assert', namespaces=report_root.nsmap)
-
-                        # log fail_count
-                        results_dict['fail_count'] = len(fails)
-
-                        # loop through fails and add to dictionary
-                        for fail in fails:
-                            fail_text_elem = fail.find(
-                                'svrl:text', namespaces=fail.nsmap)
-                            results_dict['failed'].append(fail_text_elem.text)
-
-                        yield Row(
-                            record_id=row._id,
-                            record_identifier=row.record_id,
-                            job_id=row.job_id,
-                            validation_scenario_id=int(vs_id),
-                            validation_scenario_name=vs_name,
-                            valid=False,
-                            results_payload=json.dumps(results_dict),
-                            fail_count=results_dict['fail_count']
-                        )
-
-                except Exception as e:
-
-                    results_dict = {
-                        'fail_count': 0,
-                        'failed': []
-                    }
-                    results_dict['fail_count'] += 1
-                    results_dict['failed'].append(
-                        "Schematron validation exception: %s" % (str(e)))
-
-                    yield Row(
-                        record_id=row._id,
-                        record_identifier=row.record_id,
-                        job_id=row.job_id,
-                        validation_scenario_id=int(vs_id),
-                        validation_scenario_name=vs_name,
-                        valid=False,
-                        results_payload=json.dumps(results_dict),
-                        fail_count=results_dict['fail_count']
-                    )
-
-        # run pt_udf map
-        validation_fails_rdd = self.records_df.rdd.mapPartitions(validate_schematron_pt_udf).filter(
-            lambda row: row is not None)
-
-        # return
-        return validation_fails_rdd
-
-    def _python_validation(self, vs, vs_id, vs_name, vs_filepath):
-
-        self.logger.info('running python validation: %s' % vs.name)
-
-        def validate_python_udf(vs_id, vs_name, pyvs_funcs, row):
-            """
-            Loop through test functions and aggregate in fail_dict to return with Row
-
-            Args:
-                    vs_id (int): integer of validation scenario
-                    pyvs_funcs (list): list of functions imported from user created python validation scenario payload
-                    row ():
-            """
-
-            # prepare row as parsed document with PythonUDFRecord class
-            prvb = PythonUDFRecord(row)
-
-            # prepare results_dict
-            results_dict = {
-                'fail_count': 0,
-                'failed': []
-            }
-
-            # loop through functions
-            for func in pyvs_funcs:
-
-                # get name as string
-                func_name = func.__name__
-
-                # get func test message
-                func_signature = signature(func)
-                t_msg = func_signature.parameters['test_message'].default
-
-                # attempt to run user-defined validation function
-                try:
-
-                    # run test
-                    test_result = func(prvb)
-
-                    # if fail, append
-                    if not test_result:
-
-                        # bump fail count
-                        results_dict['fail_count'] += 1
-
-                        # if custom message override provided, use
-                        if test_result:
-                            results_dict['failed'].append(test_result)
-
-                        # else, default to test message
-                        else:
-                            results_dict['failed'].append(t_msg)
-
-                # if problem, report as failure with Exception string
-                except Exception as e:
-                    results_dict['fail_count'] += 1
-                    results_dict['failed'].append(
-                        "test '%s' had exception: %s" % (func_name, str(e)))
-
-            # if failed, return Row
-            if results_dict['fail_count'] > 0:
-                # return row
-                return Row(
-                    record_id=row._id,
-                    record_identifier=row.record_id,
-                    job_id=row.job_id,
-                    validation_scenario_id=int(vs_id),
-                    validation_scenario_name=vs_name,
-                    valid=False,
-                    results_payload=json.dumps(results_dict),
-                    fail_count=results_dict['fail_count']
-                )
-
-        # parse user defined functions from validation scenario payload
-        temp_pyvs = ModuleType('temp_pyvs')
-        exec(vs.payload, temp_pyvs.__dict__)
-
-        # get defined functions
-        pyvs_funcs = []
-        test_labeled_attrs = [attr for attr in dir(
-            temp_pyvs) if attr.lower().startswith('test')]
-        for attr in test_labeled_attrs:
-            attr = getattr(temp_pyvs, attr)
-            if isfunction(attr):
-                pyvs_funcs.append(attr)
-
-        validation_fails_rdd = self.records_df.rdd.\
-            map(lambda row: validate_python_udf(vs_id, vs_name, pyvs_funcs, row))\
-            .filter(lambda row: row is not None)
-
-        # return
-        return validation_fails_rdd
+            # update validity for Job, if failures were written
+            if fail_count_acc.value > 0:
+                self.update_job_record_validity()
 
     def _es_query_validation(self, vs, vs_id, vs_name, vs_filepath):
 
@@ -363,7 +461,7 @@ class ValidationScenarioSpark():
 
             # if query is not empty, map to DataFrame
             if not es_rdd.isEmpty():
-                es_df = es_rdd.map(lambda row: (row[1]['db_id'], )).toDF()
+                es_df = self.spark.createDataFrame(es_rdd.map(lambda row: (row[1]['db_id'], )), schema=es_id_schema)
 
             # handle validity matching
             # NOTE: matching on records_df['_id']['oid'] to get str cast of Mongo ObjectId
@@ -416,87 +514,12 @@ class ValidationScenarioSpark():
 
             # write return failures as validation_fails_rdd
             job_id = self.job.id
-            validation_fails_rdd = new_df.rdd.map(lambda row: Row(
-                record_id=row._id,
-                record_identifier=row.record_id,
-                job_id=job_id,
-                validation_scenario_id=int(vs_id),
-                validation_scenario_name=vs_name,
-                valid=False,
-                results_payload=row.data,
-                fail_count=int(row['fail_count']))
-            )
+            validation_fails_rdd = new_df.rdd.map(lambda row: validation_failure_row(
+                row, job_id, vs_id, vs_name, row.data, row['fail_count']))
             return validation_fails_rdd
 
         return None
 
-    def _xsd_validation(self, vs, vs_id, vs_name, vs_filepath):
-
-        self.logger.info('running xsd validation: %s' % vs.name)
-
-        def validate_xsd_pt_udf(pt):
-
-            # parse xsd
-            xmlschema_doc = etree.parse(vs_filepath)
-            xmlschema = etree.XMLSchema(xmlschema_doc)
-
-            for row in pt:
-
-                try:
-
-                    # get document xml
-                    record_xml = etree.fromstring(row.document.encode('utf-8'))
-
-                    # validate
-                    try:
-                        xmlschema.assertValid(record_xml)
-
-                    except etree.DocumentInvalid as e:
-
-                        # prepare results_dict
-                        results_dict = {
-                            'fail_count': 1,
-                            'failed': [str(e)]
-                        }
-
-                        yield Row(
-                            record_id=row._id,
-                            record_identifier=row.record_id,
-                            job_id=row.job_id,
-                            validation_scenario_id=int(vs_id),
-                            validation_scenario_name=vs_name,
-                            valid=False,
-                            results_payload=json.dumps(results_dict),
-                            fail_count=results_dict['fail_count']
-                        )
-
-                except Exception as e:
-
-                    results_dict = {
-                        'fail_count': 1,
-                        'failed': []
-                    }
-                    results_dict['failed'].append(
-                        "XSD validation exception: %s" % (str(e)))
-
-                    yield Row(
-                        record_id=row._id,
-                        record_identifier=row.record_id,
-                        job_id=row.job_id,
-                        validation_scenario_id=int(vs_id),
-                        validation_scenario_name=vs_name,
-                        valid=False,
-                        results_payload=json.dumps(results_dict),
-                        fail_count=results_dict['fail_count']
-                    )
-
-        # run pt_udf map
-        validation_fails_rdd = self.records_df.rdd.mapPartitions(validate_xsd_pt_udf).filter(
-            lambda row: row is not None)
-
-        # return
-        return validation_fails_rdd
-
     def remove_validation_scenarios(self):
         """
         Method to update validity attribute of records after removal of validation scenarios
@@ -512,26 +535,20 @@ class ValidationScenarioSpark():
             .option("collection", "record_validation")\
             .option("pipeline", failures_pipeline).load()
 
-        # if failures to work with, rewrite records with valid = True if NOT in remaining DB failures
+        # if failures to work with, set valid = True for records NOT in remaining DB failures
         if not failures_df.rdd.isEmpty():
             set_valid_df = self.records_df.alias('records_df').join(
                 failures_df.select(
                     'record_id').distinct().alias('failures_df'),
                 failures_df['record_id'] == self.records_df['_id'],
                 'leftanti')\
-                .select(self.records_df.columns)\
-                .withColumn('valid', pyspark_sql_functions.lit(True))
+                .select('_id')
         else:
-            # will write all previously invalid, as valid
-            set_valid_df = self.records_df.withColumn(
-                'valid', pyspark_sql_functions.lit(True))
+            # will set all previously invalid, as valid
+            set_valid_df = self.records_df.select('_id')
 
         # update validity of Records
-        set_valid_df.write.format("com.mongodb.spark.sql.DefaultSource")\
-            .mode("append")\
-            .option("uri", "mongodb://%s" % settings.MONGO_HOST)\
-            .option("database", "combine")\
-            .option("collection", "record").save()
+        write_field_updates(self.spark, set_valid_df.rdd.map(lambda row: (row._id, 'valid', True)))
 
     def update_job_record_validity(self):
         """
@@ -562,17 +579,12 @@ class ValidationScenarioSpark():
                                                 pyspark_sql_functions.when(fail_join['fail_id'].isNotNull(),
                                                                            False).otherwise(True))
 
-        # subset those that need updating and flip validity
+        # subset those that need updating
         to_update = updated_validity.where(updated_validity['valid'] != updated_validity['update_valid'])\
-            .select(self.records_df.columns)\
-            .withColumn('valid', pyspark_sql_functions.when(self.records_df.valid == True, False).otherwise(True))
+            .select('_id', 'update_valid')
 
-        # update in DB by overwriting
-        to_update.write.format("com.mongodb.spark.sql.DefaultSource")\
-            .mode("append")\
-            .option("uri", "mongodb://%s" % settings.MONGO_HOST)\
-            .option("database", "combine")\
-            .option("collection", "record").save()
+        # update validity in DB
+        write_field_updates(self.spark, to_update.rdd.map(lambda row: (row._id, 'valid', row.update_valid)))
 
     def export_job_validation_report(self):
 
@@ -0,0 +1,86 @@
+"""
+Registry of explicit StructType schemas for DataFrames created from RDDs in core.spark
+
+Passing a schema to createDataFrame() avoids Spark sampling or scanning RDDs to infer types, which
+runs extra jobs and lets column types drift with the data.  Rows are built as tuples ordered per schema,
+as pyspark Row(**kwargs) sorts fields by name.
+"""
+
+# pyspark imports
+from pyspark.sql.types import BooleanType, IntegerType, LongType, StringType, StructField, StructType
+
+
+# Combine records, as written to DB and avro, see jobs.CombineRecordSchema
+combine_record_schema = StructType([
+    StructField('combine_id', StringType(), True),
+    StructField('record_id', StringType(), True),
+    StructField('document', StringType(), True),
+    StructField('error', StringType(), True),
+    StructField('unique', BooleanType(), True),
+    StructField('job_id', IntegerType(), False),
+    StructField('oai_set', StringType(), True),
+    StructField('success', BooleanType(), False),
+    StructField('fingerprint', LongType(), False),
+    StructField('transformed', BooleanType(), False),
+    StructField('valid', BooleanType(), False),
+    StructField('dbdm', BooleanType(), False)
+])
+
+# records parsed by static XML and tabular data harvests, before fingerprinting
+harvested_record_schema = StructType([
+    StructField('record_id', StringType(), True),
+    StructField('document', StringType(), True),
+    StructField('error', StringType(), True),
+    StructField('job_id', IntegerType(), False),
+    StructField('oai_set', StringType(), True),
+    StructField('success', BooleanType(), True)
+])
+
+# records returned by transformations, `fingerprint` carrying the input Record fingerprint through
+transformed_record_schema = StructType([
+    StructField('combine_id', StringType(), True),
+    StructField('record_id', StringType(), True),
+    StructField('document', StringType(), True),
+    StructField('error', StringType(), True),
+    StructField('job_id', IntegerType(), False),
+    StructField('oai_set', StringType(), True),
+    StructField('success', BooleanType(), True),
+    StructField('fingerprint', LongType(), True),
+    StructField('transformed', BooleanType(), True)
+])
+
+# RecordValidation failures, see record_validation.validation_failure_row()
+validation_failure_schema = StructType([
+    StructField('fail_count', LongType(), True),
+    StructField('job_id', LongType(), True),
+    StructField('record_id', StructType([StructField('oid', StringType(), True)]), True),
+    StructField('record_identifier', StringType(), True),
+    StructField('results_payload', StringType(), True),
+    StructField('valid', BooleanType(), True),
+    StructField('validation_scenario_id', LongType(), True),
+    StructField('validation_scenario_name', StringType(), True)
+])
+
+# ElasticSearch index mapping failures
+mapping_failure_schema = StructType([
+    StructField('db_id', StringType(), True),
+    StructField('record_id', StringType(), True),
+    StructField('mapping_error', StringType(), True)
+])
+
+# single column of ElasticSearch document or Record DB ids, named as inferred for tuples
+es_id_schema = StructType([
+    StructField('_1', StringType(), True)
+])
+
+# Record DB ids with mapped fields as JSON, see jobs.CombineStateIOImport
+id_json_schema = StructType([
+    StructField('_1', StringType(), True),
+    StructField('_2', StringType(), True)
+])
+
+# Record DB ids with DPLA isShownAt of mapped fields, see jobs.CombineSparkJob.dpla_bulk_data_compare()
+dpla_isshownat_schema = StructType([
+    StructField('db_id', StringType(), True),
+    StructField('dpla_isShownAt', StringType(), True)
+])
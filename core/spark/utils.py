@@ -1,8 +1,19 @@
 # generic imports
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import django
+import hashlib
+import json
 from lxml import etree
 import os
+import queue
+import sickle
+from sickle.oaiexceptions import NoRecordsMatch
 import sys
+import threading
+import time
+from types import ModuleType
+from urllib.parse import urljoin
 
 # pylint: disable=wrong-import-position
 # check for registered apps signifying readiness, if not, run django.setup() to run as standalone
@@ -38,16 +49,641 @@ def refresh_django_db_connection():
     connection.connect()
 
 
+class CompiledArtifactCache():
+    """
+    Least recently used cache of compiled artifacts -- XSLT, XSD, Schematron, python payloads -- keyed on
+    artifact type and content hash
+
+    The module level instance, `compiled_artifacts`, lives as long as the python worker process on a Spark
+    executor, such that artifacts are compiled once per executor per version, and reused across partitions
+    and Jobs in the same Livy session.
+    """
+
+    def __init__(self, maxsize=32):
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._artifacts = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(content):
+        """
+        Return sha1 hexdigest of str or bytes content
+        """
+
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return hashlib.sha1(content).hexdigest()
+
+    def get(self, artifact_type, content_hash, compile_func, evict_func=None):
+        """
+        Return compiled artifact, compiling and caching if not present
+
+        Args:
+            artifact_type (str): type of artifact, e.g. 'xsd'
+            content_hash (str): hash of content artifact is compiled from, see content_hash()
+            compile_func (callable): returns compiled artifact, exceptions are not cached
+            evict_func (callable): optional, passed artifact when evicted from cache
+
+        Returns:
+            compiled artifact
+        """
+
+        key = (artifact_type, content_hash)
+        with self._lock:
+            if key in self._artifacts:
+                self._artifacts.move_to_end(key)
+                self.hits += 1
+                return self._artifacts[key][0]
+
+        # compile outside of lock
+        artifact = compile_func()
+
+        evicted = []
+        with self._lock:
+            self.misses += 1
+            self._artifacts[key] = (artifact, evict_func)
+            while len(self._artifacts) > self.maxsize:
+                evicted.append(self._artifacts.popitem(last=False)[1])
+
+        # run evict functions for artifacts removed
+        self._evict(evicted)
+
+        return artifact
+
+    def clear(self):
+        """
+        Remove all artifacts, running evict functions
+        """
+
+        with self._lock:
+            evicted = list(self._artifacts.values())
+            self._artifacts.clear()
+        self._evict(evicted)
+
+    @staticmethod
+    def _evict(evicted):
+
+        for evicted_artifact, evicted_func in evicted:
+            if evicted_func is not None:
+                try:
+                    evicted_func(evicted_artifact)
+                except Exception:
+                    pass
+
+
+def load_python_module(name, payload):
+    """
+    Return module with python code payload executed in its namespace
+    """
+
+    module = ModuleType(name)
+    exec(payload, module.__dict__)
+    return module
+
+
+class XSLIncludeCache():
+    """
+    Content-addressed cache of XSL stylesheets included over HTTP, under settings.BINARY_STORAGE
+        - stylesheets are written as <sha1>.xsl, such that a cached path always serves the same content
+        - index.json maps include URLs to the hash of the content last fetched
+        - populated by Transformation._rewrite_xsl_http_includes() when Transformations are saved,
+        read by LocalXSLResolver when compiling
+    """
+
+    def __init__(self, cache_dir=None):
+
+        if cache_dir is None:
+            cache_dir = '%s/transformations/includes' % settings.BINARY_STORAGE.rstrip('/').split('file://')[-1]
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, 'index.json')
+
+    def get_index(self):
+
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def path(self, content_hash):
+
+        return os.path.join(self.cache_dir, '%s.xsl' % content_hash)
+
+    def lookup(self, url):
+        """
+        Return path of cached stylesheet for include URL, or None if not cached
+        """
+
+        content_hash = self.get_index().get(url)
+        if content_hash is not None and os.path.isfile(self.path(content_hash)):
+            return self.path(content_hash)
+        return None
+
+    def add(self, url, content):
+        """
+        Write stylesheet content to cache, and index under include URL
+
+        Args:
+            url (str): include URL
+            content (bytes): stylesheet
+
+        Returns:
+            (str): path of cached stylesheet
+        """
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        content_hash = CompiledArtifactCache.content_hash(content)
+        filepath = self.path(content_hash)
+        if not os.path.isfile(filepath):
+            self._write(filepath, content)
+        index = self.get_index()
+        if index.get(url) != content_hash:
+            index[url] = content_hash
+            self._write(self.index_path, json.dumps(index, indent=2, sort_keys=True).encode('utf-8'))
+        return filepath
+
+    @staticmethod
+    def _write(filepath, content):
+
+        # write atomically, as executors may read concurrently
+        temp_filepath = '%s.%s.tmp' % (filepath, os.getpid())
+        with open(temp_filepath, 'wb') as f:
+            f.write(content)
+        os.replace(temp_filepath, filepath)
+
+
+class LocalXSLResolver(etree.Resolver):
+    """
+    Resolve xsl:include and xsl:import hrefs to stylesheets on local disk, never the network
+        - absolute file paths, as written by Transformation._rewrite_xsl_http_includes() and
+        save_transformation_to_disk(), are read directly
+        - HTTP hrefs are served from XSLIncludeCache
+        - other hrefs are looked up by filename in include directories, defaulting to
+        the transformations directory under settings.BINARY_STORAGE
+        - unresolved hrefs fail to load, as network reads are denied, see compile_xslt()
+    """
+
+    def __init__(self, include_dirs=None, include_cache=None):
+
+        super().__init__()
+        if include_dirs is None:
+            include_dirs = ['%s/transformations' % settings.BINARY_STORAGE.rstrip('/').split('file://')[-1]]
+        self.include_dirs = include_dirs
+        self.include_cache = include_cache or XSLIncludeCache()
+
+    def resolve(self, url, pubid, context):
+
+        path = self.resolve_path(url)
+        if path is not None:
+            return self.resolve_filename(path, context)
+        return None
+
+    def resolve_path(self, url):
+        """
+        Return local path of stylesheet for include or import href, or None if unresolved
+        """
+
+        if url.lower().startswith('http'):
+            cached_path = self.include_cache.lookup(url)
+            if cached_path is not None:
+                return cached_path
+        path = url.split('file://')[-1]
+        if os.path.isabs(path) and os.path.isfile(path):
+            return path
+        for include_dir in self.include_dirs:
+            include_path = os.path.join(include_dir, os.path.basename(path))
+            if os.path.isfile(include_path):
+                return include_path
+        return None
+
+
+def compile_xslt(xslt_string, include_dirs=None, include_cache=None):
+    """
+    Return stylesheet compiled by lxml, includes and imports resolved with LocalXSLResolver
+        - stylesheets may not read from the network, write files, or create directories
+
+    Args:
+        xslt_string (str): XSLT stylesheet
+        include_dirs (list): optional, directories searched for includes and imports
+        include_cache (XSLIncludeCache): optional, cache of HTTP includes
+
+    Returns:
+        (lxml.etree.XSLT)
+    """
+
+    # relative hrefs are resolved against first include directory
+    resolver = LocalXSLResolver(include_dirs=include_dirs, include_cache=include_cache)
+    base_url = os.path.join(resolver.include_dirs[0], '') if resolver.include_dirs else None
+    parser = etree.XMLParser(no_network=True)
+    parser.resolvers.add(resolver)
+    xslt_tree = etree.fromstring(xslt_string.encode('utf-8'), parser, base_url=base_url)
+    access_control = etree.XSLTAccessControl(
+        read_network=False, write_file=False, create_dir=False, write_network=False)
+    return etree.XSLT(xslt_tree, access_control=access_control)
+
+
+def xsl_include_hashes(xslt_string, include_dirs=None, include_cache=None):
+    """
+    Return content hashes of stylesheets included or imported by XSLT stylesheet, nested ones in turn,
+    as resolved by LocalXSLResolver, such that changes to included stylesheets are detected
+
+    Args:
+        xslt_string (str): XSLT stylesheet
+        include_dirs (list): optional, directories searched for includes and imports
+        include_cache (XSLIncludeCache): optional, cache of HTTP includes
+
+    Returns:
+        (list): [href, sha1 hexdigest or None if unresolved], in document order
+    """
+
+    resolver = LocalXSLResolver(include_dirs=include_dirs, include_cache=include_cache)
+    base_url = os.path.join(resolver.include_dirs[0], '') if resolver.include_dirs else ''
+    include_hashes = []
+
+    def walk(xsl_bytes, base, seen):
+        try:
+            xsl = etree.fromstring(xsl_bytes)
+        except etree.XMLSyntaxError:
+            return
+        namespaces = {'xsl':'http://www.w3.org/1999/XSL/Transform'}
+        for include in xsl.xpath('//xsl:include|//xsl:import', namespaces=namespaces):
+            href = include.attrib.get('href', '')
+            path = resolver.resolve_path(urljoin(base, href))
+            if path is None:
+                include_hashes.append([href, None])
+                continue
+            with open(path, 'rb') as f:
+                include_bytes = f.read()
+            include_hashes.append([href, CompiledArtifactCache.content_hash(include_bytes)])
+            if path not in seen:
+                walk(include_bytes, path, seen | {path})
+
+    walk(xslt_string.encode('utf-8'), base_url, set())
+    return include_hashes
+
+
+def select_xslt_engine(xslt_string, xslt_engine='auto'):
+    """
+    Return XSLT engine to transform with, 'lxml' or 'gateway'
+
+    For 'auto', lxml is used only when the stylesheet declares XSLT 1.0 and compiles with lxml,
+    as lxml (libxslt) runs XSLT 2.0 stylesheets in forwards-compatible mode, failing at runtime
+    on 2.0 functions, e.g. replace()
+
+    Args:
+        xslt_string (str): XSLT stylesheet
+        xslt_engine (str): Transformation.xslt_engine, 'auto', 'lxml', or 'gateway'
+
+    Returns:
+        (str)
+    """
+
+    if xslt_engine in ['lxml', 'gateway']:
+        return xslt_engine
+
+    try:
+        version = float(etree.fromstring(xslt_string.encode('utf-8')).attrib.get('version', '1.0'))
+        if version < 2.0:
+            compile_xslt(xslt_string)
+            return 'lxml'
+    except Exception:
+        pass
+    return 'gateway'
+
+
+class LatencyHistogram():
+    """
+    Histogram of latencies, counted in 0.1 millisecond buckets, that merges across partitions
+    when used as a Spark accumulator with LatencyHistogramParam
+    """
+
+    def __init__(self):
+
+        self.counts = {}
+
+    def add(self, seconds):
+
+        bucket = round(seconds * 1000, 1)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+
+    def merge(self, other):
+
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        return self
+
+    def percentiles(self, percentiles=(50, 90, 99)):
+        """
+        Return count, percentiles and max latency in milliseconds
+
+        Returns:
+            (dict): e.g. {'count':1000, 'p50':1.2, 'p90':3.4, 'p99':10.1, 'max':25.0}
+        """
+
+        total = sum(self.counts.values())
+        summary = {'count': total}
+        buckets = sorted(self.counts.items())
+        for percentile in percentiles:
+            summary['p%s' % percentile] = None
+            seen = 0
+            for bucket, count in buckets:
+                seen += count
+                if seen >= total * percentile / 100.0:
+                    summary['p%s' % percentile] = bucket
+                    break
+        summary['max'] = buckets[-1][0] if buckets else None
+        return summary
+
+
+class LatencyHistogramParam():
+    """
+    Spark AccumulatorParam for LatencyHistogram, duck typed as pyspark is not imported outside of Spark
+    """
+
+    def zero(self, value):
+
+        return LatencyHistogram()
+
+    def addInPlace(self, value1, value2):
+
+        return value1.merge(value2)
+
+
+class XSLTGatewayPool():
+    """
+    Pool of pyjxslt gateway connections, each with the stylesheet registered, transforming batches
+    of documents with concurrency bounded by the pool size
+        - each connection is used by one thread at a time
+        - kept per executor in compiled_artifacts, such that connections are reused across partitions
+        - the gateway is shared by all python workers on a host, so xslt_name should be unique to the pool,
+        see jobs.register_gateway_pool()
+        - where the stylesheet is unknown to the gateway, e.g. after the gateway restarts, it is registered
+        again and the document transformed once more
+        - 'ERROR: ...' strings returned by the gateway, e.g. for unparsable documents, are returned as errors
+    """
+
+    def __init__(self, xslt_name, xslt_string, size=4, gateway_factory=None):
+        """
+        Args:
+            xslt_name (str): name stylesheet is registered under
+            xslt_string (str): XSLT stylesheet
+            size (int): number of gateway connections, and concurrent transforms
+            gateway_factory (callable): optional, returns gateway connection, defaults to pyjxslt.Gateway(6767)
+        """
+
+        if gateway_factory is None:
+            import pyjxslt
+            gateway_factory = lambda: pyjxslt.Gateway(6767)
+
+        self.xslt_name = xslt_name
+        self.xslt_string = xslt_string
+        self.size = size
+        self._gateways = [gateway_factory() for _ in range(size)]
+        self._available = queue.Queue()
+        for gw in self._gateways:
+            gw.add_transform(xslt_name, xslt_string)
+            self._available.put(gw)
+        self._executor = ThreadPoolExecutor(max_workers=size)
+
+    def _register(self, gw):
+
+        try:
+            gw.add_transform(self.xslt_name, self.xslt_string)
+        except Exception:
+            # connection lost, reconnecting registers stylesheets known to the connection again
+            gw.reconnect()
+
+    def _transform(self, document):
+
+        gw = self._available.get()
+        stime = time.time()
+        try:
+
+            # pyjxslt returns None for unknown stylesheets, errors from the transform itself are Py4JJavaError,
+            # or returned as 'ERROR: ...' strings
+            try:
+                result = gw.transform(self.xslt_name, document)
+            except Exception as err:
+                if type(err).__name__ == 'Py4JJavaError':
+                    raise
+                result = None
+
+            # register again and retry once
+            if result is None:
+                self._register(gw)
+                result = gw.transform(self.xslt_name, document)
+                if result is None:
+                    raise Exception('stylesheet %s is not registered with pyjxslt gateway' % self.xslt_name)
+            if result.startswith('ERROR:'):
+                raise Exception(result)
+
+            return result, None, time.time() - stime
+        except Exception as err:
+            return None, err, time.time() - stime
+        finally:
+            self._available.put(gw)
+
+    def transform_many(self, documents, histogram=None):
+        """
+        Transform documents concurrently, returning results in input order
+
+        Args:
+            documents (list): XML strings
+            histogram (LatencyHistogram): optional, gateway latency of each transform is added
+
+        Returns:
+            (list): of tuples (result or None, exception or None)
+        """
+
+        results = []
+        for result, err, seconds in self._executor.map(self._transform, documents):
+            if histogram is not None:
+                histogram.add(seconds)
+            results.append((result, err))
+        return results
+
+    def close(self):
+        """
+        Drop registered stylesheet and shut down threads
+        """
+
+        for gw in self._gateways:
+            try:
+                gw.drop_transform(self.xslt_name)
+            except Exception:
+                pass
+        self._executor.shutdown(wait=False)
+
+
+def iter_batches(iterable, batch_size):
+    """
+    Yield lists of up to batch_size items from iterable
+    """
+
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def write_field_updates(spark, updates_rdd, collection='record', batch_size=1000):
+    """
+    Write field level updates to Mongo, as batched, unordered UpdateOne($set) bulk writes per partition
+        - alternative to appending whole documents with the Mongo Spark connector, when only flags change
+        - multiple updates for the same _id within a batch are merged into one $set
+
+    Args:
+        spark (pyspark.sql.session.SparkSession): spark instance
+        updates_rdd (pyspark.rdd.RDD): of (_id, field, value) tuples, where _id may be an ObjectId,
+            string, or Row with `oid` as read by the Mongo Spark connector
+        collection (str): Mongo collection in combine database
+        batch_size (int): number of documents updated per bulk write
+
+    Returns:
+        (int): count of documents modified
+    """
+
+    modified_acc = spark.sparkContext.accumulator(0)
+
+    def write_partition(pt):
+
+        from bson import ObjectId
+        from pymongo import MongoClient, UpdateOne
+
+        client = MongoClient(host=settings.MONGO_HOST, port=27017)
+        mc_collection = client.combine[collection]
+
+        def flush(batch):
+            result = mc_collection.bulk_write(
+                [UpdateOne({'_id':_id}, {'$set':fields}) for _id, fields in batch.items()], ordered=False)
+            modified_acc.add(result.modified_count)
+
+        batch = OrderedDict()
+        for _id, field, value in pt:
+            if hasattr(_id, 'oid'):
+                _id = _id.oid
+            if isinstance(_id, str):
+                _id = ObjectId(_id)
+            batch.setdefault(_id, {})[field] = value
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = OrderedDict()
+        if len(batch) > 0:
+            flush(batch)
+        client.close()
+
+    updates_rdd.foreachPartition(write_partition)
+    return modified_acc.value
+
+
+def oai_record_document(record_xml, include_oai_record_header=False):
+    """
+    Return OAI-PMH <record> element as string, or if excluding <header>, the single child of <metadata>
+
+    Args:
+        record_xml (lxml.etree._Element): OAI-PMH <record> element
+        include_oai_record_header (bool): if True, return entire <record>
+
+    Returns:
+        (str): document, or None if <metadata> absent or without single child
+    """
+
+    if include_oai_record_header:
+        return etree.tostring(record_xml).decode('utf-8')
+    m_root = record_xml.find('{http://www.openarchives.org/OAI/2.0/}metadata')
+    if m_root is not None and len(m_root) == 1:
+        return etree.tostring(m_root[0]).decode('utf-8')
+    return None
+
+
+def canonical_document(document):
+    """
+    Return exclusive canonical XML of document, such that documents serialized differently compare equal,
+    e.g. by Ingestion3 for full OAI harvests, and lxml for incremental OAI harvests
+        - unused namespace declarations, attribute order, quoting, and empty element forms are normalized
+
+    Args:
+        document (str): XML document
+
+    Returns:
+        (bytes): canonical XML, or document as UTF-8 if not parseable
+    """
+
+    try:
+        return etree.tostring(etree.fromstring(document.encode('utf-8')), method='c14n', exclusive=True)
+    except etree.XMLSyntaxError:
+        return document.encode('utf-8')
+
+
+def harvest_oai_deltas(oai_params, from_date):
+    """
+    Generator of records added, changed, or deleted at OAI-PMH endpoint since from_date, via ListRecords
+        - scoped per HarvestOAIJob oai_params, requesting each set for `setList` and skipping records
+        only in excluded sets for `blackList`
+        - from_date truncated to day if endpoint granularity is YYYY-MM-DD
+
+    Args:
+        oai_params (dict): OAI harvest parameters from job details
+        from_date (str): UTC datestamp, YYYY-MM-DDThh:mm:ssZ
+
+    Returns:
+        (generator): tuples of (record_id, document, oai_set, deleted), document None if deleted or
+        without metadata
+    """
+
+    client = sickle.Sickle(oai_params['endpoint'])
+    if getattr(client.Identify(), 'granularity', None) == 'YYYY-MM-DD':
+        from_date = from_date[:10]
+
+    # determine sets to request, None requesting all
+    scope_sets = [oai_set.strip() for oai_set in (oai_params.get('scope_value') or '').split(',')
+                  if oai_set.strip()]
+    request_sets = scope_sets if oai_params['scope_type'] == 'setList' else [None]
+    excluded_sets = set(scope_sets) if oai_params['scope_type'] == 'blackList' else set()
+
+    for request_set in request_sets:
+        params = {'metadataPrefix':oai_params['metadataPrefix'], 'from':from_date}
+        if request_set is not None:
+            params['set'] = request_set
+        try:
+            records = client.ListRecords(ignore_deleted=False, **params)
+        except NoRecordsMatch:
+            continue
+        for record in records:
+            set_specs = record.header.setSpecs
+            if excluded_sets and len(set_specs) > 0 and set(set_specs) <= excluded_sets:
+                continue
+            if record.header.deleted:
+                yield (record.header.identifier, None, ','.join(set_specs), True)
+            else:
+                yield (record.header.identifier,
+                       oai_record_document(record.xml, oai_params.get('include_oai_record_header', False)),
+                       ','.join(set_specs),
+                       False)
+
+
+# executor resident cache of compiled artifacts
+compiled_artifacts = CompiledArtifactCache(maxsize=getattr(settings, 'SPARK_COMPILED_ARTIFACT_CACHE_SIZE', 32))
+
+
 class PythonUDFRecord():
     """
     Class to provide a slim-downed version of core.models.Record that is used for spark UDF functions,
     and for previewing python based validations and transformations
     """
 
-    def __init__(self, record_input, non_row_input=False, record_id=None, document=None):
+    def __init__(self, record_input, non_row_input=False, record_id=None, document=None, xml=None):
         """
         Instantiated in one of two ways
             1) from a DB row representing a Record in its entirety
+                - optionally with document already parsed as xml, to avoid parsing again
             2) manually passed record_id or document (or both), triggered by non_row_input Flag
                 - for example, this is used for testing record_id transformations
         """
@@ -102,7 +738,10 @@ class PythonUDFRecord():
             try:
 
                 # parse XML string, save
-                self.xml = etree.fromstring(self.document.encode('utf-8'))
+                if xml is not None:
+                    self.xml = xml
+                else:
+                    self.xml = etree.fromstring(self.document.encode('utf-8'))
 
                 # get namespace map, popping None values
                 _nsmap = self.xml.nsmap.copy()
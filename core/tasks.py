@@ -1,6 +1,8 @@
 # generic imports
+import csv
 import glob
 import fileinput
+from itertools import chain, islice
 import json
 import logging
 import os
@@ -19,6 +21,7 @@ from .celery import celery_app
 # Combine imports
 from core import models
 from core.mongo import mc_handle
+from core.xml2kvp import XML2kvp
 
 # AWS
 import boto3
@@ -507,21 +510,29 @@ def export_tabular_data(ct_id):
         int(ct_id))
     LOGGER.info(spark_code)
 
-    # submit spark code to livy
+    # submit spark code to livy, or map records without Spark
     try:
 
-        # check for livy session
-        _check_livy_session()
+        if getattr(settings, 'EXPORT_TABULAR_DATA_LOCAL', False) and \
+                ct.task_params.get('s3_export_type') != 'spark_df':
 
-        LOGGER.info('submitting code to Spark')
-        submit = models.LivyClient().submit_job(
-            cjob.livy_session.session_id, {'code': spark_code})
+            LOGGER.info('mapping records without Spark')
+            _write_tabular_data_local(ct)
 
-        # poll until complete
-        LOGGER.info('polling for Spark job to complete...')
-        results = polling.poll(lambda: models.LivyClient().job_status(submit.headers['Location']).json(),
-                               check_success=spark_job_done, step=5, poll_forever=True)
-        LOGGER.info(results)
+        else:
+
+            # check for livy session
+            _check_livy_session()
+
+            LOGGER.info('submitting code to Spark')
+            submit = models.LivyClient().submit_job(
+                cjob.livy_session.session_id, {'code': spark_code})
+
+            # poll until complete
+            LOGGER.info('polling for Spark job to complete...')
+            results = polling.poll(lambda: models.LivyClient().job_status(submit.headers['Location']).json(),
+                                   check_success=spark_job_done, step=5, poll_forever=True)
+            LOGGER.info(results)
 
         # handle s3 bucket
         if ct.task_params.get('s3_export', False):
@@ -582,6 +593,62 @@ def export_tabular_data(ct_id):
         ct.save()
 
 
+def _write_tabular_data_local(ct):
+    '''
+    Map Records of Jobs in task job_dict with Job.map_records(), without Spark, writing part files
+    per folder as console.export_records_as_tabular_data() does
+        - lists are joined on multivalue_delim, and record_id and combine_id added, as in console._convert_xml_to_kvp()
+        - CSV part files share a header of all fields, sorted as Spark infers them from JSON
+        - in daemonic Celery prefork workers, records are mapped in the worker process
+    '''
+
+    fm_config = json.loads(ct.task_params['fm_export_config_json'])
+    multivalue_delim = XML2kvp(**fm_config).multivalue_delim
+    records_per_file = int(ct.task_params['records_per_file'])
+
+    for folder_name, job_ids in ct.task_params['job_dict'].items():
+
+        folder_path = os.path.join(ct.task_params['output_path'], folder_name)
+        os.makedirs(folder_path, exist_ok=True)
+
+        # map Job records, in order alongside ids
+        rows = chain.from_iterable(
+            models.Job.objects.get(pk=job_id).map_records(fm_config, fields=['record_id', 'combine_id'])
+            for job_id in job_ids)
+
+        # write JSON lines, records_per_file per part
+        fieldnames = set()
+        part_paths = []
+        while True:
+            batch = list(islice(rows, records_per_file))
+            if not batch:
+                break
+            part_path = os.path.join(folder_path, 'part-%05d.json' % len(part_paths))
+            with open(part_path, 'w') as f:
+                for record, kvp_dict in batch:
+                    for k, v in kvp_dict.items():
+                        if type(v) in [list, tuple]:
+                            kvp_dict[k] = multivalue_delim.join(v)
+                    kvp_dict.update({
+                        'record_id': record.get('record_id'),
+                        'combine_id': record.get('combine_id')
+                    })
+                    fieldnames.update(kvp_dict.keys())
+                    f.write('%s\n' % json.dumps(kvp_dict))
+            part_paths.append(part_path)
+
+        # rewrite as CSV
+        if ct.task_params['tabular_data_export_type'] == 'csv':
+            fieldnames = sorted(fieldnames)
+            for part_path in part_paths:
+                with open(part_path) as f_json, open('%s.csv' % part_path[:-len('.json')], 'w', newline='') as f_csv:
+                    writer = csv.DictWriter(f_csv, fieldnames=fieldnames)
+                    writer.writeheader()
+                    for line in f_json:
+                        writer.writerow(json.loads(line))
+                os.remove(part_path)
+
+
 def _create_export_tabular_data_archive(ct):
     # rewrite with extensions
     export_parts = glob.glob('%s/**/part*' % ct.task_params['output_path'])
@@ -1263,11 +1330,11 @@ def job_dbdm(ct_id):
         ct.save()
 
 
-def rerun_jobs(jobs):
+def rerun_jobs(jobs, incremental=False):
     for job in jobs:
         job.prepare_for_rerunning()
 
-    combine_task = models.CombineBackgroundTask.to_rerun_jobs([j.id for j in jobs])
+    combine_task = models.CombineBackgroundTask.to_rerun_jobs([j.id for j in jobs], incremental=incremental)
 
     bg_task = rerun_jobs_prep.delay(combine_task.id)
     LOGGER.debug('firing bg task: %s', bg_task)
@@ -1292,7 +1359,8 @@ def rerun_jobs_prep(ct_id):
             cjob = models.CombineJob.get_combine_job(job_id)
 
             # rerun
-            cjob.rerun(rerun_downstream=False, set_gui_status=False)
+            cjob.rerun(rerun_downstream=False, set_gui_status=False,
+                       incremental=ct.task_params.get('incremental', False))
 
         # save export output to Combine Task output
         ct.refresh_from_db()
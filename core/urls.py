@@ -200,6 +200,7 @@ urlpatterns = [
     url(r'^published/subsets/edit/(?P<subset>.+)$', views.published_subset_edit, name='published_subset_edit'),
     url(r'^published/subsets/delete/(?P<subset>.+)$', views.published_subset_delete, name='published_subset_delete'),
     url(r'^published/subset/(?P<subset>.+)$', views.published, name='published_subset'),
+    url(r'^published/cache_stats$', views.published_cache_stats, name='published_cache_stats'),
 
     # Export
     url(r'^export/mapped_fields/(?P<export_source>[a-zA-Z]+)/(?P<job_id>[0-9]+)$', views.export_mapped_fields,
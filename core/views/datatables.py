@@ -63,7 +63,7 @@ class DTPublishedJson(BaseDatatableView):
         # return queryset used as base for futher sorting/filtering
 
         # get PublishedRecords instance
-        pub_records = PublishedRecords(subset=self.kwargs.get('subset', None))
+        pub_records = PublishedRecords.get(subset=self.kwargs.get('subset', None))
 
         # return queryset
         return pub_records.records
@@ -434,11 +434,12 @@ class DTDPLABulkDataMatches(BaseDatatableView):
         # get job and records
         job = Job.objects.get(pk=self.kwargs['job_id'])
 
-        # return queryset filtered for match/miss
+        # return queryset filtered for match/miss, without documents
+        fields = ('id', 'record_id', 'job_id')
         if self.kwargs['match_type'] == 'matches':
-            return job.get_records().filter(dbdm=True)
+            return job.get_records(fields=fields).filter(dbdm=True)
         if self.kwargs['match_type'] == 'misses':
-            return job.get_records().filter(dbdm=False)
+            return job.get_records(fields=fields).filter(dbdm=False)
 
     def render_column(self, row, column):
 
@@ -517,7 +518,7 @@ class JobRecordDiffs(BaseDatatableView):
 
         # get job
         job = Job.objects.get(pk=self.kwargs['job_id'])
-        job_records = job.get_records()
+        job_records = job.get_records(fields=('id', 'record_id', 'job_id'))
 
         # filter for records that were transformed
         return job_records.filter(transformed=True)
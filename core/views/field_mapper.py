@@ -1,6 +1,8 @@
+from collections import Counter
 import json
 import logging
 import jsonschema
+import time
 
 from django.http import JsonResponse
 from django.shortcuts import render, redirect
@@ -201,6 +203,24 @@ def test_field_mapper(request):
             fm_config = json.loads(fm_config_json)
             kvp_dict = XML2kvp.xml_to_kvp(record.document, **fm_config)
 
+            # if sample size requested, map sample of Job's records across cores, counting records per field
+            sample_size = int(request.POST.get('sample_size') or 0)
+            if sample_size > 0:
+                stime = time.time()
+                record_count = 0
+                field_counts = Counter()
+                for _, sample_kvp_dict in record.job.map_records(fm_config, limit=sample_size):
+                    record_count += 1
+                    field_counts.update(sample_kvp_dict.keys())
+                return JsonResponse({
+                    'record': kvp_dict,
+                    'sample': {
+                        'records': record_count,
+                        'seconds': round(time.time() - stime, 3),
+                        'fields': dict(field_counts.most_common())
+                    }
+                })
+
             # return as JSON
             return JsonResponse(kvp_dict)
 
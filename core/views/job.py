@@ -519,6 +519,7 @@ def rerun_jobs(request):
     # get downstream toggle
     downstream_toggle = bool_for_string(request.POST.get('downstream_rerun_toggle', False))
     upstream_toggle = bool_for_string(request.POST.get('upstream_rerun_toggle', False))
+    incremental_toggle = bool_for_string(request.POST.get('incremental_rerun_toggle', False))
 
     # set of jobs to rerun
     job_rerun_set = set()
@@ -543,7 +544,7 @@ def rerun_jobs(request):
     # sort and run
     ordered_job_rerun_set = sorted(list(job_rerun_set), key=lambda j: j.id)
 
-    tasks.rerun_jobs(ordered_job_rerun_set)
+    tasks.rerun_jobs(ordered_job_rerun_set, incremental=incremental_toggle)
 
     # set gms
     gmc = GlobalMessageClient(request.session)
@@ -1,16 +1,66 @@
-from django.http import HttpResponse
+import calendar
 
-from core.oai import OAIProvider
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.gzip import gzip_page
 
+from core.models import PublishedRecords
+from core.oai import OAIProvider, OAIResponseCache, oai_etag
 
+
+@gzip_page
 def oai(request, subset=None):
     """
     Parse GET parameters, send to OAIProvider instance from oai.py
-    Return XML results
+    Return XML results, streamed if settings.OAI_STREAM_RESPONSE
+        - ETag and Last-Modified derive from publish generation, conditional requests receive 304
+        - first pages are served from disk if settings.OAI_RESPONSE_CACHE
     """
 
+    # answer conditional requests for unchanged published data
+    generation_doc = PublishedRecords.get_generation_doc()
+    etag = oai_etag(request.GET, subset=subset, generation=generation_doc['generation'])
+    last_modified = None
+    if generation_doc['updated'] is not None:
+        last_modified = calendar.timegm(generation_doc['updated'].utctimetuple())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    if response is None:
+        response = _oai_response(request, subset, generation_doc['generation'])
+
+    # set cache validators
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _oai_response(request, subset, generation):
+
+    stream = getattr(settings, 'OAI_STREAM_RESPONSE', False)
+
+    # serve first pages from disk cache
+    if getattr(settings, 'OAI_RESPONSE_CACHE', False):
+        response_cache = OAIResponseCache(request.GET, subset=subset, generation=generation)
+        if response_cache.cacheable:
+            content = response_cache.get()
+            if content is None:
+                provider = OAIProvider(request.GET, subset=subset)
+                if stream:
+                    content = b''.join(provider.stream_response())
+                else:
+                    content = provider.generate_response()
+                response_cache.set(content)
+            return HttpResponse(content, content_type='text/xml')
+
     # get OAIProvider instance
     provider = OAIProvider(request.GET, subset=subset)
 
+    # stream XML
+    if stream:
+        return StreamingHttpResponse(provider.stream_response(), content_type='text/xml')
+
     # return XML
     return HttpResponse(provider.generate_response(), content_type='text/xml')
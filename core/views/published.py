@@ -2,6 +2,7 @@ import json
 import logging
 
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import redirect, render
 
 from core import xml2kvp
@@ -21,7 +22,7 @@ def published(request, subset=None):
         """
 
     # get instance of Published model
-    pub_records = PublishedRecords(subset=subset)
+    pub_records = PublishedRecords.get(subset=subset)
 
     # get field counts
     if pub_records.records.count() > 0:
@@ -45,7 +46,7 @@ def published(request, subset=None):
 
         # if counts not yet calculated, do now
         if counts is None:
-            counts = PublishedRecords(
+            counts = PublishedRecords.get(
                 subset=_['name']).count_indexed_fields()
         _['counts'] = counts
 
@@ -124,6 +125,7 @@ def published_subset_create(request):
                 'hierarchy': hierarchy,
                 'include_non_set_records': include_non_set_records
             })
+        PublishedRecords.bump_generation()
 
         return redirect('published_subset',
                         subset=name)
@@ -193,4 +195,14 @@ def published_subset_delete(request, subset):
     deleted = mc_handle.combine.misc.delete_one(
         {'_id': 'published_field_counts_%s' % subset})
     LOGGER.debug(deleted.raw_result)
+    PublishedRecords.bump_generation()
     return redirect('published')
+
+
+@login_required
+def published_cache_stats(request):
+    """
+        Return hit/miss counters for cached published snapshots in this process
+        """
+
+    return JsonResponse(PublishedRecords.get_cache_stats())
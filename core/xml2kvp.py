@@ -1,13 +1,16 @@
 # xml2kvp
 
 import ast
-from collections import OrderedDict
-from copy import deepcopy
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import dashtable
 import hashlib
+from itertools import islice
 import json
 from lxml import etree
 import logging
+import multiprocessing
+import os
 import re
 import time
 import xmltodict
@@ -18,13 +21,16 @@ logger = logging.getLogger(__name__)
 # sibling hash regex
 sibling_hash_regex = re.compile(r'(.+?)\(([0-9a-zA-Z]+)\)|(.+)')
 
+# first characters of python literals, other than digits and brackets, e.g. strings, None, True, False
+literal_heads = '{\'"+-.NTFbBrRuU'
+
 
 
 class XML2kvp():
     '''
     Class to handle the parsing of XML into Key/Value Pairs
 
-            - utilizes xmltodict (https://github.com/martinblech/xmltodict)
+            - utilizes xmltodict (https://github.com/martinblech/xmltodict), or walks lxml trees directly
             - static methods are designed to be called without user instantiating
             instance of XML2kvp
     '''
@@ -225,6 +231,11 @@ class XML2kvp():
             "add_element_root": {
                         "description": "xml tag with which to wrap each element as a root",
                         "type": "string"
+                    },
+            "walker": {
+                    "description": "Parser used to walk XML, ``xmltodict`` or ``lxml``, the latter walking an lxml tree directly, sharing parsed ``etree`` input. Only the order of ``xmlns`` attribute hops, when not skipping attribute namespace declarations, may differ. [Default: ``xmltodict``]",
+                    "type": "string",
+                    "enum": ["xmltodict", "lxml"]
                     }
         }
     }
@@ -265,6 +276,7 @@ class XML2kvp():
         self.skip_repeating_values = True
         self.skip_root = False
         self.repeating_element_suffix_count = False
+        self.walker = 'xmltodict'
 
         # list of properties that are allowed to be overwritten with None
         arg_none_allowed = []
@@ -281,6 +293,17 @@ class XML2kvp():
         # sibling hash counter
         self.sibling_hash_counter = {}
 
+        # precompile regexes, None where invalid such that errors surface per key as before
+        self.copy_to_regex_compiled = [(rk, rv, self._compile_regex(rk)) for rk, rv in self.copy_to_regex.items()]
+        self.copy_value_to_regex_compiled = [(self._compile_regex('%s' % rk), rv)
+                                             for rk, rv in self.copy_value_to_regex.items()]
+
+        # memoized hops --> output keys
+        self.resolved_keys = {}
+
+        # memoized kvp keys --> element names and attributes, for kvp_to_xml()
+        self.kvp_key_nodes = {}
+
     @property
     def schema_json(self):
         return json.dumps(self.schema)
@@ -319,6 +342,30 @@ class XML2kvp():
 
         return json.dumps(config_dict, indent=2, sort_keys=True)
 
+    @staticmethod
+    def _compile_regex(pattern):
+        try:
+            return re.compile(pattern)
+        except:
+            return None
+
+    @staticmethod
+    def compile_plan(**kwargs):
+        '''
+        Static method to validate configurations against schema, and return handler with regexes compiled,
+        to be reused for many records with xml_to_kvp(xml_input, handler=handler)
+
+        Args:
+                kwargs (dict): XML2kvp configurations
+
+        Returns:
+                (XML2kvp): handler
+        '''
+
+        import jsonschema
+        jsonschema.validate({k: v for k, v in kwargs.items() if v is not None}, XML2kvp.schema)
+        return XML2kvp(**kwargs)
+
     def _xml_dict_parser(self, in_k, in_v, hops=[]):
 
         # handle Dictionary
@@ -329,27 +376,10 @@ class XML2kvp():
                 hash_val = in_k
             else:
                 hash_val = hash(frozenset(in_v.keys()))
-            if hash_val not in self.sibling_hash_counter.keys():
-                self.sibling_hash_counter[hash_val] = 1
-            else:
-                self.sibling_hash_counter[hash_val] += 1
-            sibling_hash = '%s%s' % (hashlib.md5(str(hash_val).encode('utf-8')).hexdigest()[:4],
-                                     str(self.sibling_hash_counter[hash_val]).zfill(2))
+            sibling_hash = self._sibling_hash(hash_val)
 
             # handle all attributes for node first
-            for k, v in in_v.items():
-                if k.startswith('@'):
-
-                    # handle capture_attribute_values
-                    if len(self.capture_attribute_values) > 0 and k.lstrip('@') in self.capture_attribute_values:
-                        temp_hops = hops.copy()
-                        temp_hops.append("%s@" % k)
-                        self._process_kvp(temp_hops, v)
-
-                    # format and append if including
-                    if self.include_all_attributes or (
-                            len(self.include_attributes) > 0 and k.lstrip('@') in self.include_attributes):
-                        hops = self._format_and_append_hop(hops, 'attribute', k, v)
+            hops = self._attribute_hops(hops, [(k, v) for k, v in in_v.items() if k.startswith('@')])
 
             # set hop length that will be returned to
             hop_len = len(hops)
@@ -390,6 +420,148 @@ class XML2kvp():
             if in_k != '#text':
                 self._process_kvp(hops, in_v)
 
+    def _sibling_hash(self, hash_val):
+
+        # count and hash siblings
+        if hash_val not in self.sibling_hash_counter.keys():
+            self.sibling_hash_counter[hash_val] = 1
+        else:
+            self.sibling_hash_counter[hash_val] += 1
+        return '%s%s' % (hashlib.md5(str(hash_val).encode('utf-8')).hexdigest()[:4],
+                         str(self.sibling_hash_counter[hash_val]).zfill(2))
+
+    def _attribute_hops(self, hops, attributes):
+
+        # loop through (@name, value) attribute pairs
+        for k, v in attributes:
+
+            # handle capture_attribute_values
+            if len(self.capture_attribute_values) > 0 and k.lstrip('@') in self.capture_attribute_values:
+                temp_hops = hops.copy()
+                temp_hops.append("%s@" % k)
+                self._process_kvp(temp_hops, v)
+
+            # format and append if including
+            if self.include_all_attributes or (
+                    len(self.include_attributes) > 0 and k.lstrip('@') in self.include_attributes):
+                hops = self._format_and_append_hop(hops, 'attribute', k, v)
+
+        return hops
+
+    def _xml_tree_parser(self, root):
+        '''
+        Method to walk lxml tree, alternative to xmltodict and _xml_dict_parser() producing the same kvp
+
+            - children are walked grouped by name, in order of first occurrence, as keyed by xmltodict
+            - namespace declarations, collected with iterwalk, precede other attributes
+        '''
+
+        # collect namespace declarations per element
+        ns_decls = {}
+        pending = []
+        for event, obj in etree.iterwalk(root, events=('start-ns', 'start')):
+            if event == 'start-ns':
+                pending.append(obj)
+            elif pending:
+                ns_decls[obj] = pending
+                pending = []
+
+        # root, as only key of xmltodict document
+        root_name = self._qualified_name(root)
+        sibling_hash = self._sibling_hash(hash(frozenset([root_name]))) if self.include_sibling_id else None
+        hops = self._format_and_append_hop([], 'element', root_name, None, sibling_hash=sibling_hash)
+        self._xml_tree_node(root_name, root, ns_decls, hops)
+
+    def _xml_tree_node(self, in_k, ele, ns_decls, hops):
+
+        # attributes, as named by xmltodict
+        attributes = [('@xmlns:%s' % prefix if prefix else '@xmlns', uri) for prefix, uri in ns_decls.get(ele, [])]
+        items = ele.items()
+        if len(items) > 0:
+            attributes.extend([('@%s' % self._qualified_name(ele, k), v) for k, v in items])
+
+        # group child elements by name, and collect text including tails of children
+        text = ele.text
+        text = [text] if text else []
+        children = OrderedDict()
+        for child in ele:
+            tail = child.tail
+            if tail:
+                text.append(tail)
+            if isinstance(child.tag, str):
+                children.setdefault(self._qualified_name(child), []).append(child)
+
+        # join and strip text, as xmltodict
+        text = ''.join(text).strip() or None
+
+        # handle value, when without attributes or children
+        if len(attributes) == 0 and len(children) == 0:
+            if text is not None:
+                self._process_kvp(hops, text)
+            return
+
+        # set sibling hash
+        sibling_hash = None
+        if self.include_sibling_id:
+            if in_k != None:
+                hash_val = in_k
+            else:
+                keys = [k for k, v in attributes] + list(children.keys())
+                if text is not None:
+                    keys.append('#text')
+                hash_val = hash(frozenset(keys))
+            sibling_hash = self._sibling_hash(hash_val)
+
+        # handle all attributes for node first
+        hops = self._attribute_hops(hops, attributes)
+
+        # set hop length that will be returned to
+        hop_len = len(hops)
+
+        # loop through child elements
+        for k, eles in children.items():
+            hops = self._format_and_append_hop(hops, 'element', k, None, sibling_hash=sibling_hash)
+
+            # recurse, as list if repeating
+            if len(eles) == 1:
+                self._xml_tree_node(k, eles[0], ns_decls, hops)
+            else:
+                list_hop_len = len(hops)
+                for child in eles:
+                    self._xml_tree_node(None, child, ns_decls, hops)
+                    hops = hops[:list_hop_len]
+
+            # reset hops
+            hops = hops[:hop_len]
+
+        # handle text last
+        if text is not None:
+            self._process_kvp(hops, text)
+
+    @staticmethod
+    def _qualified_name(ele, attribute=None):
+        '''
+        Return prefixed name of element, or attribute tag of element, as written in the document
+        '''
+
+        # unqualified
+        tag = ele.tag if attribute is None else attribute
+        if tag[0] != '{':
+            return tag
+        uri, name = tag[1:].split('}', 1)
+
+        # element
+        if attribute is None:
+            return '%s:%s' % (ele.prefix, name) if ele.prefix else name
+
+        # attribute
+        if uri == 'http://www.w3.org/XML/1998/namespace':
+            return 'xml:%s' % name
+        for prefix, ns in ele.nsmap.items():
+            if prefix and ns == uri:
+                return '%s:%s' % (prefix, name)
+        return name
+
     def _format_and_append_hop(self, hops, hop_type, k, v, sibling_hash=None):
 
         # handle elements
@@ -454,15 +626,15 @@ class XML2kvp():
                                           (value,
                                            {'node_delim': self.node_delim, 'ns_prefix_delim': self.ns_prefix_delim}))
 
-    def _process_kvp(self, hops, value):
+    def _resolve_keys(self, hops):
         '''
-        method to add key/value pairs to saved dictionary,
-        appending new values to pre-existing keys
+        method to resolve hops to key, and keys per copy_to and copy_to_regex mixins,
+        memoized as these do not depend on value
         '''
 
-        # sanitize value
-
-        value = self._sanitize_value(value)
+        hops_key = tuple(hops)
+        if hops_key in self.resolved_keys:
+            return self.resolved_keys[hops_key]
 
         # join on node delimiter
         k = self.node_delim.join(hops)
@@ -489,23 +661,23 @@ class XML2kvp():
                     k_list.remove(k)
 
         # handle copy_to_regex mixins
-        if len(self.copy_to_regex) > 0:
+        if len(self.copy_to_regex_compiled) > 0:
 
             # key list prior to copies
             slen = len(k_list)
 
             # loop through copy_to_regex
-            for rk, rv in self.copy_to_regex.items():
+            for rk, rv, pattern in self.copy_to_regex_compiled:
 
                 # if False, check for match and remove
                 if rv == False:
-                    if re.match(rk, k):
+                    if (pattern or re.compile(rk)).match(k):
                         k_list.append(False)
 
                 # attempt sub
                 else:
                     try:
-                        sub = re.sub(rk, rv, k)
+                        sub = (pattern or re.compile(rk)).sub(rv, k)
                         if sub != k:
                             k_list.append(sub)
                     except:
@@ -515,18 +687,38 @@ class XML2kvp():
                 if slen != len(k_list) and k in k_list:
                     k_list.remove(k)
 
+        # memoize, bounded as sibling ids may vary keys
+        if len(self.resolved_keys) >= 10000:
+            self.resolved_keys.clear()
+        self.resolved_keys[hops_key] = (k, tuple(k_list))
+        return self.resolved_keys[hops_key]
+
+    def _process_kvp(self, hops, value):
+        '''
+        method to add key/value pairs to saved dictionary,
+        appending new values to pre-existing keys
+        '''
+
+        # sanitize value
+
+        value = self._sanitize_value(value)
+
+        # resolve key, and keys copied to
+        k, k_list = self._resolve_keys(hops)
+        k_list = list(k_list)
+
         # handle copy_value_to_regex mixins
-        if len(self.copy_value_to_regex) > 0:
+        if len(self.copy_value_to_regex_compiled) > 0:
 
             # key list prior to copies
             slen = len(k_list)
 
             # loop through copy_value_to_regex
-            for rk, rv in self.copy_value_to_regex.items():
+            for pattern, rv in self.copy_value_to_regex_compiled:
 
                 # attempt sub
                 try:
-                    if re.match(r'%s' % rk, value):
+                    if pattern.match(value):
                         k_list.append(rv)
                 except:
                     pass
@@ -625,6 +817,31 @@ class XML2kvp():
                 self._parse_nsmap()
             return etree.tostring(xml_input).decode('utf-8')
 
+    def _parse_xml_tree(self, xml_input):
+        '''
+        Return root element for lxml walker, parsing string input once and walking etree input as-is
+        '''
+
+        # if string, parse
+        if type(xml_input) == str:
+            try:
+                xml = etree.fromstring(xml_input)
+            except:
+                xml = etree.fromstring(xml_input.encode('utf-8'))
+
+        # if etree object, use root
+        elif type(xml_input) == etree._ElementTree:
+            xml = xml_input.getroot()
+        else:
+            xml = xml_input
+
+        # save if including
+        if self.include_xml_prop:
+            self.xml = xml
+            self._parse_nsmap()
+
+        return xml
+
     def _parse_nsmap(self):
         '''
         Note: self may be handler instance passsed
@@ -656,37 +873,52 @@ class XML2kvp():
         return value
 
     @staticmethod
-    def xml_to_kvp(xml_input, handler=None, return_handler=False, **kwargs):
+    def xml_to_kvp(xml_input, handler=None, return_handler=False, literals=None, **kwargs):
         '''
         Static method to create key/value pairs (kvp) from XML string input
 
         Args:
+                xml_input (str, lxml.etree._Element): XML, etree input walked without serializing if walker is `lxml`
+                handler (XML2kvp): handler to reuse across records, see compile_plan(), else created from kwargs
+                return_handler (bool): return handler if True, else kvp dictionary
+                literals (dict): per record literals, mixed in after configured `add_literals`
 
         Returns:
-
+                (OrderedDict, XML2kvp): kvp dictionary, or handler with `kvp_dict`
         '''
 
         # init handler, overwriting defaults if not None
         if not handler:
             handler = XML2kvp(**kwargs)
 
-        # clean kvp_dict
+        # clean kvp_dict and sibling hash counter
         handler.kvp_dict = OrderedDict()
+        handler.sibling_hash_counter = {}
+
+        # walk lxml tree, without serializing etree input
+        if handler.walker == 'lxml':
+            handler.xml_string = xml_input if type(xml_input) == str else None
+            handler._xml_tree_parser(handler._parse_xml_tree(xml_input))
 
-        # parse xml input
-        handler.xml_string = handler._parse_xml_input(xml_input)
+        else:
 
-        # parse as dictionary
-        handler.xml_dict = xmltodict.parse(
-            handler.xml_string, xml_attribs=True)
+            # parse xml input
+            handler.xml_string = handler._parse_xml_input(xml_input)
 
-        # walk xmltodict parsed dictionary
-        handler._xml_dict_parser(None, handler.xml_dict, hops=[])
+            # parse as dictionary
+            handler.xml_dict = xmltodict.parse(
+                handler.xml_string, xml_attribs=True)
+
+            # walk xmltodict parsed dictionary
+            handler._xml_dict_parser(None, handler.xml_dict, hops=[])
 
         # handle literal mixins
         if len(handler.add_literals) > 0:
             for k, v in handler.add_literals.items():
                 handler.kvp_dict[k] = v
+        if literals:
+            for k, v in literals.items():
+                handler.kvp_dict[k] = v
 
         # handle split and concatenations
         handler._split_and_concat_fields()
@@ -719,6 +951,54 @@ class XML2kvp():
             return handler
         return handler.kvp_dict
 
+    @staticmethod
+    def xml_to_kvp_many(xml_inputs, workers=None, chunk_size=100, **kwargs):
+        '''
+        Static method to create key/value pairs (kvp) from many XML inputs, mapping chunks of inputs in a pool of
+        processes, each with one handler, and yielding kvp dictionaries in order of input
+
+        Args:
+                xml_inputs (iterable): XML strings or lxml elements, consumed as chunks are sent to processes
+                workers (int): number of processes, defaults to CPU count, 1 maps in this process
+                chunk_size (int): number of inputs sent to a process at once
+                kwargs (dict): XML2kvp configurations
+
+        Returns:
+                (generator): kvp dictionaries, raising the first mapping error encountered
+        '''
+
+        workers = workers or os.cpu_count() or 1
+        xml_inputs = iter(xml_inputs)
+
+        # map in this process, also where this process is daemonic, e.g. Celery prefork workers,
+        # and cannot start a pool
+        if workers == 1 or multiprocessing.current_process().daemon:
+            handler = XML2kvp(**kwargs)
+            for xml_input in xml_inputs:
+                yield XML2kvp.xml_to_kvp(xml_input, handler=handler)
+            return
+
+        # map in pool of processes, limiting chunks in flight
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_xml_to_kvp_worker,
+                                 initargs=(kwargs,)) as executor:
+            futures = deque()
+            while True:
+
+                # serialize etree inputs to send to process
+                chunk = [etree.tostring(xml_input).decode('utf-8')
+                         if type(xml_input) in [etree._Element, etree._ElementTree] else xml_input
+                         for xml_input in islice(xml_inputs, chunk_size)]
+                if chunk:
+                    futures.append(executor.submit(_xml_to_kvp_chunk, chunk))
+
+                # yield completed chunks in order, draining when inputs are exhausted
+                while futures and (not chunk or len(futures) >= workers * 2):
+                    for kvp_dict in futures.popleft().result():
+                        yield kvp_dict
+
+                if not chunk:
+                    break
+
     @staticmethod
     def kvp_to_xml(kvp, handler=None, return_handler=False, serialize_xml=False, **kwargs):
         '''
@@ -748,130 +1028,135 @@ class XML2kvp():
                 tag_name = root_node
             xml_record.root_node = etree.Element(tag_name, nsmap=handler.nsmap)
 
-        # loop through items
+        # loop through items, writing each value as path of elements from root
         for k, v in kvp.items():
+            key_nodes = handler._parse_kvp_key(k)
+            for value in handler._kvp_values(v):
+                xml_record.append_key_nodes(key_nodes, value, nsmap=handler.nsmap)
 
-            # split on delim
-            nodes = k.split(handler.node_delim)
+        # root node from first path, as with merge_root_nodes()
+        if xml_record.root_node is None:
+            raise IndexError('list index out of range')
 
-            # loop through nodes and create XML element nodes
-            hops = []
-            for i, node in enumerate(nodes):
+        # if sibling hashes included, attempt to merge
+        if handler.include_sibling_id:
+            xml_record.merge_siblings()
 
-                # write hops
-                if not node.startswith('@'):
+        # return
+        if serialize_xml:
+            return xml_record.serialize()
+        return xml_record
 
-                    # init attributes
-                    attribs = {}
+    def _parse_kvp_key(self, k):
+        '''
+        Method to parse kvp key to list of (tag name, attributes) for elements, memoized per handler
 
-                    # handle namespaces for tag name
-                    if handler.ns_prefix_delim in node:
+        Note: elements are created once per key, such that invalid names or attributes raise as before
+        '''
 
-                        # get prefix and tag name
-                        prefix, tag_name = node.split(handler.ns_prefix_delim)
+        if k in self.kvp_key_nodes:
+            return self.kvp_key_nodes[k]
 
-                        # write
-                        tag_name = '{%s}%s' % (handler.nsmap[prefix], tag_name)
+        # split on delim
+        nodes = k.split(self.node_delim)
 
-                    # else, handle non-namespaced
-                    else:
-                        tag_name = node
-
-                    # handle sibling hashes
-                    if handler.include_sibling_id:
-
-                        # run tag_name through sibling_hash_regex
-                        matches = re.match(sibling_hash_regex, tag_name)
-                        if matches != None:
-                            groups = matches.groups()
-
-                            # if tag_name and sibling hash, append to attribs
-                            if groups[0] and groups[1]:
-                                tag_name = groups[0]
-                                sibling_hash = groups[1]
-                                attribs['sibling_hash_id'] = sibling_hash
-
-                            # else, assume sibling hash not present, get tag name
-                            elif groups[2]:
-                                tag_name = groups[2]
-
-                    # init element
-                    node_ele = etree.Element(tag_name, nsmap=handler.nsmap)
-
-                    # check for attributes
-                    if i+1 < len(nodes) and nodes[i+1].startswith('@'):
-                        while True:
-                            for attrib in nodes[i+1:]:
-                                if attrib.startswith('@'):
-                                    attrib_name, attrib_value = attrib.split(
-                                        '=')
-                                    attribs[attrib_name.lstrip(
-                                        '@')] = attrib_value
-                                else:
-                                    break
-                            break
-
-                    # write to element
-                    node_ele.attrib.update(attribs)
-
-                    # append to hops
-                    hops.append(node_ele)
-
-            # write values and number of nodes
-            # # convert with ast.literal_eval to circumvent lists/tuples record as strings in pyspark
-            # # https://github.com/MI-DPLA/combine/issues/361#issuecomment-442510950
-            if type(v) == str:
-
-                # evaluate to expose lists or tuples
-                try:
-                    v_eval = ast.literal_eval(v)
-                    if type(v_eval) in [list, tuple]:
-                        v = v_eval
-                except:
-                    pass
+        # loop through nodes and parse XML element nodes
+        key_nodes = []
+        for i, node in enumerate(nodes):
 
-                # split based on handler.multivalue_delim
-                if handler.multivalue_delim != None and type(v) == str and handler.multivalue_delim in v:
-                    v = [val.strip()
-                         for val in v.split(handler.multivalue_delim)]
+            # write hops
+            if not node.startswith('@'):
 
-            # handle single value
-            if type(v) == str:
+                # init attributes
+                attribs = {}
 
-                # write value
-                hops[-1].text = str(v)
+                # handle namespaces for tag name
+                if self.ns_prefix_delim in node:
 
-                # append single list of nodes to xml_record
-                xml_record.node_lists.append(hops)
+                    # get prefix and tag name
+                    prefix, tag_name = node.split(self.ns_prefix_delim)
 
-            # handle multiple values
-            elif type(v) in [list, tuple]:
+                    # write
+                    tag_name = '{%s}%s' % (self.nsmap[prefix], tag_name)
 
-                # loop through values
-                for value in v:
-                    # copy hops
-                    hops_copy = deepcopy(hops)
+                # else, handle non-namespaced
+                else:
+                    tag_name = node
+
+                # handle sibling hashes
+                if self.include_sibling_id:
+
+                    # run tag_name through sibling_hash_regex
+                    matches = re.match(sibling_hash_regex, tag_name)
+                    if matches != None:
+                        groups = matches.groups()
+
+                        # if tag_name and sibling hash, append to attribs
+                        if groups[0] and groups[1]:
+                            tag_name = groups[0]
+                            sibling_hash = groups[1]
+                            attribs['sibling_hash_id'] = sibling_hash
+
+                        # else, assume sibling hash not present, get tag name
+                        elif groups[2]:
+                            tag_name = groups[2]
+
+                # check for attributes
+                for attrib in nodes[i+1:]:
+                    if attrib.startswith('@'):
+                        attrib_name, attrib_value = attrib.split('=')
+                        attribs[attrib_name.lstrip('@')] = attrib_value
+                    else:
+                        break
 
-                    # write value
-                    hops_copy[-1].text = str(value)
+                # init element, validating name and attributes
+                node_ele = etree.Element(tag_name, nsmap=self.nsmap)
+                node_ele.attrib.update(attribs)
 
-                    # append single list of nodes to xml_record
-                    xml_record.node_lists.append(hops_copy)
+                # append to key nodes
+                key_nodes.append((tag_name, attribs))
 
-        # tether parent and child nodes
-        xml_record.tether_node_lists()
+        # memoize, bounded as keys may vary
+        if len(self.kvp_key_nodes) >= 10000:
+            self.kvp_key_nodes.clear()
+        self.kvp_key_nodes[k] = key_nodes
+        return key_nodes
 
-        # merge all root nodes
-        xml_record.merge_root_nodes()
+    def _kvp_values(self, v):
+        '''
+        Method to return list of values to write for kvp value
+        '''
 
-        # if sibling hashes included, attempt to merge
-        if handler.include_sibling_id:
-            xml_record.merge_siblings()
+        # write values and number of nodes
+        # # convert with ast.literal_eval to circumvent lists/tuples record as strings in pyspark
+        # # https://github.com/MI-DPLA/combine/issues/361#issuecomment-442510950
+        if type(v) == str:
 
-        # return
-        if serialize_xml:
-            return xml_record.serialize()
-        return xml_record
+            # evaluate to expose lists or tuples, only where value may be one: bracketed, or comma separated
+            # starting with a literal
+            head = v.lstrip()[:1]
+            if head in ('[', '(', '#', '\\') or (',' in v and head != '' and (head.isdigit() or head in literal_heads)):
+                try:
+                    v_eval = ast.literal_eval(v)
+                    if type(v_eval) in [list, tuple]:
+                        v = v_eval
+                except:
+                    pass
+
+            # split based on handler.multivalue_delim
+            if self.multivalue_delim != None and type(v) == str and self.multivalue_delim in v:
+                v = [val.strip()
+                     for val in v.split(self.multivalue_delim)]
+
+        # handle single value
+        if type(v) == str:
+            return [v]
+
+        # handle multiple values
+        elif type(v) in [list, tuple]:
+            return [str(value) for value in v]
+
+        return []
 
     @staticmethod
     def k_to_xpath(k, handler=None, return_handler=False, **kwargs):
@@ -1117,6 +1402,19 @@ class XML2kvp():
 
 
 
+# handler per process, for XML2kvp.xml_to_kvp_many()
+_xml_to_kvp_worker_handler = None
+
+
+def _init_xml_to_kvp_worker(config):
+    global _xml_to_kvp_worker_handler
+    _xml_to_kvp_worker_handler = XML2kvp(**config)
+
+
+def _xml_to_kvp_chunk(xml_inputs):
+    return [XML2kvp.xml_to_kvp(xml_input, handler=_xml_to_kvp_worker_handler) for xml_input in xml_inputs]
+
+
 class XMLRecord():
     '''
     Class to scaffold and create XML records from XML2kvp kvp
@@ -1129,6 +1427,39 @@ class XMLRecord():
         self.nodes = []
         self.merge_metrics = {}
 
+    def append_key_nodes(self, key_nodes, value, nsmap=None):
+        '''
+        Method to write value as path of elements from root node, equivalent to tethering node list for value
+        and merging into root node, without creating elements that would be discarded
+
+        Args:
+                key_nodes (list): (tag name, attributes) per element, see XML2kvp._parse_kvp_key()
+                value (str): value for last element
+                nsmap (dict): namespaces for root node
+        '''
+
+        # first node list, set as root
+        if self.root_node is None:
+            self.root_node = etree.Element(key_nodes[0][0], nsmap=nsmap)
+            self.root_node.attrib.update(key_nodes[0][1])
+            parent_node = self.root_node
+
+        # children of node list, added to root node
+        elif len(key_nodes) > 1:
+            parent_node = self.root_node
+
+        # single node, added to root node if not root
+        elif key_nodes[0][0] != self.root_node.tag:
+            parent_node = etree.SubElement(self.root_node, key_nodes[0][0], key_nodes[0][1])
+
+        else:
+            return
+
+        # write path
+        for tag_name, attribs in key_nodes[1:]:
+            parent_node = etree.SubElement(parent_node, tag_name, attribs)
+        parent_node.text = value
+
     def tether_node_lists(self):
         '''
         Method to tether nodes from node_lists as parent/child
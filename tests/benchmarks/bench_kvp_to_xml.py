@@ -0,0 +1,58 @@
+'''
+Benchmark XML2kvp.kvp_to_xml for tabular rows, handler per row vs. per partition
+
+    - converts synthetic spreadsheet rows, with multivalued and list-like columns, to serialized XML
+    - "row": handler created from configurations for every row, as previously in HarvestTabularDataSpark
+    - "partition": one handler reused for all rows, parsing each column key once
+
+Usage:
+    python -m tests.benchmarks.bench_kvp_to_xml [row_count]
+'''
+
+import sys
+import time
+
+from core.xml2kvp import XML2kvp
+
+CONFIG = {
+    'node_delim': '_',
+    'ns_prefix_delim': '|',
+    'multivalue_delim': '|',
+    'add_element_root': 'oai_dc|dc',
+    'nsmap': {
+        'dc': 'http://purl.org/dc/elements/1.1/',
+        'dcterms': 'http://purl.org/dc/terms/',
+        'oai_dc': 'http://www.openarchives.org/OAI/2.0/oai_dc/'
+    }
+}
+
+
+def synthetic_row(i):
+    return {
+        'dcterms|title': 'Synthetic record %s' % i,
+        'dcterms|creator': 'Smith, Jane|Doe, John',
+        'dcterms|subject': "['Photographs', 'Buildings', 'Streets']",
+        'dcterms|description': 'A description of record %s, with commas, in it' % i,
+        'dcterms|date': '19%s' % str(i % 100).zfill(2),
+        'dcterms|identifier': 'synthetic:%s' % i,
+        'dcterms|isPartOf_dcterms|title': 'Synthetic Collection'
+    }
+
+
+def run(row_count=20000):
+    rows = [synthetic_row(i) for i in range(row_count)]
+
+    stime = time.time()
+    for row in rows:
+        XML2kvp.kvp_to_xml(row, serialize_xml=True, **CONFIG)
+    print('row: %s rows in %.2fs' % (row_count, time.time() - stime))
+
+    handler = XML2kvp(**CONFIG)
+    stime = time.time()
+    for row in rows:
+        XML2kvp.kvp_to_xml(row, serialize_xml=True, handler=handler)
+    print('partition: %s rows in %.2fs' % (row_count, time.time() - stime))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,73 @@
+'''
+Benchmark OAI-PMH ListRecords page rendering, lxml tree vs. streamed text
+
+    - renders a synthetic published set of 100k records in pages of settings.OAI_RESPONSE_SIZE
+    - "before": each document parsed into the response tree and serialized (OAIRecord.include_metadata)
+    - "after": each document spliced in as text (OAIRecord.serialize)
+    - Mongo retrieval is excluded, such that only response building is measured
+
+Usage:
+    python -m tests.benchmarks.bench_oai_streaming [record_count]
+'''
+
+import os
+import sys
+import time
+
+import django
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'combine.settings'
+sys.path.append('/opt/combine')
+django.setup()
+
+from django.conf import settings
+from lxml import etree
+
+from core.oai import OAIRecord
+
+SYNTHETIC_DOCUMENT = '''<?xml version="1.0" encoding="UTF-8"?>
+<mods:mods xmlns:mods="http://www.loc.gov/mods/v3" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <mods:titleInfo><mods:title>Synthetic record %(i)s</mods:title></mods:titleInfo>
+  <mods:name><mods:namePart>Mellink, Machteld J. (Machteld Johanna)</mods:namePart></mods:name>
+  <mods:originInfo><mods:dateCreated>1953</mods:dateCreated></mods:originInfo>
+  <mods:subject><mods:topic>Archaeology</mods:topic><mods:geographic>Turkey</mods:geographic></mods:subject>
+  <mods:location><mods:url access="object in context">http://example.org/%(i)s</mods:url></mods:location>
+  <mods:accessCondition>http://creativecommons.org/licenses/by-nc/3.0/us/</mods:accessCondition>
+</mods:mods>
+'''
+
+
+def render_lxml(page):
+    root = etree.Element('ListRecords')
+    for i in page:
+        record = OAIRecord(args={}, record_id='r%s' % i, publish_set_id='bench',
+                           document=SYNTHETIC_DOCUMENT % {'i': i}, timestamp='2019-01-01T00:00:00Z')
+        record.include_metadata()
+        root.append(record.oai_record_node)
+    return etree.tostring(root)
+
+
+def render_stream(page):
+    chunks = []
+    for i in page:
+        record = OAIRecord(args={}, record_id='r%s' % i, publish_set_id='bench',
+                           document=SYNTHETIC_DOCUMENT % {'i': i}, timestamp='2019-01-01T00:00:00Z',
+                           build_node=False)
+        chunks.append(record.serialize(include_metadata=True).encode('utf-8'))
+    return b''.join(chunks)
+
+
+def run(record_count=100000):
+    chunk_size = settings.OAI_RESPONSE_SIZE
+    pages = [range(start, min(start + chunk_size, record_count)) for start in range(0, record_count, chunk_size)]
+    for label, render in [('lxml tree (before)', render_lxml), ('streamed text (after)', render_stream)]:
+        stime = time.time()
+        for page in pages:
+            render(page)
+        elapsed = time.time() - stime
+        print('%s: %s pages of %s in %.2fs, %.1f pages/sec' % (
+            label, len(pages), chunk_size, elapsed, len(pages) / elapsed))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:]])
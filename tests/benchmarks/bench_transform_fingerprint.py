@@ -0,0 +1,80 @@
+'''
+Benchmark setting `transformed` for Transform Jobs, shuffle join vs. carried input fingerprint
+
+    - transforms synthetic records with local Spark, altering every other document
+    - "join": new fingerprints joined back to input records on combine_id, as previously in TransformSpark
+    - "projection": input fingerprint carried through the transformation and compared per row
+    - reports Exchange (shuffle) stages in each physical plan, and seconds to count transformed records
+
+Usage:
+    python -m tests.benchmarks.bench_transform_fingerprint [record_count]
+'''
+
+import sys
+import time
+
+from pyspark.sql import SparkSession
+from pyspark.sql import functions as pyspark_sql_functions
+from pyspark.sql.functions import crc32
+
+SYNTHETIC_DOCUMENT = '<mods:mods xmlns:mods="http://www.loc.gov/mods/v3"><mods:title>Synthetic record %s</mods:title></mods:mods>'
+
+
+def transform_partition(rows):
+    for row in rows:
+        document = row.document.replace('Synthetic', 'Transformed') if row.id % 2 else row.document
+        yield (row.combine_id, document, row.fingerprint)
+
+
+def get_input_records(spark, record_count):
+    records = spark.range(record_count)\
+        .withColumn('combine_id', pyspark_sql_functions.expr('uuid()'))\
+        .withColumn('document', pyspark_sql_functions.format_string(SYNTHETIC_DOCUMENT, 'id'))
+    records = records.withColumn('fingerprint', crc32(records.document))
+    return records.cache()
+
+
+def transformed_join(spark, input_records):
+    records = spark.createDataFrame(input_records.rdd.mapPartitions(transform_partition),
+                                    schema='combine_id string, document string, fingerprint long')
+    records = records.withColumn('fingerprint', crc32(records.document))
+    return records.alias('records_trans').join(input_records.alias('input_records'),
+                                               input_records.combine_id == records.combine_id,
+                                               'left').select(
+        *['records_trans.%s' % c for c in records.columns],
+        pyspark_sql_functions.when(records.fingerprint != input_records.fingerprint,
+                                   pyspark_sql_functions.lit(True)).otherwise(
+            pyspark_sql_functions.lit(False)).alias('transformed'))
+
+
+def transformed_projection(spark, input_records):
+    records = spark.createDataFrame(input_records.rdd.mapPartitions(transform_partition),
+                                    schema='combine_id string, document string, input_fingerprint long')
+    records = records.withColumn('fingerprint', crc32(records.document))
+    return records.withColumn(
+        'transformed',
+        pyspark_sql_functions.when(records.fingerprint != records.input_fingerprint,
+                                   pyspark_sql_functions.lit(True)).otherwise(
+            pyspark_sql_functions.lit(False))).drop('input_fingerprint')
+
+
+def count_exchanges(df):
+    return df._jdf.queryExecution().executedPlan().toString().count('Exchange')
+
+
+def run(record_count=1000000):
+    spark = SparkSession.builder.master('local[*]').appName('bench_transform_fingerprint').getOrCreate()
+    input_records = get_input_records(spark, record_count)
+    input_records.count()
+    for label, transformed in [('join', transformed_join), ('projection', transformed_projection)]:
+        records = transformed(spark, input_records)
+        stime = time.time()
+        count = records.filter(records.transformed).count()
+        elapsed = time.time() - stime
+        print('%s: %s Exchange stages, %s of %s records transformed in %.2fs' % (
+            label, count_exchanges(records), count, record_count, elapsed))
+    spark.stop()
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,84 @@
+'''
+Benchmark XSLT engines, in-process lxml vs. pyjxslt gateway, on tests/data/mods_transform.xsl
+
+    - transforms synthetic MODS records, reporting records/sec per engine
+    - "lxml": stylesheet compiled once with core.spark.utils.compile_xslt(), as on Spark executors
+    - "gateway": stylesheet registered once with the pyjxslt gateway on port 6767, skipped if unavailable
+    - mods_transform.xsl declares XSLT 2.0, such that `auto` selects the gateway; synthetic records avoid
+    the XPath 2.0 replace() branches so lxml runs the same templates, errors are reported per engine
+
+Usage:
+    python -m tests.benchmarks.bench_xslt_engines [record_count]
+'''
+
+import os
+import sys
+import time
+
+import django
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'combine.settings'
+sys.path.append('/opt/combine')
+django.setup()
+
+from lxml import etree
+import pyjxslt
+
+from core.spark.utils import compile_xslt
+
+SYNTHETIC_DOCUMENT = '''<?xml version="1.0" encoding="UTF-8"?>
+<mods:mods xmlns:mods="http://www.loc.gov/mods/v3" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <mods:titleInfo><mods:title>  Synthetic record %(i)s  </mods:title></mods:titleInfo>
+  <mods:name><mods:namePart>Mellink, Machteld J. (Machteld Johanna)</mods:namePart></mods:name>
+  <mods:originInfo><mods:dateCreated>1953</mods:dateCreated></mods:originInfo>
+  <mods:subject><mods:topic>Archaeology</mods:topic><mods:geographic>Turkey</mods:geographic></mods:subject>
+  <mods:abstract>Abstract for synthetic record %(i)s</mods:abstract>
+  <mods:location><mods:url access="object in context">http://example.org/%(i)s</mods:url></mods:location>
+  <mods:accessCondition>http://creativecommons.org/licenses/by-nc/3.0/us/</mods:accessCondition>
+</mods:mods>
+'''
+
+
+def transform_lxml(xslt_string, documents):
+    xslt = compile_xslt(xslt_string)
+    errors = 0
+    for document in documents:
+        try:
+            str(xslt(etree.fromstring(document.encode('utf-8'))))
+        except Exception:
+            errors += 1
+    return errors
+
+
+def transform_gateway(xslt_string, documents):
+    gw = pyjxslt.Gateway(6767)
+    gw.add_transform('bench_xslt_engines', xslt_string)
+    errors = 0
+    for document in documents:
+        try:
+            result = gw.transform('bench_xslt_engines', document)
+            etree.fromstring(result.encode('utf-8'))
+        except Exception:
+            errors += 1
+    gw.drop_transform('bench_xslt_engines')
+    return errors
+
+
+def run(record_count=10000):
+    with open('tests/data/mods_transform.xsl', 'r') as f:
+        xslt_string = f.read()
+    documents = [SYNTHETIC_DOCUMENT % {'i': i} for i in range(record_count)]
+    for label, transform in [('lxml', transform_lxml), ('gateway', transform_gateway)]:
+        stime = time.time()
+        try:
+            errors = transform(xslt_string, documents)
+        except Exception as err:
+            print('%s: skipped, %s' % (label, err))
+            continue
+        elapsed = time.time() - stime
+        print('%s: %s records in %.2fs, %.1f records/sec, %s errors' % (
+            label, record_count, elapsed, record_count / elapsed, errors))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:]])
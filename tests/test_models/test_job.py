@@ -1,6 +1,7 @@
 from django.test import TestCase
 
-from tests.utils import TestConfiguration
+from core.models import PublishedRecord, PublishedRecords, Record
+from tests.utils import TestConfiguration, TEST_DOCUMENT
 
 
 class JobModelTestCase(TestCase):
@@ -33,3 +34,26 @@ class JobModelTestCase(TestCase):
         names.add(upstream_jobs.pop().name)
         names.add(upstream_jobs.pop().name)
         self.assertSetEqual(names, {'Test Job', 'Test Transform Job'})
+
+    def test_get_records_fields(self):
+        record = self.config.job.get_records(fields=('record_id',)).first()
+        self.assertEqual(record.record_id, self.config.record.record_id)
+        self.assertIsNone(record.document)
+
+    def test_get_records_raw(self):
+        records = list(self.config.job.get_records_raw(fields=('id', 'record_id')))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['_id'], self.config.record.id)
+        self.assertEqual(records[0]['record_id'], self.config.record.record_id)
+        self.assertNotIn('document', records[0])
+
+    def test_sync_published_records(self):
+        self.assertFalse(self.config.job.sync_published_records())
+        self.config.job.publish(publish_set_id='syncset')
+        generation = PublishedRecords.get_generation()
+
+        # records rewritten by re-run or incremental harvest
+        Record.objects.create(job_id=self.config.job.id, record_id='syncrecord', document=TEST_DOCUMENT)
+        self.assertTrue(self.config.job.sync_published_records())
+        self.assertEqual(PublishedRecords.get_generation(), generation + 1)
+        self.assertEqual(PublishedRecord.objects(publish_set_id='syncset', deleted=False).count(), 2)
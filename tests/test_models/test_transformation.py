@@ -0,0 +1,74 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from lxml import etree
+
+from core.models import Transformation
+from core.spark.utils import XSLIncludeCache, compile_xslt
+
+INCLUDE_URL = 'http://example.org/xsl/include.xsl'
+
+INCLUDE_XSL = b'''<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0">
+    <xsl:include href="nested.xsl"/>
+    <xsl:template name="foo"><bar><xsl:call-template name="nested"/></bar></xsl:template>
+</xsl:stylesheet>'''
+
+NESTED_XSL = b'''<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0">
+    <xsl:template name="nested"><xsl:value-of select="//foo"/></xsl:template>
+</xsl:stylesheet>'''
+
+PAYLOAD = '''<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0">
+    <xsl:include href="%s"/>
+    <xsl:template match="/"><xsl:call-template name="foo"/></xsl:template>
+</xsl:stylesheet>''' % INCLUDE_URL
+
+
+def fake_get(url):
+    response = mock.Mock()
+    response.content = {
+        INCLUDE_URL: INCLUDE_XSL,
+        'http://example.org/xsl/nested.xsl': NESTED_XSL
+    }[url]
+    return response
+
+
+class TransformationModelTestCase(TestCase):
+
+    def setUp(self):
+        self.binary_storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.binary_storage)
+
+    def test_http_includes_cached_on_save(self):
+        with override_settings(BINARY_STORAGE='file://%s' % self.binary_storage):
+            with mock.patch('core.models.configurations.requests.get', side_effect=fake_get) as get:
+                transformation = Transformation.objects.create(
+                    name='Test Includes', payload=PAYLOAD, transformation_type='xslt')
+            self.assertEqual(get.call_count, 2)
+
+            include_cache = XSLIncludeCache()
+            self.assertEqual(sorted(include_cache.get_index().keys()),
+                             ['http://example.org/xsl/include.xsl', 'http://example.org/xsl/nested.xsl'])
+            self.assertIn(include_cache.lookup(INCLUDE_URL), transformation.payload)
+            self.assertNotIn(INCLUDE_URL, transformation.payload)
+
+            # compiles from cache, for rewritten and original payloads, without network
+            with mock.patch('core.models.configurations.requests.get', side_effect=IOError) as get:
+                for payload in [transformation.payload, PAYLOAD]:
+                    result = compile_xslt(payload)(etree.fromstring('<root><foo>baz</foo></root>'))
+                    self.assertEqual(etree.tostring(result.getroot()), b'<bar>baz</bar>')
+
+                # re-saving falls back to cached includes when downloads fail
+                transformation.payload = PAYLOAD
+                transformation.save()
+                self.assertIn(include_cache.lookup(INCLUDE_URL), transformation.payload)
+
+    def test_xslt_engine_defaults_to_gateway(self):
+        transformation = Transformation.objects.create(
+            name='Test Engine', payload=NESTED_XSL.decode('utf-8'), transformation_type='xslt')
+        self.assertEqual(transformation.xslt_engine, 'gateway')
+        self.assertEqual(transformation.get_xslt_engine(), 'gateway')
+
+        transformation.xslt_engine = 'auto'
+        self.assertEqual(transformation.get_xslt_engine(), 'lxml')
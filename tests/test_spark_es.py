@@ -0,0 +1,64 @@
+import json
+import types
+
+from django.test import SimpleTestCase
+from elasticsearch.exceptions import TransportError
+from elasticsearch.serializer import JSONSerializer
+
+from core.spark.es import ESIndex
+
+
+class FakeES():
+    '''
+    Client answering bulk requests, rejecting whole requests or first documents with 429 as listed
+    '''
+
+    def __init__(self, rejections=None):
+        self.transport = types.SimpleNamespace(serializer=JSONSerializer())
+        self.rejections = list(rejections or [])
+        self.indexed = {}
+
+    def bulk(self, body, **kwargs):
+        rejection = self.rejections.pop(0) if self.rejections else None
+        if rejection == 'request':
+            raise TransportError(429, 'rejected_execution_exception')
+        lines = body.strip().split('\n')
+        items = []
+        for i, (action, source) in enumerate(zip(lines[0::2], lines[1::2])):
+            _id = json.loads(action)['index']['_id']
+            if rejection == 'doc' and i == 0:
+                items.append({'index': {'_id': _id, 'status': 429, 'error': 'es_rejected_execution_exception'}})
+            else:
+                self.indexed[_id] = json.loads(source)
+                items.append({'index': {'_id': _id, 'status': 201}})
+        return {'errors': rejection == 'doc', 'items': items}
+
+
+def mapped_rows(count):
+    return [('success', {'temp_id': str(i), '__class__': 'foo', 'record_id': 'record_%s' % i}) for i in range(count)]
+
+
+class BulkIndexPartitionTestCase(SimpleTestCase):
+
+    def test_retries_rejections(self):
+        es_handle = FakeES(rejections=['request', 'doc'])
+        metrics = ESIndex.bulk_index_partition(es_handle, mapped_rows(5), 'j1', thread_count=1, chunk_size=10,
+                                               initial_backoff=0)
+        self.assertEqual((metrics['docs'], metrics['retries'], metrics['failed']), (5, 6, 0))
+        self.assertEqual(sorted(es_handle.indexed.keys()), ['0', '1', '2', '3', '4'])
+        self.assertEqual(es_handle.indexed['0'], {'record_id': 'record_0'})
+
+    def test_fails_after_max_retries(self):
+        es_handle = FakeES(rejections=['doc', 'doc', 'doc'])
+        metrics = ESIndex.bulk_index_partition(es_handle, mapped_rows(2), 'j1', thread_count=1, chunk_size=10,
+                                               max_retries=1, initial_backoff=0)
+        self.assertEqual((metrics['docs'], metrics['retries'], metrics['failed']), (1, 1, 1))
+        self.assertEqual(metrics['errors'][0]['status'], 429)
+        self.assertEqual(list(es_handle.indexed.keys()), ['1'])
+
+    def test_batches_by_chunk_size(self):
+        es_handle = FakeES()
+        metrics = ESIndex.bulk_index_partition(es_handle, mapped_rows(25), 'j1', thread_count=2, chunk_size=5)
+        self.assertEqual(metrics['docs'], 25)
+        self.assertEqual(len(es_handle.indexed), 25)
+        self.assertGreater(metrics['bytes'], 0)
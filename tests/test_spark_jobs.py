@@ -0,0 +1,63 @@
+import time
+import unittest
+from unittest import mock
+
+from bson import ObjectId
+from django.test import SimpleTestCase
+
+try:
+    from pyspark.sql import SparkSession
+    from core.spark.jobs import CombineRecordSchema, MergeSpark
+    from core.spark.schemas import combine_record_schema
+except ImportError:
+    SparkSession = None
+
+
+def input_record(combine_id, record_id, document, job_id):
+    return (combine_id, record_id, document, '', True, job_id, '', True, 1, False, True, False)
+
+
+@unittest.skipIf(SparkSession is None, 'pyspark not installed')
+class MergeMintDBIdsTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.spark = SparkSession.builder.master('local[1]').appName('test_spark_jobs').getOrCreate()
+        self.addCleanup(self.spark.stop)
+
+    def merge(self, input_records):
+        '''
+        Run MergeSpark over input records, returning records as saved, with minted ids
+        '''
+        merge = MergeSpark.__new__(MergeSpark)
+        merge.spark = self.spark
+        merge.job = mock.Mock(id=3, job_type='MergeJob')
+        saved = {}
+        input_df = self.spark.createDataFrame(input_records, schema=combine_record_schema)
+        with mock.patch.object(MergeSpark, 'init_job'), \
+                mock.patch.object(MergeSpark, 'close_job'), \
+                mock.patch.object(MergeSpark, 'update_jobGroup'), \
+                mock.patch.object(MergeSpark, 'get_input_records', return_value=input_df), \
+                mock.patch.object(MergeSpark, 'save_records',
+                                  side_effect=lambda records_df, **kwargs: saved.update(records_df=records_df)):
+            merge.spark_function()
+        return merge.mint_db_ids(saved['records_df'].select(CombineRecordSchema().field_names))
+
+    def test_overlapping_inputs(self):
+
+        # two input Jobs from the same harvest, sharing combine_ids, and records without combine_id
+        harvest = [
+            ('c1', 'r1', '<doc>1</doc>'),
+            ('c2', 'r2', '<doc>2</doc>'),
+            (None, 'r3', '<doc>3</doc>'),
+            (None, 'r4', '<doc>4</doc>')
+        ]
+        input_records = [input_record(*record, job_id=job_id) for job_id in [1, 2] for record in harvest]
+        minted_df = self.merge(input_records)
+
+        oids = [row._id.oid for row in minted_df.collect()]
+        self.assertEqual(len(set(oids)), len(input_records))
+        for oid in oids:
+            self.assertLess(abs(ObjectId(oid).generation_time.timestamp() - time.time()), 60)
+
+        # recomputing mints the same ids
+        self.assertEqual(sorted(oids), sorted(row._id.oid for row in minted_df.collect()))
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core.spark.utils import CompiledArtifactCache
+
+try:
+    from core.spark.record_validation import RecordValidationEngine
+except ImportError:
+    RecordValidationEngine = None
+
+SCHEMATRON = '''<schema xmlns="http://purl.oclc.org/dsdl/schematron">
+    <pattern><rule context="/root"><assert test="foo">foo required</assert></rule></pattern>
+</schema>'''
+
+
+class FakeAccumulator():
+
+    def add(self, value):
+        pass
+
+
+@unittest.skipIf(RecordValidationEngine is None, 'pyspark not installed')
+class ValidatePartitionTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.schematron_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.schematron_dir)
+        self.scenario = {
+            'id': 1,
+            'name': 'Test Schematron',
+            'validation_type': 'sch',
+            'filepath': os.path.join(self.schematron_dir, 'test.sch'),
+            'payload': SCHEMATRON,
+            'payload_hash': CompiledArtifactCache.content_hash(SCHEMATRON)
+        }
+        self.engine = RecordValidationEngine.__new__(RecordValidationEngine)
+        self.engine.scenarios_bc = types.SimpleNamespace(value=[self.scenario])
+        self.engine.scenarios = [{'id': 1, 'name': 'Test Schematron'}]
+        self.engine.seconds_accs = {1: FakeAccumulator()}
+        self.engine.failures_accs = {1: FakeAccumulator()}
+
+    def validate(self):
+        row = types.SimpleNamespace(_id='1', record_id='record_1', document='<root><foo/></root>', job_id=1)
+        return list(self.engine.validate_partition([row]))
+
+    def test_compile_errors_not_cached(self):
+        cache = CompiledArtifactCache()
+        with mock.patch('core.spark.record_validation.compiled_artifacts', cache):
+
+            # schematron not yet written to executor, reported as failure of record
+            failures = self.validate()
+            self.assertEqual(len(failures), 1)
+            self.assertIn('Invalid validator', failures[0][4])
+
+            # compiled once available
+            with open(self.scenario['filepath'], 'w') as f:
+                f.write(SCHEMATRON)
+            self.assertEqual(self.validate(), [])
+            self.assertEqual(self.validate(), [])
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
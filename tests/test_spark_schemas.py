@@ -0,0 +1,73 @@
+import ast
+import glob
+import os
+import unittest
+
+from django.test import SimpleTestCase
+
+try:
+    from pyspark.sql import SparkSession
+    from pyspark.sql.types import BooleanType, StructType
+    from core.spark import schemas
+except ImportError:
+    SparkSession = None
+
+
+SPARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'core', 'spark')
+
+
+def sample_row(schema):
+    '''
+    Return tuple of placeholder values for schema
+    '''
+    row = []
+    for field in schema.fields:
+        if isinstance(field.dataType, StructType):
+            row.append(sample_row(field.dataType))
+        elif isinstance(field.dataType, BooleanType):
+            row.append(True)
+        elif field.dataType.typeName() in ['integer', 'long']:
+            row.append(1)
+        else:
+            row.append('foo')
+    return tuple(row)
+
+
+class ExplicitSchemaTestCase(SimpleTestCase):
+
+    def test_no_schema_inference_in_core_spark(self):
+        inferring = []
+        filepaths = glob.glob(os.path.join(SPARK_DIR, '*.py'))
+        self.assertGreater(len(filepaths), 0)
+        for filepath in filepaths:
+            with open(filepath, 'r') as f:
+                tree = ast.parse(f.read())
+            for node in ast.walk(tree):
+                if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Attribute):
+                    continue
+                keywords = [keyword.arg for keyword in node.keywords]
+                if node.func.attr == 'toDF' and 'schema' not in keywords and len(node.args) == 0:
+                    inferring.append('%s:%s' % (filepath, node.lineno))
+                if node.func.attr == 'createDataFrame' and 'schema' not in keywords and len(node.args) < 2:
+                    inferring.append('%s:%s' % (filepath, node.lineno))
+        self.assertEqual(inferring, [])
+
+    @unittest.skipIf(SparkSession is None, 'pyspark not installed')
+    def test_no_inference_jobs(self):
+        spark = SparkSession.builder.master('local[1]').appName('test_spark_schemas').getOrCreate()
+        self.addCleanup(spark.stop)
+        tracker = spark.sparkContext.statusTracker()
+
+        registry = [getattr(schemas, name) for name in dir(schemas) if name.endswith('_schema')]
+        self.assertGreater(len(registry), 0)
+        for schema in registry:
+            rdd = spark.sparkContext.parallelize([sample_row(schema)])
+            jobs = len(tracker.getJobIdsForGroup())
+            df = spark.createDataFrame(rdd, schema=schema)
+            self.assertEqual(len(tracker.getJobIdsForGroup()), jobs)
+            self.assertEqual(df.schema, schema)
+
+        # inference, for comparison, runs a job
+        jobs = len(tracker.getJobIdsForGroup())
+        spark.sparkContext.parallelize([('foo', 1)]).toDF()
+        self.assertGreater(len(tracker.getJobIdsForGroup()), jobs)
@@ -0,0 +1,37 @@
+import ast
+import os
+
+from django.test import SimpleTestCase
+
+
+JOBS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'core', 'spark', 'jobs.py')
+
+
+def constant_udfs(filepath):
+    '''
+    Return line numbers of udf(lambda ...) calls in file whose lambda body ignores its arguments
+    '''
+    with open(filepath, 'r') as f:
+        tree = ast.parse(f.read())
+    linenos = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or getattr(node.func, 'id', None) != 'udf':
+            continue
+        if len(node.args) == 0 or not isinstance(node.args[0], ast.Lambda):
+            continue
+        func = node.args[0]
+        arg_names = {arg.arg for arg in func.args.args}
+        used_names = {name.id for name in ast.walk(func.body) if isinstance(name, ast.Name)}
+        if not arg_names & used_names:
+            linenos.append(node.lineno)
+    return linenos
+
+
+class ConstantUDFTestCase(SimpleTestCase):
+    '''
+    Constant valued columns should use native expressions, e.g. lit() or expr('uuid()'),
+    rather than passing every row through a python worker
+    '''
+
+    def test_no_constant_udfs_in_jobs(self):
+        self.assertEqual(constant_udfs(JOBS_PATH), [])
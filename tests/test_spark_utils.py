@@ -0,0 +1,294 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import os
+import shutil
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from django.test import SimpleTestCase
+from lxml import etree
+
+from core.spark.utils import CompiledArtifactCache, load_python_module, compile_xslt, \
+    select_xslt_engine, XSLTGatewayPool, LatencyHistogram, LatencyHistogramParam, harvest_oai_deltas, \
+    canonical_document, xsl_include_hashes
+
+INCLUDE_XSL = '''<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0">
+    <xsl:template name="foo"><bar><xsl:value-of select="//foo"/></bar></xsl:template>
+</xsl:stylesheet>'''
+
+INCLUDING_XSL = '''<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="%s">
+    <xsl:include href="%s"/>
+    <xsl:template match="/"><xsl:call-template name="foo"/></xsl:template>
+</xsl:stylesheet>'''
+
+
+class CompiledArtifactCacheTestCase(SimpleTestCase):
+
+    def test_compiles_once_per_content_hash(self):
+        cache = CompiledArtifactCache(maxsize=2)
+        compiled = []
+        payload = 'def python_record_transformation(record):\n    return [record, "", True]\n'
+        payload_hash = cache.content_hash(payload)
+        for _ in range(3):
+            module = cache.get('python', payload_hash,
+                               lambda: compiled.append(payload) or load_python_module('temp_pyts', payload))
+        self.assertEqual(len(compiled), 1)
+        self.assertEqual(module.python_record_transformation('foo'), ['foo', '', True])
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_evicts_least_recently_used(self):
+        cache = CompiledArtifactCache(maxsize=2)
+        evicted = []
+        for content in ['a', 'b', 'a', 'c']:
+            cache.get('xsd', cache.content_hash(content), lambda: content, evict_func=evicted.append)
+        self.assertEqual(evicted, ['b'])
+        cache.clear()
+        self.assertEqual(sorted(evicted), ['a', 'b', 'c'])
+
+
+class XSLTEngineTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.include_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.include_dir)
+        self.include_path = os.path.join(self.include_dir, 'include.xsl')
+        with open(self.include_path, 'w') as f:
+            f.write(INCLUDE_XSL)
+
+    def test_compile_xslt_resolves_includes(self):
+        for href in ['include.xsl', self.include_path]:
+            xslt = compile_xslt(INCLUDING_XSL % ('1.0', href), include_dirs=[self.include_dir])
+            result = xslt(etree.fromstring('<root><foo>baz</foo></root>'))
+            self.assertEqual(etree.tostring(result.getroot()), b'<bar>baz</bar>')
+
+    def test_select_xslt_engine(self):
+        with open('tests/data/mods_transform.xsl', 'r') as f:
+            mods_xsl = f.read()
+        self.assertEqual(select_xslt_engine(mods_xsl), 'gateway')
+        self.assertEqual(select_xslt_engine(mods_xsl, 'lxml'), 'lxml')
+        including_xsl = INCLUDING_XSL % ('1.0', self.include_path)
+        self.assertEqual(select_xslt_engine(including_xsl), 'lxml')
+        self.assertEqual(select_xslt_engine(including_xsl, 'gateway'), 'gateway')
+        self.assertEqual(select_xslt_engine(INCLUDING_XSL % ('1.0', '/missing/include.xsl')), 'gateway')
+
+    def test_xsl_include_hashes(self):
+        including_xsl = INCLUDING_XSL % ('1.0', 'include.xsl')
+        include_hashes = xsl_include_hashes(including_xsl, include_dirs=[self.include_dir])
+        self.assertEqual(include_hashes, [['include.xsl', CompiledArtifactCache.content_hash(INCLUDE_XSL)]])
+
+        # changes with included stylesheet, not only the including payload
+        with open(self.include_path, 'w') as f:
+            f.write(INCLUDE_XSL.replace('//foo', '//baz'))
+        self.assertNotEqual(xsl_include_hashes(including_xsl, include_dirs=[self.include_dir]), include_hashes)
+        self.assertEqual(xsl_include_hashes(INCLUDING_XSL % ('1.0', '/missing/include.xsl')),
+                         [['/missing/include.xsl', None]])
+
+
+class ConcurrencyCounter():
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+
+class FakeGateway():
+    '''
+    Stand-in for pyjxslt.Gateway that echoes input documents, recording peak concurrency in counter
+    shared by gateways of a pool
+    '''
+
+    def __init__(self, counter=None):
+        self.transforms = {}
+        self.counter = counter or ConcurrencyCounter()
+
+    def add_transform(self, key, xslt):
+        self.transforms[key] = xslt
+
+    def drop_transform(self, key):
+        self.transforms.pop(key)
+
+    def transform(self, key, xml):
+        if key not in self.transforms:
+            return None
+        with self.counter.lock:
+            self.counter.active += 1
+            self.counter.peak = max(self.counter.peak, self.counter.active)
+        time.sleep(0.01)
+        with self.counter.lock:
+            self.counter.active -= 1
+        if xml == 'fail':
+            raise Exception('transform failed')
+        if xml == 'unparsable':
+            return 'ERROR: org.xml.sax.SAXParseException: Content is not allowed in prolog.'
+        return xml
+
+
+class XSLTGatewayPoolTestCase(SimpleTestCase):
+
+    def test_transform_many(self):
+        gateways = []
+        counter = ConcurrencyCounter()
+        pool = XSLTGatewayPool('xslt_test', '<xsl/>', size=3,
+                               gateway_factory=lambda: gateways.append(FakeGateway(counter)) or gateways[-1])
+        self.assertEqual(len(gateways), 3)
+        self.assertTrue(all('xslt_test' in gw.transforms for gw in gateways))
+
+        documents = ['<doc%s/>' % i for i in range(20)] + ['fail', 'unparsable']
+        histogram = LatencyHistogram()
+        results = pool.transform_many(documents, histogram=histogram)
+        self.assertEqual([result for result, err in results[:-2]], documents[:-2])
+        self.assertEqual(str(results[-2][1]), 'transform failed')
+        self.assertIsNone(results[-1][0])
+        self.assertTrue(str(results[-1][1]).startswith('ERROR: '))
+        self.assertEqual(counter.peak, 3)
+
+        latency = histogram.percentiles()
+        self.assertEqual(latency['count'], 22)
+        self.assertGreaterEqual(latency['p50'], 10)
+        self.assertLessEqual(latency['p50'], latency['p99'])
+
+        pool.close()
+        self.assertNotIn('xslt_test', gateways[0].transforms)
+
+    def test_registers_unknown_stylesheet_again(self):
+        gateway = FakeGateway()
+        pool = XSLTGatewayPool('xslt_test', '<xsl/>', size=1, gateway_factory=lambda: gateway)
+
+        # stylesheet unknown to gateway, e.g. restarted
+        gateway.transforms.clear()
+        self.assertEqual(pool.transform_many(['<doc/>']), [('<doc/>', None)])
+        self.assertIn('xslt_test', gateway.transforms)
+        pool.close()
+
+    def test_latency_histogram_merge(self):
+        param = LatencyHistogramParam()
+        histogram = param.zero(None)
+        for seconds in [0.001, 0.002, 0.003]:
+            partition_histogram = LatencyHistogram()
+            partition_histogram.add(seconds)
+            histogram = param.addInPlace(histogram, partition_histogram)
+        self.assertEqual(histogram.percentiles(), {'count': 3, 'p50': 2.0, 'p90': 3.0, 'p99': 3.0, 'max': 3.0})
+
+
+# identifier, datestamp, sets, deleted
+STUB_OAI_RECORDS = [
+    ('oai:stub:1', '2020-01-01', ['a'], False),
+    ('oai:stub:2', '2020-02-01', ['a'], False),
+    ('oai:stub:3', '2020-02-02', ['a'], True),
+    ('oai:stub:4', '2020-02-03', ['b'], False),
+    ('oai:stub:5', '2020-02-04', [], False)
+]
+
+STUB_OAI_METADATA = '<oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/">%s</oai_dc:dc>'
+
+STUB_OAI_RESPONSE = '''<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <responseDate>2020-03-01T00:00:00Z</responseDate>
+  <request>http://localhost/oai</request>
+  %s
+</OAI-PMH>'''
+
+
+class StubOAIHandler(BaseHTTPRequestHandler):
+    '''
+    OAI-PMH endpoint serving STUB_OAI_RECORDS, with day granularity and two records per page
+    '''
+
+    requests = []
+    list_args = {}
+
+    def do_GET(self):
+        args = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        StubOAIHandler.requests.append(args)
+        if args['verb'] == 'Identify':
+            body = '''<Identify><repositoryName>stub</repositoryName><baseURL>http://localhost/oai</baseURL>
+                <protocolVersion>2.0</protocolVersion><adminEmail>stub@example.org</adminEmail>
+                <earliestDatestamp>2020-01-01</earliestDatestamp><deletedRecord>persistent</deletedRecord>
+                <granularity>YYYY-MM-DD</granularity></Identify>'''
+        else:
+            offset = int(args.get('resumptionToken', 0))
+            if 'resumptionToken' in args:
+                args = StubOAIHandler.list_args
+            StubOAIHandler.list_args = args
+            records = [record for record in STUB_OAI_RECORDS
+                       if record[1] >= args.get('from', '') and ('set' not in args or args['set'] in record[2])]
+            if len(records) == 0:
+                body = '<error code="noRecordsMatch">no records</error>'
+            else:
+                page = []
+                for identifier, datestamp, sets, deleted in records[offset:offset + 2]:
+                    header = '<header%s><identifier>%s</identifier><datestamp>%s</datestamp>%s</header>' % (
+                        ' status="deleted"' if deleted else '', identifier, datestamp,
+                        ''.join('<setSpec>%s</setSpec>' % set_spec for set_spec in sets))
+                    metadata = '' if deleted else '<metadata>%s</metadata>' % (STUB_OAI_METADATA % identifier)
+                    page.append('<record>%s%s</record>' % (header, metadata))
+                token = str(offset + 2) if offset + 2 < len(records) else ''
+                body = '<ListRecords>%s<resumptionToken>%s</resumptionToken></ListRecords>' % (''.join(page), token)
+        response = (STUB_OAI_RESPONSE % body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class HarvestOAIDeltasTestCase(SimpleTestCase):
+
+    def setUp(self):
+        StubOAIHandler.requests = []
+        server = HTTPServer(('127.0.0.1', 0), StubOAIHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.oai_params = {
+            'endpoint': 'http://127.0.0.1:%s/oai' % server.server_port,
+            'metadataPrefix': 'oai_dc',
+            'scope_type': 'harvestAllRecords',
+            'scope_value': 'true',
+            'include_oai_record_header': False
+        }
+
+    def test_harvests_changed_and_deleted_since(self):
+        deltas = list(harvest_oai_deltas(self.oai_params, '2020-01-15T12:00:00Z'))
+        self.assertEqual(deltas, [
+            ('oai:stub:2', STUB_OAI_METADATA % 'oai:stub:2', 'a', False),
+            ('oai:stub:3', None, 'a', True),
+            ('oai:stub:4', STUB_OAI_METADATA % 'oai:stub:4', 'b', False),
+            ('oai:stub:5', STUB_OAI_METADATA % 'oai:stub:5', '', False)
+        ])
+
+        # truncated to endpoint granularity, and paged with resumptionToken
+        self.assertEqual(StubOAIHandler.requests[1]['from'], '2020-01-15')
+        self.assertEqual(len(StubOAIHandler.requests), 3)
+
+    def test_scopes(self):
+        self.oai_params.update({'scope_type': 'setList', 'scope_value': 'b'})
+        self.assertEqual([delta[0] for delta in harvest_oai_deltas(self.oai_params, '2020-01-15')], ['oai:stub:4'])
+
+        self.oai_params.update({'scope_type': 'blackList', 'scope_value': 'a'})
+        self.assertEqual([delta[0] for delta in harvest_oai_deltas(self.oai_params, '2020-01-15')],
+                         ['oai:stub:4', 'oai:stub:5'])
+
+    def test_include_header_and_no_records(self):
+        self.oai_params['include_oai_record_header'] = True
+        deltas = list(harvest_oai_deltas(self.oai_params, '2020-02-04'))
+        self.assertEqual(len(deltas), 1)
+        self.assertTrue(deltas[0][1].startswith('<record'))
+        self.assertIn('<identifier>oai:stub:5</identifier>', deltas[0][1])
+
+        self.assertEqual(list(harvest_oai_deltas(self.oai_params, '2021-01-01')), [])
+
+    def test_canonical_document_matches_full_harvest(self):
+        delta_document = list(harvest_oai_deltas(self.oai_params, '2020-02-04'))[0][1]
+
+        # as serialized by Ingestion3, with namespaces in scope of OAI-PMH response and explicit end tag
+        full_harvest_document = ('<oai_dc:dc xmlns="http://www.openarchives.org/OAI/2.0/" '
+                                 'xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/">oai:stub:5</oai_dc:dc>')
+        self.assertEqual(canonical_document(delta_document), canonical_document(full_harvest_document))
+        self.assertNotEqual(canonical_document(delta_document), canonical_document(STUB_OAI_METADATA % 'changed'))
+        self.assertEqual(canonical_document('not xml'), b'not xml')
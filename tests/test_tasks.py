@@ -0,0 +1,47 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from core import tasks
+from core.models import CombineBackgroundTask
+from tests.utils import TestConfiguration
+
+
+class WriteTabularDataLocalTestCase(TestCase):
+    def setUp(self):
+        self.config = TestConfiguration()
+        self.output_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_path)
+
+    def write_tabular_data(self, export_type):
+        ct = CombineBackgroundTask.objects.create(task_params_json=json.dumps({
+            'fm_export_config_json': json.dumps({'add_literals': {'foo': 'bar'}}),
+            'records_per_file': 500,
+            'tabular_data_export_type': export_type,
+            'output_path': self.output_path,
+            'job_dict': {'j%s' % self.config.job.id: [self.config.job.id]}
+        }))
+        tasks._write_tabular_data_local(ct)
+        return os.path.join(self.output_path, 'j%s' % self.config.job.id, 'part-00000.%s' % export_type)
+
+    def test_write_json(self):
+        with open(self.write_tabular_data('json')) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['root_foo'], 'test document')
+        self.assertEqual(rows[0]['foo'], 'bar')
+        self.assertEqual(rows[0]['record_id'], 'testrecord')
+
+    def test_write_csv(self):
+        part_path = self.write_tabular_data('csv')
+        self.assertFalse(os.path.exists(part_path.replace('.csv', '.json')))
+        with open(part_path) as f:
+            reader = csv.DictReader(f)
+            self.assertEqual(reader.fieldnames, ['combine_id', 'foo', 'record_id', 'root_foo'])
+            self.assertEqual(next(reader)['root_foo'], 'test document')
@@ -154,4 +154,14 @@ class FieldMapperTestCase(TestCase):
             'db_id': self.config.record.id,
             'fm_config_json': field_mapper.config_json
         })
-        self.assertEqual(response.json(), {'root_foo': 'test document', 'foo': 'bar'})
\ No newline at end of file
+        self.assertEqual(response.json(), {'root_foo': 'test document', 'foo': 'bar'})
+
+    def test_post_test_field_mapper_sample(self):
+        response = self.client.post(reverse('test_field_mapper'), {
+            'db_id': self.config.record.id,
+            'fm_config_json': json_string({"add_literals": {"foo": "bar"}}),
+            'sample_size': 10
+        })
+        self.assertEqual(response.json()['record'], {'root_foo': 'test document', 'foo': 'bar'})
+        self.assertEqual(response.json()['sample']['records'], 1)
+        self.assertEqual(response.json()['sample']['fields'], {'root_foo': 1, 'foo': 1})
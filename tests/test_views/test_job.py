@@ -2,7 +2,7 @@ from django.test import Client, TestCase
 from django.core.urlresolvers import reverse
 
 
-from core.models import Job, RecordGroup
+from core.models import CombineBackgroundTask, Job, RecordGroup
 from tests.utils import TestConfiguration
 
 
@@ -128,6 +128,15 @@ class JobTestCase(TestCase):
         upstream_job = Job.objects.get(id=self.config.job.id)
         self.assertEqual(upstream_job.status, 'initializing')
 
+    def test_rerun_jobs_incremental(self):
+        response = self.client.post('/combine/jobs/rerun_jobs', {
+            'job_ids[]': [self.config.job.id],
+            'incremental_rerun_toggle': 'true'
+        })
+        self.assertEqual(response.json()['results'], True)
+        task = CombineBackgroundTask.objects.filter(task_type='rerun_jobs_prep').last()
+        self.assertEqual(task.task_params['incremental'], True)
+
     def test_clone_jobs(self):
         response = self.client.post('/combine/jobs/clone_jobs', {
             'job_ids[]': [self.config.job.id]
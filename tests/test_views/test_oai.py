@@ -0,0 +1,140 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from lxml import etree
+
+from django.test import Client, TestCase, override_settings
+
+from core.models import Record
+from core.oai import OAIResumptionToken
+from tests.utils import TestConfiguration, TEST_DOCUMENT
+
+OAI_NS = {'oai': 'http://www.openarchives.org/OAI/2.0/'}
+
+
+class OAITestCase(TestCase):
+    def setUp(self):
+        self.config = TestConfiguration()
+        for i in range(0, 4):
+            Record.objects.create(job_id=self.config.job.id,
+                                  record_id='oaitestrecord%s' % i,
+                                  document=TEST_DOCUMENT)
+        self.config.job.publish(publish_set_id='oaitestset')
+        self.client = Client()
+
+    def get_oai(self, **params):
+        response = self.client.get('/combine/oai', params)
+        if response.streaming:
+            return etree.fromstring(b''.join(response.streaming_content))
+        return etree.fromstring(response.content)
+
+    @override_settings(OAI_RESPONSE_SIZE=2)
+    def test_list_identifiers_resumption(self):
+        identifiers = []
+        tokens = []
+        response = self.get_oai(verb='ListIdentifiers', set='oaitestset')
+        while True:
+            identifiers.extend(response.xpath('//oai:identifier/text()', namespaces=OAI_NS))
+            token = response.xpath('//oai:resumptionToken', namespaces=OAI_NS)
+            if len(token) == 0 or not token[0].text:
+                break
+            self.assertEqual(token[0].attrib['completeListSize'], '5')
+            tokens.append(token[0].text)
+            response = self.get_oai(verb='ListIdentifiers', resumptionToken=token[0].text)
+        self.assertEqual(len(tokens), 2)
+        self.assertEqual(len(identifiers), 5)
+        self.assertEqual(len(set(identifiers)), 5)
+        self.assertEqual(token[0].attrib['cursor'], '4')
+
+    def test_bad_resumption_token(self):
+        response = self.get_oai(verb='ListRecords', resumptionToken='not-a-token')
+        error = response.xpath('//oai:error', namespaces=OAI_NS)[0]
+        self.assertEqual(error.attrib['code'], 'badResumptionToken')
+
+    def test_resumption_token_verb_mismatch(self):
+        token = OAIResumptionToken(verb='ListIdentifiers', last_id=str(self.config.record.id),
+                                   cursor=2, complete_list_size=5).encode()
+        response = self.get_oai(verb='ListRecords', resumptionToken=token)
+        error = response.xpath('//oai:error', namespaces=OAI_NS)[0]
+        self.assertEqual(error.attrib['code'], 'badResumptionToken')
+
+    def test_resumption_token_roundtrip(self):
+        token = OAIResumptionToken(verb='ListRecords', publish_set_id='oaitestset',
+                                   last_id=str(self.config.record.id), cursor=500,
+                                   complete_list_size=3000000)
+        decoded = OAIResumptionToken.decode(token.encode())
+        self.assertEqual(decoded.__dict__, token.__dict__)
+
+    @override_settings(OAI_RESPONSE_SIZE=2)
+    def test_stream_response_matches(self):
+        for oai_stream_response in [False, True]:
+            with self.settings(OAI_STREAM_RESPONSE=oai_stream_response):
+                response = self.get_oai(verb='ListRecords', set='oaitestset')
+                records = response.xpath('//oai:record', namespaces=OAI_NS)
+                self.assertEqual(len(records), 2)
+                self.assertEqual(len(response.xpath('//oai:metadata/oai:root/oai:foo', namespaces=OAI_NS)), 2)
+                self.assertEqual(len(response.xpath('//oai:resumptionToken', namespaces=OAI_NS)), 1)
+
+    def test_from_until(self):
+        response = self.get_oai(verb='ListIdentifiers', set='oaitestset', **{'from': '2000-01-01'})
+        self.assertEqual(len(response.xpath('//oai:header', namespaces=OAI_NS)), 5)
+        response = self.get_oai(verb='ListIdentifiers', set='oaitestset', **{'from': '2100-01-01T00:00:00Z'})
+        self.assertEqual(len(response.xpath('//oai:header', namespaces=OAI_NS)), 0)
+        response = self.get_oai(verb='ListIdentifiers', set='oaitestset', until='2000-01-01')
+        self.assertEqual(len(response.xpath('//oai:header', namespaces=OAI_NS)), 0)
+
+    def test_bad_from(self):
+        response = self.get_oai(verb='ListIdentifiers', **{'from': 'yesterday'})
+        error = response.xpath('//oai:error', namespaces=OAI_NS)[0]
+        self.assertEqual(error.attrib['code'], 'badArgument')
+
+    def test_unpublished_records_deleted(self):
+        self.config.job.unpublish()
+        response = self.get_oai(verb='ListRecords', set='oaitestset')
+        headers = response.xpath('//oai:header', namespaces=OAI_NS)
+        self.assertEqual(len(headers), 5)
+        self.assertTrue(all(header.attrib.get('status') == 'deleted' for header in headers))
+        self.assertEqual(len(response.xpath('//oai:metadata', namespaces=OAI_NS)), 0)
+
+    def test_conditional_request(self):
+        response = self.client.get('/combine/oai', {'verb': 'ListSets'})
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get('/combine/oai', {'verb': 'ListSets'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/combine/oai', {'verb': 'Identify'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.config.job.unpublish()
+        response = self.client.get('/combine/oai', {'verb': 'ListSets'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(OAI_RESPONSE_SIZE=2)
+    def test_gzip_response(self):
+        response = self.client.get('/combine/oai', {'verb': 'ListRecords', 'set': 'oaitestset'},
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        if response.streaming:
+            content = b''.join(response.streaming_content)
+        else:
+            content = response.content
+        response = etree.fromstring(gzip.decompress(content))
+        self.assertEqual(len(response.xpath('//oai:record', namespaces=OAI_NS)), 2)
+
+    def test_response_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        with self.settings(OAI_RESPONSE_CACHE=True, OAI_RESPONSE_CACHE_DIR=cache_dir):
+            first = self.get_oai(verb='ListIdentifiers', set='oaitestset')
+            generations = os.listdir(cache_dir)
+            self.assertEqual(len(generations), 1)
+            self.assertEqual(len(os.listdir(os.path.join(cache_dir, generations[0]))), 1)
+            cached = self.get_oai(verb='ListIdentifiers', set='oaitestset')
+            self.assertEqual(cached.xpath('//oai:identifier/text()', namespaces=OAI_NS),
+                             first.xpath('//oai:identifier/text()', namespaces=OAI_NS))
+            self.config.job.unpublish()
+            response = self.get_oai(verb='ListIdentifiers', set='oaitestset')
+            self.assertEqual(len(response.xpath('//oai:header[@status="deleted"]', namespaces=OAI_NS)), 5)
+            self.assertNotEqual(os.listdir(cache_dir), generations)
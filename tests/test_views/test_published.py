@@ -21,3 +21,18 @@ class PublishedTestCase(TestCase):
         published_page = self.client.get('/combine/published')
         self.assertIn('test publish id', str(published_page.content, 'utf-8'))
         self.assertIn(b'Published Records', published_page.content)
+
+    def test_published_snapshot_cache(self):
+        self.config.job.publish(publish_set_id='test publish id')
+        stats = PublishedRecords.get_cache_stats()
+        first = PublishedRecords.get()
+        self.assertIs(PublishedRecords.get(), first)
+        self.assertIn('test publish id', first.sets)
+        self.assertEqual(PublishedRecords.cache_stats['misses'], stats['misses'] + 1)
+        self.assertEqual(PublishedRecords.cache_stats['hits'], stats['hits'] + 1)
+        self.config.job.unpublish()
+        unpublished = PublishedRecords.get()
+        self.assertIsNot(unpublished, first)
+        self.assertNotIn('test publish id', unpublished.sets)
+        response = self.client.get('/combine/published/cache_stats')
+        self.assertEqual(response.json()['misses'], stats['misses'] + 2)
@@ -6,6 +6,8 @@ xml2kvp = importlib.util.module_from_spec(spec)
 spec.loader.exec_module(xml2kvp)
 import json
 import difflib
+import multiprocessing
+import sys
 import pprint
 
 def test_xml():
@@ -188,6 +190,53 @@ def test_xml_to_kvp():
     assert kvp_output == json.loads(test_kvp())
     print('xml to kvp test passed!')
 
+def test_xml_to_kvp_reused_handler():
+    handler = xml2kvp.XML2kvp(**test_xml_config())
+    for record_id in ['foo', 'bar']:
+        kvp_output = xml2kvp.XML2kvp.xml_to_kvp(test_xml(), handler=handler, literals={'record_id': record_id})
+        expected = json.loads(test_kvp())
+        expected['record_id'] = record_id
+        assert kvp_output == expected
+        assert list(kvp_output.keys()) == list(expected.keys())
+    print('xml to kvp reused handler test passed!')
+
+def test_xml_to_kvp_lxml_walker():
+    docs = [test_xml(), xml2kvp.XML2kvp.test_xml]
+    mods = xml2kvp.etree.parse('tests/data/static_harvest_data/mods_250.xml')
+    docs.extend([xml2kvp.etree.tostring(ele).decode('utf-8')
+                 for ele in mods.xpath('//mods:mods', namespaces={'mods': 'http://www.loc.gov/mods/v3'})])
+    configs = [
+        test_xml_config(),
+        {},
+        {'include_all_attributes': True, 'include_sibling_id': True, 'skip_repeating_values': False},
+        {'capture_attribute_values': ['type'], 'include_attributes': ['type'], 'repeating_element_suffix_count': True}
+    ]
+    for config in configs:
+        handler = xml2kvp.XML2kvp(walker='lxml', **config)
+        for doc in docs:
+            kvp_output = json.dumps(xml2kvp.XML2kvp.xml_to_kvp(doc, **config))
+            assert json.dumps(xml2kvp.XML2kvp.xml_to_kvp(doc, handler=handler)) == kvp_output
+            assert json.dumps(xml2kvp.XML2kvp.xml_to_kvp(xml2kvp.etree.fromstring(doc.encode('utf-8')),
+                                                         handler=handler)) == kvp_output
+    print('xml to kvp lxml walker test passed!')
+
+def test_xml_to_kvp_many():
+    # register module loaded from path, such that worker functions pickle by reference
+    sys.modules.setdefault(xml2kvp.__name__, xml2kvp)
+    docs = [test_xml(), xml2kvp.XML2kvp.test_xml] * 25
+    expected = [xml2kvp.XML2kvp.xml_to_kvp(doc, **test_xml_config()) for doc in docs]
+    for workers in [1, 2]:
+        kvp_outputs = xml2kvp.XML2kvp.xml_to_kvp_many(iter(docs), workers=workers, chunk_size=7, **test_xml_config())
+        assert list(kvp_outputs) == expected
+    # daemonic processes map in process
+    process = multiprocessing.current_process()
+    process.daemon = True
+    try:
+        assert list(xml2kvp.XML2kvp.xml_to_kvp_many(iter(docs), workers=2, **test_xml_config())) == expected
+    finally:
+        process.daemon = False
+    print('xml to kvp many test passed!')
+
 def test_kvp_to_xml():
     xml_output = xml2kvp.XML2kvp.kvp_to_xml(json.loads(test_kvp()),
             serialize_xml=True,
@@ -202,6 +251,22 @@ def test_csv_to_xml():
     assert xml_output == test_xml()
     print('csv to xml test passed!')
 
+def test_csv_to_xml_reused_handler():
+    expected = xml2kvp.XML2kvp.kvp_to_xml(json.loads(test_kvp_from_csv()), serialize_xml=True, **test_csv_config())
+    handler = xml2kvp.XML2kvp(**test_csv_config())
+    for i in range(2):
+        xml_output = xml2kvp.XML2kvp.kvp_to_xml(json.loads(test_kvp_from_csv()), serialize_xml=True, handler=handler)
+        assert xml_output == expected
+    kvp = {"dcterms:title": "['foo', 'bar']", "dcterms:subject": "foo, bar", "dcterms:date": "1, 2"}
+    xml_output = xml2kvp.XML2kvp.kvp_to_xml(kvp, serialize_xml=True, handler=handler)
+    assert [ele.text for ele in xml2kvp.etree.fromstring(xml_output.encode('utf-8'))] == [
+        'foo', 'bar', 'foo, bar', '1', '2']
+    print('csv to xml reused handler test passed!')
+
 test_xml_to_kvp()
+test_xml_to_kvp_reused_handler()
+test_xml_to_kvp_lxml_walker()
+test_xml_to_kvp_many()
 test_kvp_to_xml()
 test_csv_to_xml()
+test_csv_to_xml_reused_handler()